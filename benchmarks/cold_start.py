@@ -0,0 +1,110 @@
+"""
+Where a cold start's time goes: interpreter start up, importing lambda_function, the first response and a
+warm response, each in a fresh process. Also the import time of each top level package, from -X importtime.
+
+run from the repo root:  python -m benchmarks.cold_start [runs] [buildString] [manifest]
+
+AWS_LAMBDA_FUNCTION_NAME is set, as on Lambda. with a manifest, WARM_MANIFEST is set so the import
+includes warming the caches from it.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+event = {{"body": {{"buildString": {build_string!r}}}, "isBase64Encoded": False}}
+lambda_function.lambda_handler(event, None)
+first = time.perf_counter()
+lambda_function.lambda_handler(event, None)
+second = time.perf_counter()
+print(json.dumps([imported - start, first - imported, second - first]))
+"""
+
+
+def get_env(manifest: Optional[str]) -> Dict[str, str]:
+    """the environment of a child, which is set up like Lambda's"""
+    env = dict(os.environ, AWS_LAMBDA_FUNCTION_NAME="cold_start")
+    if manifest:
+        env["WARM_MANIFEST"] = os.path.abspath(manifest)
+    return env
+
+
+def run_child(build_string: str, manifest: Optional[str]) -> Dict[str, float]:
+    env = get_env(manifest)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True, env=env)
+    startup = time.perf_counter() - start
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(build_string=build_string)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout
+    imported, first, second = json.loads(output.splitlines()[-1])
+    return {
+        "interpreter": startup,
+        "import": imported,
+        "first response": first,
+        "warm response": second,
+    }
+
+
+def import_times(manifest: Optional[str]) -> Dict[str, float]:
+    """{top level package: self time of all of its modules in seconds}"""
+    env = get_env(manifest)
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stderr
+    answer: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        answer[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return answer
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("runs", type=int, nargs="?", default=10)
+    parser.add_argument("build_string", nargs="?", default="3*Die(6)")
+    parser.add_argument("manifest", nargs="?", default="")
+    args = parser.parse_args(argv)
+    build_string = args.build_string
+    manifest = args.manifest
+
+    results: Dict[str, List[float]] = defaultdict(list)
+    for _ in range(args.runs):
+        for stage, seconds in run_child(build_string, manifest or None).items():
+            results[stage].append(seconds)
+    print(f"{'stage':<16}{'median (ms)':>13}{'max (ms)':>10}")
+    for stage, times in results.items():
+        print(
+            f"{stage:<16}{statistics.median(times) * 1000:>13.1f}"
+            f"{max(times) * 1000:>10.1f}"
+        )
+
+    print(f"\n{'package':<24}{'import (ms)':>12}")
+    by_package = sorted(import_times(manifest or None).items(), key=lambda el: -el[1])
+    for package, seconds in by_package[:15]:
+        print(f"{package:<24}{seconds * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Payload size and encode time of Response.to_json, uncompressed, gzip and deflate, across table sizes.
+
+run from the repo root:  python -m benchmarks.compression [repeats]
+"""
+
+import sys
+from timeit import repeat
+
+from lambda_function import COLUMNAR_JSON, JSON, Response, Status
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+
+BUILD_STRINGS = ["Die(6)", "10*Die(6)", "100*Die(6)", "40*Die(100)", "800*Die(5)"]
+ENCODINGS = [None, "gzip", "deflate"]
+
+
+def main(repeats: int = 5) -> None:
+    handler = DiceTablesRequestHandler(max_dice_value=4000)
+    print(
+        f"{'buildString':<14}{'content type':<42}{'encoding':<10}{'bytes':>10}{'encode (ms)':>13}"
+    )
+    for build_string in BUILD_STRINGS:
+        body = handler.get_response(build_string)
+        for content_type in (JSON, COLUMNAR_JSON):
+            for encoding in ENCODINGS:
+                response = Response(Status.OK, body, content_type, encoding)
+                size = len(response.to_json()["body"])
+                seconds = min(repeat(response.to_json, number=1, repeat=repeats))
+                print(
+                    f"{build_string:<14}{content_type:<42}{str(encoding):<10}"
+                    f"{size:>10}{seconds * 1000:>13.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
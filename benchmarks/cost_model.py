@@ -0,0 +1,166 @@
+"""
+Fit the cost model of request_handler.cost_model to measured runs. Each case is answered by a handler
+without caches and encoded as JSON, once under tracemalloc for its peak bytes and --repeats times for its
+best cpu time. The fitted model is printed, ready to paste as DEFAULT_COST_MODEL, with each case's
+measured and predicted cost.
+
+run from the repo root:  python -m benchmarks.cost_model [--repeats 3] [--check]
+
+--check fits nothing. It exits with 1 if any case uses more memory than DEFAULT_COST_MODEL predicts.
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import List, Optional, Sequence, Tuple
+
+from request_handler.cost_model import DEFAULT_COST_MODEL, CostModel, get_features
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+
+CASES = [
+    "Die(6)",
+    "10*Die(6)",
+    "100*Die(6)",
+    "400*Die(6)",
+    "1000*Die(6)",
+    "2000*Die(2)",
+    "1000*Die(4)",
+    "20*Die(100)",
+    "40*Die(100)",
+    "8*Die(500)",
+    "24*Die(500)",
+    "100*Die(20)&50*Die(10)",
+    "4*Die(500)&200*Die(6)",
+    "30*Exploding(Die(6), 3)",
+    "20*StrongDie(Die(6), 10)&Die(20)",
+    f"3*WeightedDie({{1: {10**300}, 2: 1, 3: {10**200}}})",
+    f"50*WeightedDie({{1: {10**30}, 2: 1, 3: {10**20}}})&20*Die(10)",
+]
+
+MAX_DICE_VALUE = 12000
+
+
+def measure(build_string: str, repeats: int) -> Tuple[int, float]:
+    """:return: peak bytes and best seconds of a full response to build_string"""
+
+    def run() -> None:
+        handler = DiceTablesRequestHandler(max_dice_value=MAX_DICE_VALUE)
+        answer = handler.get_response(build_string)
+        if "errorMessage" in answer:
+            raise ValueError(f"{build_string}: {answer['errorMessage']}")
+        json.dumps(answer)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = []
+    for _ in range(repeats):
+        start = perf_counter()
+        run()
+        seconds.append(perf_counter() - start)
+    return peak, min(seconds)
+
+
+def fit(rows: Sequence[Sequence[float]], targets: Sequence[float]) -> List[float]:
+    """
+    least squares of the relative error, with no negative coefficient, then scaled up so that no target is
+    over its prediction
+    """
+    columns = list(range(len(rows[0])))
+    active = list(columns)
+    while True:
+        coefficients = dict.fromkeys(columns, 0.0)
+        coefficients.update(zip(active, _solve(rows, targets, active)))
+        negative = [column for column in active if coefficients[column] < 0]
+        if not negative:
+            break
+        active.remove(min(negative, key=lambda column: coefficients[column]))
+    answer = [coefficients[column] for column in columns]
+    scale = max(target / _predict(answer, row) for row, target in zip(rows, targets))
+    return [coefficient * scale for coefficient in answer]
+
+
+def _solve(
+    rows: Sequence[Sequence[float]], targets: Sequence[float], active: List[int]
+) -> List[float]:
+    """the normal equations of sum(((row . x) / target - 1) ** 2) over the active columns"""
+    scaled = [
+        [row[column] / target for column in active]
+        for row, target in zip(rows, targets)
+    ]
+    size = len(active)
+    matrix = [
+        [sum(row[i] * row[j] for row in scaled) for j in range(size)]
+        + [sum(row[i] for row in scaled)]
+        for i in range(size)
+    ]
+    for pivot in range(size):
+        best = max(range(pivot, size), key=lambda index: abs(matrix[index][pivot]))
+        matrix[pivot], matrix[best] = matrix[best], matrix[pivot]
+        for index in range(size):
+            if index != pivot:
+                ratio = matrix[index][pivot] / matrix[pivot][pivot]
+                matrix[index] = [
+                    a - ratio * b for a, b in zip(matrix[index], matrix[pivot])
+                ]
+    return [matrix[index][size] / matrix[index][index] for index in range(size)]
+
+
+def _predict(coefficients: Sequence[float], row: Sequence[float]) -> float:
+    return sum(coefficient * term for coefficient, term in zip(coefficients, row))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args(argv)
+
+    handler = DiceTablesRequestHandler(max_dice_value=MAX_DICE_VALUE)
+    rows = []
+    peaks = []
+    seconds = []
+    for build_string in CASES:
+        events, digits = get_features(handler.create_dice_record(build_string))
+        rows.append((1.0, events, events * digits))
+        peak, best = measure(build_string, args.repeats)
+        peaks.append(peak)
+        seconds.append(best)
+
+    if args.check:
+        model = DEFAULT_COST_MODEL
+    else:
+        bytes_fit = fit(rows, peaks)
+        seconds_fit = fit(rows, seconds)
+        model = CostModel(*bytes_fit, *seconds_fit)
+        print(
+            "DEFAULT_COST_MODEL = CostModel("
+            + ", ".join(f"{value:.4g}" for value in bytes_fit + seconds_fit)
+            + ")"
+        )
+
+    print(
+        f"{'buildString':<56}{'events':>8}{'digits':>8}{'MiB':>8}{'predicted':>10}"
+        f"{'ms':>9}{'predicted':>10}"
+    )
+    over = []
+    for build_string, peak, best in zip(CASES, peaks, seconds):
+        cost = model.estimate(handler.create_dice_record(build_string))
+        print(
+            f"{build_string[:55]:<56}{cost.events:>8}{cost.digits:>8.0f}{peak / 2**20:>8.2f}"
+            f"{cost.peak_bytes / 2**20:>10.2f}{best * 1000:>9.1f}{cost.cpu_seconds * 1000:>10.1f}"
+        )
+        if peak > cost.peak_bytes:
+            over.append(build_string)
+    if over:
+        print(f"over the predicted memory: {over}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
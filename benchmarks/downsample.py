@@ -0,0 +1,60 @@
+"""
+Compare data with and without maxPoints: the time to downsample and encode it, and the encoded size.
+
+run from the repo root:  python -m benchmarks.downsample [repeats]
+"""
+
+import json
+import sys
+import zlib
+from timeit import repeat
+from typing import Callable, Optional
+
+from dicetables import DiceTable, Die, Exploding
+
+from request_handler.dice_tables_tequest_handler import make_dict
+from request_handler.downsample import lttb
+
+TABLES = [
+    DiceTable.new().add_die(Die(6), 10),
+    DiceTable.new().add_die(Die(100), 20),
+    DiceTable.new().add_die(Die(500), 25),
+    DiceTable.new().add_die(Exploding(Die(20), 3), 30),
+]
+
+MAX_POINTS = [None, 1000, 500, 100]
+
+
+def get_encoder(data: dict, max_points: Optional[int]) -> Callable[[], str]:
+    """encodes data as the handler does with maxPoints"""
+    if max_points is None:
+        return lambda: json.dumps({"data": data})
+    return lambda: json.dumps(
+        {"data": dict(zip(("x", "y"), lttb(data["x"], data["y"], max_points)))}
+    )
+
+
+def best_time(encode: Callable[[], str], repeats: int) -> float:
+    return min(repeat(encode, number=1, repeat=repeats))
+
+
+def main(repeats: int = 5) -> None:
+    print(
+        f"{'table':<48}{'maxPoints':>10}{'points':>8}{'time (s)':>10}{'KiB':>10}"
+        f"{'deflated KiB':>14}"
+    )
+    for table in TABLES:
+        data = make_dict(table, ["data"])["data"]
+        for max_points in MAX_POINTS:
+            encode = get_encoder(data, max_points)
+            body = encode()
+            points = len(json.loads(body)["data"]["x"])
+            print(
+                f"{table!r:<48}{str(max_points):>10}{points:>8}"
+                f"{best_time(encode, repeats):>10.4f}{len(body) / 1024:>10.1f}"
+                f"{len(zlib.compress(body.encode(), 6)) / 1024:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,52 @@
+"""
+Compare the forSciNum section against the old full_table_string(6, -1) round trip on tables with 10k+ rolls.
+
+run from the repo root:  python -m benchmarks.for_scinum [repeats]
+"""
+
+import sys
+from timeit import repeat
+
+from dicetables import DiceTable, Die, EventsCalculations
+
+from request_handler.dice_tables_tequest_handler import make_dict
+
+TABLES = [
+    DiceTable.new().add_die(Die(500), 25),
+    DiceTable.new().add_die(Die(200), 80),
+    DiceTable.new().add_die(Die(2), 4000).add_die(Die(500), 20),
+]
+
+
+def string_round_trip(table: DiceTable) -> list:
+    lines = EventsCalculations(table).full_table_string(6, -1).split("\n")
+    answer = []
+    for line in lines:
+        if not line:
+            continue
+        roll, number = line.split(": ")
+        mantissa, exponent = ("0", "0") if number == "0" else number.split("e+")
+        answer.append({"roll": int(roll), "mantissa": mantissa, "exponent": exponent})
+    return answer
+
+
+def main(repeats: int = 5) -> None:
+    print(
+        f"{'table':<45}{'rolls':>7}{'round trip (s)':>16}{'direct (s)':>12}{'speedup':>9}"
+    )
+    for table in TABLES:
+        direct = make_dict(table, ["forSciNum"])["forSciNum"]
+        if direct != string_round_trip(table):
+            raise AssertionError(f"forSciNum does not match for {table!r}")
+
+        old = min(repeat(lambda: string_round_trip(table), number=1, repeat=repeats))
+        new = min(
+            repeat(lambda: make_dict(table, ["forSciNum"]), number=1, repeat=repeats)
+        )
+        print(
+            f"{table!r:<45}{len(direct):>7}{old:>16.4f}{new:>12.4f}{old / new:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
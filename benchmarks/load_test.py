@@ -0,0 +1,118 @@
+"""
+Throughput of server.py with more and more workers. Each run starts a server without its result cache,
+then --connections keep-alive connections each POST --requests different tables, so every request builds
+a table in a worker.
+
+run from the repo root:  python -m benchmarks.load_test [--workers 1 2 4] [--connections 8] [--requests 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_build_string(index: int) -> str:
+    """a different table of 10 to 39 * Die(60 to 99), under the lambda's max_dice_value, for 1200 indices"""
+    return f"{10 + index % 30}*Die({60 + index // 30 % 40})"
+
+
+async def post(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, body: dict
+) -> int:
+    """:return: the status code"""
+    body_bytes = json.dumps(body).encode()
+    writer.write(
+        f"POST / HTTP/1.1\r\nContent-Length: {len(body_bytes)}\r\n\r\n".encode()
+        + body_bytes
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def load(port: int, connections: int, requests: int) -> Tuple[float, List[float]]:
+    """:return: the total seconds and the seconds of each request"""
+    latencies: List[float] = []
+
+    async def connection(number: int) -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for request in range(requests):
+            body = {"buildString": get_build_string(number * requests + request)}
+            start = perf_counter()
+            if await post(reader, writer, body) != 200:
+                raise AssertionError(f"{body} failed")
+            latencies.append(perf_counter() - start)
+        writer.close()
+
+    start = perf_counter()
+    await asyncio.gather(*[connection(number) for number in range(connections)])
+    return perf_counter() - start, latencies
+
+
+def run_server(
+    workers: int, connections: int, requests: int
+) -> Tuple[float, List[float]]:
+    port = get_free_port()
+    options = f"--port {port} --workers {workers} --cache-entries 0"
+    server = subprocess.Popen(
+        [sys.executable, "server.py"] + options.split(),
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert server.stdout is not None
+        server.stdout.readline()
+        return asyncio.run(load(port, connections, requests))
+    finally:
+        # SIGINT lets the server shut down its pool, and the pools of its workers
+        server.send_signal(signal.SIGINT)
+        server.wait()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    cpus = os.cpu_count() or 1
+    parser.add_argument(
+        "--workers", type=int, nargs="*", default=sorted({1, 2, 4, cpus})
+    )
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{cpus} cpus")
+    print(f"{'workers':>8}{'requests/s':>12}{'p50 ms':>9}{'p99 ms':>9}")
+    for workers in args.workers:
+        seconds, latencies = run_server(workers, args.connections, args.requests)
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{workers:>8}{len(latencies) / seconds:>12.1f}"
+            f"{statistics.median(latencies) * 1000:>9.1f}{p99 * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Time ParallelEngine against adding the dice one after another, for records of several kinds of dice. The
+pool is started before the timed runs, and that start up is printed on its own.
+
+run from the repo root:  python -m benchmarks.parallel [--workers 2 4] [--repeats 3]
+"""
+
+import argparse
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from dicetables import DiceRecord, DiceTable, Die, Exploding, StrongDie
+
+from request_handler.convolution import DEFAULT_ENGINE, DiceTablesEngine
+from request_handler.parallel import ParallelEngine, available_cpus
+
+RECORDS = [
+    DiceRecord({Die(6): 200, Die(10): 100, Die(20): 50}),
+    DiceRecord({Die(100): 20, Die(60): 20, Die(30): 30, Die(12): 40}),
+    DiceRecord({Exploding(Die(6), 3): 40, Exploding(Die(10), 2): 30, Die(8): 50}),
+    DiceRecord({StrongDie(Die(6), 10): 30, Die(20): 60, Die(4): 100}),
+]
+
+
+def best_time(engine: DiceTablesEngine, record: DiceRecord, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        engine.add_dice(DiceTable.new(), record.get_dict())
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    cpus = available_cpus()
+    parser.add_argument("--workers", type=int, nargs="*", default=sorted({2, cpus}))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    engines: Dict[str, DiceTablesEngine] = {"serial": DEFAULT_ENGINE}
+    print(f"{cpus} cpus")
+    for workers in args.workers:
+        parallel = ParallelEngine(min_size=0, max_workers=workers)
+        start = perf_counter()
+        parallel.add_dice(DiceTable.new(), {Die(2): 1, Die(3): 1})
+        print(f"{workers} workers started in {perf_counter() - start:.3f}s")
+        engines[f"{workers} workers"] = parallel
+
+    print(f"{'record':<80}{'engine':>12}{'time (s)':>10}{'speed up':>10}")
+    for record in RECORDS:
+        serial = best_time(DEFAULT_ENGINE, record, args.repeats)
+        for name, engine in engines.items():
+            seconds = (
+                serial
+                if engine is DEFAULT_ENGINE
+                else best_time(engine, record, args.repeats)
+            )
+            print(
+                f"{str(record):<80}{name:>12}{seconds:>10.4f}{serial / seconds:>10.2f}"
+            )
+    for engine in engines.values():
+        if isinstance(engine, ParallelEngine):
+            engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Compare the compactRoller section against roller, in plain JSON and after to_columnar: the time to make and
+encode each, and the encoded size.
+
+run from the repo root:  python -m benchmarks.roller [repeats]
+"""
+
+import json
+import sys
+import zlib
+from timeit import repeat
+from typing import Callable
+
+from dicetables import DiceTable, Die, Exploding
+
+from request_handler.dice_tables_tequest_handler import make_dict
+from request_handler.response_formats import to_columnar
+
+TABLES = [
+    DiceTable.new().add_die(Die(6), 10),
+    DiceTable.new().add_die(Die(100), 20),
+    DiceTable.new().add_die(Die(500), 25),
+    DiceTable.new().add_die(Exploding(Die(20), 3), 30),
+]
+
+COMPACT = (",", ":")
+
+ENCODINGS = {
+    "roller": lambda table: json.dumps(make_dict(table, ["roller"])),
+    "roller columnar": lambda table: json.dumps(
+        to_columnar(make_dict(table, ["roller"])), separators=COMPACT
+    ),
+    "compactRoller": lambda table: json.dumps(
+        make_dict(table, ["compactRoller"]), separators=COMPACT
+    ),
+}
+
+
+def best_time(encode: Callable[[DiceTable], str], table: DiceTable, repeats: int):
+    return min(repeat(lambda: encode(table), number=1, repeat=repeats))
+
+
+def main(repeats: int = 5) -> None:
+    print(
+        f"{'table':<48}{'encoding':<17}{'time (s)':>10}{'KiB':>10}{'deflated KiB':>14}"
+    )
+    for table in TABLES:
+        for name, encode in ENCODINGS.items():
+            body = encode(table).encode()
+            print(
+                f"{table!r:<48}{name:<17}{best_time(encode, table, repeats):>10.4f}"
+                f"{len(body) / 1024:>10.1f}{len(zlib.compress(body, 6)) / 1024:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,54 @@
+"""
+Rolls per second of Roller.roll_many against the histogram and packed rolls of request_handler.rolls.
+
+run from the repo root:  python -m benchmarks.rolls [rolls] [repeats]
+"""
+
+import sys
+from random import Random
+from timeit import repeat
+
+from dicetables import DiceTable, Die, Exploding, Roller
+from dicetables.tools.alias_table import AliasTable
+
+from request_handler.rolls import get_histogram, get_packed
+
+TABLES = [
+    DiceTable.new().add_die(Die(6), 3),
+    DiceTable.new().add_die(Die(100), 40),
+    DiceTable.new().add_die(Exploding(Die(20), 3), 30),
+    DiceTable.new().add_die(Die(2), 2000),
+]
+
+
+def main(rolls: int = 10**6, repeats: int = 3) -> None:
+    print(
+        f"{'table':<48}{'height bits':>12}{'roll_many /s':>14}{'histogram /s':>14}"
+        f"{'packed /s':>12}"
+    )
+    for table in TABLES:
+        alias_table = AliasTable(table.get_dict())
+        roller = Roller(table, Random(0))
+        old = min(repeat(lambda: roller.roll_many(rolls), number=1, repeat=repeats))
+        histogram = min(
+            repeat(
+                lambda: get_histogram(alias_table, rolls, Random(0)),
+                number=1,
+                repeat=repeats,
+            )
+        )
+        packed = min(
+            repeat(
+                lambda: get_packed(alias_table, rolls, Random(0)),
+                number=1,
+                repeat=repeats,
+            )
+        )
+        print(
+            f"{table!r:<48}{alias_table.height.bit_length():>12}{rolls / old:>14,.0f}"
+            f"{rolls / histogram:>14,.0f}{rolls / packed:>12,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
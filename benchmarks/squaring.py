@@ -0,0 +1,39 @@
+"""
+Compare DiceTable.add_die against construct_dice_table (repeated squaring) for large die counts.
+
+run from the repo root:  python -m benchmarks.squaring [repeats]
+"""
+
+import sys
+from timeit import repeat
+
+from dicetables import DiceRecord, DiceTable, Die, WeightedDie
+
+from request_handler.dice_tables_tequest_handler import construct_dice_table
+
+DICE = [Die(2), Die(10), WeightedDie({1: 1, 2: 3, 3: 5, 4: 7})]
+COUNTS = [10, 100, 1000]
+
+
+def best_time(func, repeats: int) -> float:
+    return min(repeat(func, number=1, repeat=repeats))
+
+
+def main(repeats: int = 3) -> None:
+    print(
+        f"{'die':<35}{'count':>7}{'add_die (s)':>14}{'squaring (s)':>14}{'speedup':>9}"
+    )
+    for die in DICE:
+        for count in COUNTS:
+            record = DiceRecord.new().add_die(die, count)
+            expected = DiceTable.new().add_die(die, count)
+            if construct_dice_table(record) != expected:
+                raise AssertionError(f"squaring does not match add_die for {record}")
+
+            old = best_time(lambda: DiceTable.new().add_die(die, count), repeats)
+            new = best_time(lambda: construct_dice_table(record), repeats)
+            print(f"{die!r:<35}{count:>7}{old:>14.4f}{new:>14.4f}{old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,48 @@
+"""
+Peak memory of json.dumps(make_dict(table)) against writing the chunks of iter_json, across table sizes.
+The table is built before measuring, so only the response is counted.
+
+run from the repo root:  python -m benchmarks.streaming
+"""
+
+import json
+import tracemalloc
+from typing import Callable
+
+from dicetables import DiceTable, Die
+
+from request_handler.dice_tables_tequest_handler import iter_json, make_dict
+
+TABLES = [(10, 6), (100, 6), (100, 100), (400, 100)]
+
+
+def dumps(table: DiceTable) -> int:
+    return len(json.dumps(make_dict(table)))
+
+
+def stream(table: DiceTable) -> int:
+    return sum(len(chunk) for chunk in iter_json(table))
+
+
+def peak_bytes(function: Callable[[DiceTable], int], table: DiceTable) -> int:
+    tracemalloc.start()
+    function(table)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    print(f"{'table':<14}{'response (KiB)':>16}{'dumps peak':>14}{'stream peak':>14}")
+    for number, size in TABLES:
+        table = DiceTable.new().add_die(Die(size), number)
+        response_size = stream(table)
+        print(
+            f"{f'{number}*Die({size})':<14}{response_size / 1024:>16.0f}"
+            f"{peak_bytes(dumps, table) / 1024:>14.0f}"
+            f"{peak_bytes(stream, table) / 1024:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
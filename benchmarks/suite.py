@@ -0,0 +1,180 @@
+"""
+Latency percentiles, peak memory and response size of get_response and lambda_handler, for every die in
+DICE_EXAMPLES at sizes up to max_dice_value.
+
+run from the repo root:
+    python -m benchmarks.suite [--repeats 10] [--only Exploding] [--save benchmarks/baseline.json]
+    python -m benchmarks.suite --compare benchmarks/baseline.json
+
+get_response uses a handler without caches, so every repeat builds the table. lambda_handler uses the
+lambda's HANDLER, so after the first call it measures a cached answer and encoding.
+
+--compare exits with 1 if any case is slower (p50) or uses more memory than the baseline by more than the
+tolerance, or if a response size changed. baselines depend on the machine, so save one before changing
+the code and compare on the same machine.
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from dicetables import DiceRecord
+from dicetables.eventsbases.protodie import ProtoDie
+
+from lambda_function import lambda_handler
+from request_handler.dice_tables_tequest_handler import (
+    DiceTablesRequestHandler,
+    record_size,
+)
+from tests.test_requesthandler import DICE_EXAMPLES
+
+SIZE_FRACTIONS = [0.0, 0.1, 0.5, 1.0]
+PERCENTILES = [50, 90, 99]
+
+Result = Dict[str, float]
+
+
+def get_build_strings(die: ProtoDie, max_dice_value: int) -> List[str]:
+    """one die, then as many as fit in each fraction of max_dice_value"""
+    die_size = record_size(DiceRecord.new().add_die(die, 1))
+    numbers = [
+        max(1, int(fraction * max_dice_value) // die_size)
+        for fraction in SIZE_FRACTIONS
+    ]
+    return [f"{number}*{die!r}" for number in sorted(set(numbers))]
+
+
+def percentile(sorted_times: List[float], percent: int) -> float:
+    """nearest rank"""
+    index = max(0, -(-percent * len(sorted_times) // 100) - 1)
+    return sorted_times[index]
+
+
+def measure(call: Callable[[], int], repeats: int) -> Result:
+    """call returns the response size in bytes"""
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    response_bytes = call()
+    peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        call()
+        times.append(perf_counter() - start)
+    times.sort()
+    answer = {
+        f"p{percent}Ms": percentile(times, percent) * 1000 for percent in PERCENTILES
+    }
+    answer.update(peakBytes=peak_bytes, responseBytes=response_bytes)
+    return answer
+
+
+def handler_call(build_string: str, max_dice_value: int) -> Callable[[], int]:
+    def call() -> int:
+        handler = DiceTablesRequestHandler(max_dice_value=max_dice_value)
+        return len(json.dumps(handler.get_response(build_string)))
+
+    return call
+
+
+def lambda_call(build_string: str) -> Callable[[], int]:
+    event = {"body": {"buildString": build_string}, "isBase64Encoded": False}
+
+    def call() -> int:
+        return len(lambda_handler(event, None)["body"])
+
+    return call
+
+
+def run(
+    repeats: int, max_dice_value: int, only: Optional[str] = None
+) -> Dict[str, Result]:
+    results = {}
+    print(
+        f"{'case':<60}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'peak KiB':>10}{'bytes':>10}"
+    )
+    for die in DICE_EXAMPLES:
+        for build_string in get_build_strings(die, max_dice_value):
+            cases = {
+                f"get_response {build_string}": handler_call(
+                    build_string, max_dice_value
+                ),
+                f"lambda_handler {build_string}": lambda_call(build_string),
+            }
+            for name, call in cases.items():
+                if only and only not in name:
+                    continue
+                result = results[name] = measure(call, repeats)
+                print(
+                    f"{name:<60}{result['p50Ms']:>9.2f}{result['p90Ms']:>9.2f}"
+                    f"{result['p99Ms']:>9.2f}{result['peakBytes'] / 1024:>10.0f}"
+                    f"{result['responseBytes']:>10.0f}"
+                )
+    return results
+
+
+def compare(
+    results: Dict[str, Result],
+    baseline: Dict[str, Result],
+    tolerance: float,
+    min_ms: float,
+) -> List[str]:
+    """a message for every regression against the baseline. cases missing from either are skipped"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        slower = result["p50Ms"] - old["p50Ms"]
+        if slower > min_ms and result["p50Ms"] > old["p50Ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 {old['p50Ms']:.2f}ms -> {result['p50Ms']:.2f}ms"
+            )
+        if result["peakBytes"] > old["peakBytes"] * (1 + tolerance) + 1024:
+            regressions.append(
+                f"{name}: peak memory {old['peakBytes']:.0f} -> {result['peakBytes']:.0f} bytes"
+            )
+        if result["responseBytes"] != old["responseBytes"]:
+            regressions.append(
+                f"{name}: response size {old['responseBytes']:.0f} -> "
+                f"{result['responseBytes']:.0f} bytes"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--max-dice-value", type=int, default=4000)
+    parser.add_argument("--only", help="only cases whose name contains this")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--compare", help="a file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--min-ms", type=float, default=0.5, help="ignore p50 changes smaller than this"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.repeats, args.max_dice_value, args.only)
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, args.tolerance, args.min_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regressions in {len(results)} cases")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Precompute responses for common buildStrings into a bundle that create_zip.sh adds to the deployment zip.
+
+run from the repo root:
+    python build_bundle.py [--out response_bundle.bin] [--dice Die(6) Die(20) ...] [--max-count 10]
+                           [--build-strings FILE] [--max-dice-value 4000] [--no-check]
+
+by default, every NdX from 1 to --max-count of each --dice is bundled, plus every line of --build-strings.
+after writing, it prints a size report and checks that the bundle gives the same JSON as a live handler.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Iterable, List, Optional
+
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+from request_handler.response_bundle import ResponseBundle, write_bundle
+
+DEFAULT_PATH = "response_bundle.bin"
+DEFAULT_DICE = [
+    "Die(4)",
+    "Die(6)",
+    "Die(8)",
+    "Die(10)",
+    "Die(12)",
+    "Die(20)",
+    "Die(100)",
+]
+DEFAULT_MAX_COUNT = 10
+
+
+def get_build_strings(
+    dice: Iterable[str], max_count: int, build_strings_file: Optional[str] = None
+) -> List[str]:
+    answer = [f"{count}*{die}" for die in dice for count in range(1, max_count + 1)]
+    if build_strings_file:
+        with open(build_strings_file) as lines:
+            answer += [line.strip() for line in lines if line.strip()]
+    return answer
+
+
+def build(path: str, build_strings: List[str], max_dice_value: int) -> None:
+    handler = DiceTablesRequestHandler(max_dice_value=max_dice_value)
+    responses = []
+    for build_string in build_strings:
+        response = handler.get_response(build_string)
+        if "errorMessage" in response:
+            print(f"skipped {build_string!r}: {response['errorMessage']}")
+            continue
+        responses.append((handler.create_dice_record(build_string), response))
+    write_bundle(path, responses)
+
+
+def report(path: str, largest: int = 5) -> None:
+    bundle = ResponseBundle(path)
+    sizes = bundle.entry_sizes()
+    print(f"{path}: {len(bundle)} entries, {os.path.getsize(path)} bytes")
+    for key, size in sorted(sizes.items(), key=lambda item: -item[1])[:largest]:
+        print(f"{size:>12}  {key}")
+    bundle.close()
+
+
+def check(path: str, build_strings: List[str], max_dice_value: int) -> bool:
+    """true if the bundle gives the same JSON as a live handler for every build string"""
+    bundle = ResponseBundle(path)
+    bundled = DiceTablesRequestHandler(
+        max_dice_value=max_dice_value, response_bundle=bundle
+    )
+    live = DiceTablesRequestHandler(max_dice_value=max_dice_value)
+    matches = True
+    for build_string in build_strings:
+        expected = json.dumps(live.get_response(build_string))
+        if json.dumps(bundled.get_response(build_string)) != expected:
+            print(f"mismatch: {build_string!r}")
+            matches = False
+    bundle.close()
+    return matches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--out", default=DEFAULT_PATH)
+    parser.add_argument("--dice", nargs="*", default=DEFAULT_DICE)
+    parser.add_argument("--max-count", type=int, default=DEFAULT_MAX_COUNT)
+    parser.add_argument("--build-strings", help="a file with one buildString per line")
+    parser.add_argument("--max-dice-value", type=int, default=4000)
+    parser.add_argument("--no-check", action="store_true")
+    args = parser.parse_args(argv)
+
+    build_strings = get_build_strings(args.dice, args.max_count, args.build_strings)
+    build(args.out, build_strings, args.max_dice_value)
+    report(args.out)
+    if args.no_check:
+        return 0
+    return 0 if check(args.out, build_strings, args.max_dice_value) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
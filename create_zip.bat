@@ -2,3 +2,11 @@ Compress-Archive -Path .\sparse_env\Lib\site-packages\dicetables\ -DestinationPa
 
 Compress-Archive -Path .\request_handler\ -Update -DestinationPath .\mypkg.zip
 Compress-Archive -Path .\lambda_function.py\ -Update -DestinationPath .\mypkg.zip
+
+if (Test-Path .\response_bundle.bin) {
+    Compress-Archive -Path .\response_bundle.bin -Update -DestinationPath .\mypkg.zip
+}
+
+if (Test-Path .\warm_manifest.json) {
+    Compress-Archive -Path .\warm_manifest.json -Update -DestinationPath .\mypkg.zip
+}
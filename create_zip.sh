@@ -6,7 +6,19 @@ LIBRARY="request_handler"
 
 LAMBDA="lambda_function.py"
 
+BUNDLE="response_bundle.bin"
+
+MANIFEST="warm_manifest.json"
+
 
 zip -r mypkg.zip "${DICETABLES}"
 zip -ur mypkg.zip "${LIBRARY}"
 zip -u mypkg.zip "${LAMBDA}"
+
+if [ -f "${BUNDLE}" ]; then
+    zip -u mypkg.zip "${BUNDLE}"
+fi
+
+if [ -f "${MANIFEST}" ]; then
+    zip -u mypkg.zip "${MANIFEST}"
+fi
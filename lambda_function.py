@@ -1,12 +1,112 @@
-from base64 import b64decode
+from base64 import b64decode, b64encode
 import json
+import os
+import time
+import zlib
 from dataclasses import dataclass
 from enum import Enum
+from functools import partial
 from logging import getLogger, INFO
+from typing import TYPE_CHECKING, Optional, Tuple
 
-from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+from request_handler.convolution import DEFAULT_ENGINE, DiceTablesEngine
+from request_handler.dice_tables_tequest_handler import (
+    DiceTablesRequestHandler,
+    FIELDS,
+)
+from request_handler.response_formats import to_columnar
+from request_handler.result_cache import ResultCache, estimate_table_size
 
-HANDLER = DiceTablesRequestHandler(max_dice_value=4000)
+if TYPE_CHECKING:
+    # imported where they are used, so that a cold start without them does not pay for them
+    from request_handler.queries import PrefixSums
+    from request_handler.response_bundle import ResponseBundle
+    from request_handler.table_store import TableStore
+    from request_handler.timings import StageTimings
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TABLE_STORE_DIR = os.environ.get("TABLE_STORE_DIR")
+RESPONSE_BUNDLE = os.environ.get(
+    "RESPONSE_BUNDLE", os.path.join(PACKAGE_DIR, "response_bundle.bin")
+)
+WARM_MANIFEST = os.environ.get(
+    "WARM_MANIFEST", os.path.join(PACKAGE_DIR, "warm_manifest.json")
+)
+# "" is off, "memory" adds allocated bytes, anything else logs the time of each stage
+TIMINGS = os.environ.get("TIMINGS", "")
+# dice of at least this sum of dictionaries are added in a pool of processes, on hosts with more than one
+# cpu but not on Lambda, which cannot start one. PARALLEL_WORKERS sets the size of the pool, and 1 turns
+# it off.
+PARALLEL_MIN_SIZE = int(os.environ.get("PARALLEL_MIN_SIZE", "2000"))
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", "0")) or None
+
+
+def get_memory_budget() -> Optional[int]:
+    """
+    MEMORY_BUDGET bytes for building one table and its response, as predicted by the cost model. defaults
+    to half the lambda's memory. None, with no budget, when neither is set.
+    """
+    if os.environ.get("MEMORY_BUDGET"):
+        return int(os.environ["MEMORY_BUDGET"])
+    lambda_megabytes = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "0"))
+    return lambda_megabytes * 2**20 // 2 or None
+
+
+def get_engine() -> DiceTablesEngine:
+    """a ParallelEngine, unless it is turned off or this is Lambda, where it would only add dice in turn"""
+    if PARALLEL_WORKERS == 1 or os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        return DEFAULT_ENGINE
+    from request_handler.parallel import ParallelEngine
+
+    return ParallelEngine(DEFAULT_ENGINE, PARALLEL_MIN_SIZE, PARALLEL_WORKERS)
+
+
+def get_table_store() -> Optional["TableStore"]:
+    """a TableStore in TABLE_STORE_DIR, or None when it is not set"""
+    if not TABLE_STORE_DIR:
+        return None
+    from request_handler.table_store import TableStore
+
+    return TableStore(TABLE_STORE_DIR, min_events=500)
+
+
+def get_response_bundle() -> Optional["ResponseBundle"]:
+    """the ResponseBundle at RESPONSE_BUNDLE, or None when there is no file"""
+    if not os.path.isfile(RESPONSE_BUNDLE):
+        return None
+    from request_handler.response_bundle import ResponseBundle
+
+    return ResponseBundle(RESPONSE_BUNDLE)
+
+
+def _get_index_size(prefix_sums: "PrefixSums") -> int:
+    return prefix_sums.size()
+
+
+HANDLER = DiceTablesRequestHandler(
+    max_dice_value=4000,
+    max_rolls=10**6,
+    max_stats_dice_value=10**9,
+    engine=get_engine(),
+    memory_budget=get_memory_budget(),
+    index_cache=ResultCache(max_entries=64, max_bytes=8 * 2**20, sizer=_get_index_size),
+    result_cache=ResultCache(max_entries=256, max_bytes=32 * 2**20),
+    table_cache=ResultCache(
+        max_entries=64, max_bytes=32 * 2**20, sizer=estimate_table_size
+    ),
+    table_store=get_table_store(),
+    parse_cache=ResultCache(max_entries=1024, max_bytes=2**20),
+    response_bundle=get_response_bundle(),
+)
+
+MAX_BATCH_SIZE = 100
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.allthedice.columnar+json"
+
+COMPRESSION_MIN_BYTES = 1024
+COMPRESSION_LEVEL = 6
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
@@ -19,19 +119,74 @@ class Status(Enum):
     FORBIDDEN = 403
 
 
+def _encode_columnar_json(body: dict) -> str:
+    return json.dumps(to_columnar(body), separators=(",", ":"))
+
+
+ENCODERS = {JSON: json.dumps, COLUMNAR_JSON: _encode_columnar_json}
+# content types that send compactRoller instead of roller
+COMPACT_TYPES = {COLUMNAR_JSON}
+
+
+def _gzip(data: bytes) -> bytes:
+    import gzip
+
+    return gzip.compress(data, compresslevel=COMPRESSION_LEVEL)
+
+
+COMPRESSORS = {
+    "gzip": _gzip,
+    "deflate": partial(zlib.compress, level=COMPRESSION_LEVEL),
+}
+
+
 @dataclass
 class Response:
     status: Status
     body: dict
+    content_type: str = JSON
+    content_encoding: Optional[str] = None
 
     def to_json(self):
+        body = ENCODERS[self.content_type](self.body)
+        headers = {"Content-Type": self.content_type}
+        if self.content_encoding is None or len(body) < COMPRESSION_MIN_BYTES:
+            return {"body": body, "statusCode": self.status.value, "headers": headers}
+
+        compressed = COMPRESSORS[self.content_encoding](body.encode())
+        headers["Content-Encoding"] = self.content_encoding
         return {
-            "body": json.dumps(self.body),
+            "body": b64encode(compressed).decode(),
             "statusCode": self.status.value,
-            "headers": {"Content-Type": "application/json"},
+            "headers": headers,
+            "isBase64Encoded": True,
         }
 
 
+def warm(handler: DiceTablesRequestHandler, manifest_path: str) -> int:
+    """
+    fills the handler's caches from a JSON list of request bodies ({"buildString": ..., "fields": ...}).
+    batches are not supported. a manifest that cannot be read is logged and skipped.
+
+    :return: the number of requests answered
+    """
+    start = time.perf_counter()
+    try:
+        with open(manifest_path) as manifest:
+            bodies = json.load(manifest)
+        for body in bodies:
+            handler.get_response(body["buildString"], body.get("fields"))
+    except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.exception(e)
+        return 0
+    logger.info(f"warmed {len(bodies)} requests in {time.perf_counter() - start:.3f}s")
+    return len(bodies)
+
+
+if os.path.isfile(WARM_MANIFEST):
+    warm(HANDLER, WARM_MANIFEST)
+
+
 def lambda_handler(event: dict, context):
     try:
         body = event["body"]
@@ -40,14 +195,148 @@ def lambda_handler(event: dict, context):
         if not isinstance(body, dict):
             body = json.loads(body)
         logger.info(f"request: {body}")
-        base_response = HANDLER.get_response(body["buildString"])
-        status = Status.OK
-        if "errorMessage" in base_response:
-            status = Status.NOT_FOUND
-        response = Response(status, base_response).to_json()
+        content_type = get_content_type(event)
+        stats_only = body.get("statsOnly") is True
+        queries = body.get("queries")
+        fields = body.get("fields")
+        if not stats_only and (queries is None or fields is not None):
+            fields = get_fields(fields, content_type)
+        timings = get_timings(body)
+        max_points = body.get("maxPoints")
+        if "buildStrings" in body:
+            status, base_response = get_batch_response(
+                body["buildStrings"], fields, timings, stats_only, max_points
+            )
+        elif "rolls" in body:
+            base_response = HANDLER.get_rolls(
+                body["buildString"],
+                body["rolls"],
+                body.get("seed"),
+                body.get("rollFormat", "histogram"),
+                timings,
+            )
+            status = get_status(base_response)
+        elif stats_only:
+            base_response = HANDLER.get_stats(body["buildString"], fields, timings)
+            status = get_status(base_response)
+        else:
+            base_response = HANDLER.get_response(
+                body["buildString"],
+                fields,
+                timings,
+                queries,
+                body.get("queryFormat", "percent"),
+                max_points,
+            )
+            status = get_status(base_response)
+        if timings is not None and body.get("timings") is True:
+            base_response = dict(base_response, timings=timings.to_dict())
+        encoder = Response(
+            status, base_response, content_type, get_content_encoding(event)
+        )
+        if timings is None:
+            response = encoder.to_json()
+        else:
+            with timings.stage("encode"):
+                response = encoder.to_json()
+            stages = timings.to_dict()
+            logger.info(f"timings: {json.dumps(stages)}", extra={"timings": stages})
         logger.info(f"response: {response}"[:200])
         return response
     except Exception as e:
         logger.exception(e)
         logger.error(event)
         return Response(Status.BAD_REQUEST, {"errorMessage": "could not process"}).to_json()
+
+
+def get_header(event: dict, name: str, default: str = "") -> str:
+    headers = event.get("headers") or {}
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value
+    return default
+
+
+def get_content_type(event: dict) -> str:
+    """the first type in the Accept header that has an encoder and a q over 0. defaults to JSON"""
+    for media_range in get_header(event, "Accept").split(","):
+        media_type, *params = [part.strip().lower() for part in media_range.split(";")]
+        if media_type in ENCODERS and _get_quality(params) > 0:
+            return media_type
+    return JSON
+
+
+def get_content_encoding(event: dict) -> Optional[str]:
+    """
+    gzip or deflate if the Accept-Encoding header allows it, preferring gzip. `*` only allows the codings
+    that are not listed, so `gzip;q=0` refuses gzip with or without it.
+    """
+    qualities = {}
+    for coding in get_header(event, "Accept-Encoding").split(","):
+        name, *params = [part.strip().lower() for part in coding.split(";")]
+        qualities[name] = _get_quality(params)
+    for name in COMPRESSORS:
+        if qualities.get(name, qualities.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+def _get_quality(params: list) -> float:
+    for param in params:
+        if param.startswith("q="):
+            try:
+                return float(param[2:])
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def get_fields(fields: Optional[list], content_type: str) -> Optional[list]:
+    """the fields to ask the handler for. compact types get compactRoller in place of roller"""
+    if content_type not in COMPACT_TYPES:
+        return fields
+    if fields is None:
+        fields = list(FIELDS)
+    if not isinstance(fields, (list, tuple)):
+        return fields
+    return ["compactRoller" if field == "roller" else field for field in fields]
+
+
+def get_timings(body: dict) -> Optional["StageTimings"]:
+    """timings if TIMINGS is set or the request has "timings": true, which also adds them to the response"""
+    if not TIMINGS and body.get("timings") is not True:
+        return None
+    from request_handler.timings import StageTimings
+
+    return StageTimings(trace_allocations=TIMINGS == "memory")
+
+
+def get_status(base_response: dict) -> Status:
+    if "errorMessage" in base_response:
+        return Status.NOT_FOUND
+    return Status.OK
+
+
+def get_batch_response(
+    build_strings: list,
+    fields: Optional[list] = None,
+    timings: Optional["StageTimings"] = None,
+    stats_only: bool = False,
+    max_points: Optional[int] = None,
+) -> Tuple[Status, dict]:
+    if not isinstance(build_strings, list) or len(build_strings) > MAX_BATCH_SIZE:
+        raise ValueError(f"buildStrings must be a list of at most {MAX_BATCH_SIZE}")
+    if stats_only:
+        base_responses = [
+            HANDLER.get_stats(build_string, fields, timings)
+            for build_string in build_strings
+        ]
+    else:
+        base_responses = HANDLER.get_responses(
+            build_strings, fields, timings, max_points
+        )
+    results = [
+        {"statusCode": get_status(base_response).value, "body": base_response}
+        for base_response in base_responses
+    ]
+    return Status.OK, {"results": results}
@@ -0,0 +1,153 @@
+"""
+Exact convolution of events dictionaries: {event: occurrences, ...}
+
+Two dictionaries are combined by packing each into one huge Decimal (every occurrence gets a fixed-width
+block of digits), multiplying, and reading the blocks of the product back out. libmpdec multiplies huge
+numbers with a number-theoretic transform, which is much faster than the pure-python loops in dicetables.
+k copies of one dictionary are combined by repeated squaring.
+
+Packing only pays off for dense dictionaries, and for tables that are not much bigger than the dice
+being added. The engines below decide which path to take. DiceTablesEngine is the reference: every
+engine must give tables equal to it.
+"""
+
+from decimal import Context, Decimal, Inexact, MAX_EMAX, MAX_PREC, MIN_EMIN
+from typing import Dict
+
+from dicetables import DiceTable
+from dicetables.eventsbases.protodie import ProtoDie
+
+MAX_SPAN_TO_EVENTS_RATIO = 2
+
+# python limits int(str) to 4300 digits by default. wider blocks are read through Decimal, which is slower.
+_INT_FROM_STR_MAX_WIDTH = 4000
+
+_EXACT = Context(prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN, traps=[Inexact])
+
+
+class DiceTablesEngine(object):
+    """combines dice with DiceTable.add_die"""
+
+    def supports(self, table: DiceTable, die: ProtoDie, number: int) -> bool:
+        return True
+
+    def add_die(self, table: DiceTable, die: ProtoDie, number: int) -> DiceTable:
+        return table.add_die(die, number)
+
+    def add_dice(self, table: DiceTable, dice: Dict[ProtoDie, int]) -> DiceTable:
+        """adds each die with add_die, one after another"""
+        for die, number in dice.items():
+            if number:
+                table = self.add_die(table, die, number)
+        return table
+
+
+class PackedDecimalEngine(DiceTablesEngine):
+    def __init__(self, min_size: int = 64, max_table_ratio: int = 4) -> None:
+        """
+        dice are combined by packed decimal multiplication and repeated squaring when it is faster.
+        otherwise, this falls back to DiceTable.add_die.
+
+        :param min_size: number * len(die.get_dict()) must be at least this
+        :param max_table_ratio: the table may be at most this many times the size of the events being added
+        """
+        self._min_size = min_size
+        self._max_table_ratio = max_table_ratio
+
+    @property
+    def min_size(self) -> int:
+        return self._min_size
+
+    @property
+    def max_table_ratio(self) -> int:
+        return self._max_table_ratio
+
+    def supports(self, table: DiceTable, die: ProtoDie, number: int) -> bool:
+        die_dict = die.get_dict()
+        if number * len(die_dict) < self._min_size:
+            return False
+        table_dict = table.get_dict()
+        if not is_dense(die_dict) or not is_dense(table_dict):
+            return False
+        added_span = number * (max(die_dict) - min(die_dict)) + 1
+        table_span = max(table_dict) - min(table_dict) + 1
+        return table_span <= self._max_table_ratio * added_span
+
+    def add_die(self, table: DiceTable, die: ProtoDie, number: int) -> DiceTable:
+        if not self.supports(table, die, number):
+            return super(PackedDecimalEngine, self).add_die(table, die, number)
+
+        events = convolve(table.get_dict(), power(die.get_dict(), number))
+        return DiceTable(events, table.dice_data().add_die(die, number))
+
+
+DEFAULT_ENGINE = PackedDecimalEngine()
+
+
+def is_dense(events: Dict[int, int]) -> bool:
+    """true if the span of events is small enough for packing to be worth it"""
+    if not events:
+        return False
+    span = max(events) - min(events) + 1
+    return span <= MAX_SPAN_TO_EVENTS_RATIO * len(events)
+
+
+def convolve(first: Dict[int, int], second: Dict[int, int]) -> Dict[int, int]:
+    """
+    :return: {event: occurrences} of rolling both first and second and adding the results
+    """
+    first_min, first_max = min(first), max(first)
+    second_min, second_max = min(second), max(second)
+    shortest = min(first_max - first_min, second_max - second_min) + 1
+    largest_occurrences = max(first.values()) * max(second.values()) * shortest
+    width = len(str(Decimal(largest_occurrences)))
+
+    first_packed = _pack(first, first_min, first_max, width)
+    if first is second:
+        product = _EXACT.multiply(first_packed, first_packed)
+    else:
+        second_packed = _pack(second, second_min, second_max, width)
+        product = _EXACT.multiply(first_packed, second_packed)
+
+    length = (first_max - first_min) + (second_max - second_min) + 1
+    return _unpack(product, first_min + second_min, length, width)
+
+
+def power(events: Dict[int, int], times: int) -> Dict[int, int]:
+    """
+    :return: {event: occurrences} of rolling events `times` times and adding the results
+    """
+    answer = {0: 1}
+    square = events
+    while times:
+        if times & 1:
+            answer = convolve(answer, square)
+        times >>= 1
+        if times:
+            square = convolve(square, square)
+    return answer
+
+
+def _pack(events: Dict[int, int], lowest: int, highest: int, width: int) -> Decimal:
+    blocks = (
+        str(Decimal(events.get(event, 0))).zfill(width)
+        for event in range(highest, lowest - 1, -1)
+    )
+    return Decimal("".join(blocks))
+
+
+def _unpack(packed: Decimal, lowest: int, length: int, width: int) -> Dict[int, int]:
+    digits = str(packed).zfill(length * width)
+    to_int = _int_from_decimal_str if width > _INT_FROM_STR_MAX_WIDTH else int
+    answer = {}
+    end = len(digits)
+    for event in range(lowest, lowest + length):
+        occurrences = to_int(digits[end - width : end])
+        if occurrences:
+            answer[event] = occurrences
+        end -= width
+    return answer
+
+
+def _int_from_decimal_str(digits: str) -> int:
+    return int(Decimal(digits))
@@ -0,0 +1,86 @@
+"""
+Predict the peak memory and cpu time of building a record's table and its full response, before it is
+built.
+
+max_dice_value counts dictionary entries, but the occurrences of each roll get wider with every die. A
+table of many dice is a few thousand rolls of ints with hundreds of digits, and forSciNum, tableString and
+the roller all hold copies of them. The cost of a record is modelled from:
+
+- events: an upper bound on the number of rolls. it is the span of the rolls divided by the largest
+  step that every die's rolls keep to, so StrongDie(Die(6), 10) is not counted ten times.
+- digits: an upper bound on the decimal digits of the largest occurrence, from the total occurrences of
+  each die.
+
+peak bytes = fixed_bytes + bytes_per_event * events + bytes_per_digit * events * digits, and the same for
+cpu seconds. The coefficients are fitted to measured runs by `python -m benchmarks.cost_model`, then
+scaled so that no run it measured is over its prediction.
+"""
+
+from collections import namedtuple
+from functools import reduce
+from math import gcd, log10
+
+from dicetables import DiceRecord
+
+Cost = namedtuple("Cost", ["events", "digits", "peak_bytes", "cpu_seconds"])
+
+
+class MemoryBudgetError(ValueError):
+    pass
+
+
+class CostModel(object):
+    def __init__(
+        self,
+        fixed_bytes: float = 0.0,
+        bytes_per_event: float = 0.0,
+        bytes_per_digit: float = 0.0,
+        fixed_seconds: float = 0.0,
+        seconds_per_event: float = 0.0,
+        seconds_per_digit: float = 0.0,
+    ) -> None:
+        """:param bytes_per_digit: and seconds_per_digit are for each digit of each event"""
+        self._bytes = (fixed_bytes, bytes_per_event, bytes_per_digit)
+        self._seconds = (fixed_seconds, seconds_per_event, seconds_per_digit)
+
+    @property
+    def bytes_coefficients(self) -> tuple:
+        """(fixed_bytes, bytes_per_event, bytes_per_digit)"""
+        return self._bytes
+
+    @property
+    def seconds_coefficients(self) -> tuple:
+        """(fixed_seconds, seconds_per_event, seconds_per_digit)"""
+        return self._seconds
+
+    def estimate(self, record: DiceRecord) -> Cost:
+        events, digits = get_features(record)
+        terms = (1, events, events * digits)
+        return Cost(
+            events,
+            digits,
+            int(
+                sum(coefficient * term for coefficient, term in zip(self._bytes, terms))
+            ),
+            sum(coefficient * term for coefficient, term in zip(self._seconds, terms)),
+        )
+
+
+# fitted by `python -m benchmarks.cost_model` with python 3.11 and dicetables 4.0.3
+DEFAULT_COST_MODEL = CostModel(8200, 2183, 3.061, 0.0004184, 4.238e-05, 2.47e-07)
+
+
+def get_features(record: DiceRecord) -> tuple:
+    """:return: (events, digits) of the record's table. see the module docstring"""
+    span = 0
+    step = 0
+    digits = 1.0
+    for die, number in record.get_dict().items():
+        if not number:
+            continue
+        events = die.get_dict()
+        lowest = min(events)
+        span += number * (max(events) - lowest)
+        step = reduce(gcd, (roll - lowest for roll in events), step)
+        digits += number * log10(sum(events.values()))
+    return (span // step if step else 0) + 1, digits
@@ -1,3 +1,18 @@
+import json
+import re
+from math import log10
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
 from dicetables import (
     Parser,
     DiceTable,
@@ -8,8 +23,53 @@ from dicetables import (
     InvalidEventsError,
     DiceRecordError,
     Roller,
+    Die,
+    ModDie,
+)
+from dicetables.eventsbases.protodie import ProtoDie
+from dicetables.eventsinfo import get_fast_pct_number
+from dicetables.tools.alias_table import Alias, AliasTable
+from dicetables.tools.numberforamtter import NumberFormatter
+
+from request_handler.convolution import DEFAULT_ENGINE, DiceTablesEngine
+from request_handler.cost_model import (
+    DEFAULT_COST_MODEL,
+    Cost,
+    CostModel,
+    MemoryBudgetError,
+)
+from request_handler.die_size import estimate_dict_size
+from request_handler.downsample import MIN_POINTS, lttb
+from request_handler.result_cache import (
+    ResultCache,
+    RecordKey,
+    estimate_table_size,
+    record_key,
+)
+
+if TYPE_CHECKING:
+    # queries, rolls, statsOnly, timings, the bundle and the store are imported where they are used, so
+    # that a cold start without them does not pay for them
+    from request_handler.queries import PrefixSums
+    from request_handler.response_bundle import ResponseBundle
+    from request_handler.table_store import TableStore
+    from request_handler.timings import StageTimings
+
+ERRORS = (
+    ValueError,
+    SyntaxError,
+    AttributeError,
+    ParseError,
+    LimitsError,
+    InvalidEventsError,
+    DiceRecordError,
 )
-from dicetables.tools.alias_table import Alias
+
+_SPACES = re.compile(r"^[ \t]+|[ \t]+$|(?<=\W)[ \t]+|[ \t]+(?=\W)")
+_DIE = re.compile(r"die\(([1-9][0-9]*)\)")
+_MOD_DIE = re.compile(r"moddie\(([1-9][0-9]*),(-?(?:0|[1-9][0-9]*))\)")
+
+STREAM_CHUNK_SIZE = 2**16
 
 
 class DiceTablesRequestHandler(object):
@@ -18,9 +78,31 @@ class DiceTablesRequestHandler(object):
         max_dice_value: int = 12000,
         number_and_die_delimiter: str = "*",
         die_set_delimiter: str = "&",
+        result_cache: Optional[ResultCache] = None,
+        table_cache: Optional[ResultCache] = None,
+        engine: DiceTablesEngine = DEFAULT_ENGINE,
+        table_store: Optional["TableStore"] = None,
+        response_bundle: Optional["ResponseBundle"] = None,
+        parse_cache: Optional[ResultCache] = None,
+        max_rolls: int = 10**6,
+        max_stats_dice_value: int = 10**9,
+        index_cache: Optional[ResultCache] = None,
+        memory_budget: Optional[int] = None,
+        cost_model: CostModel = DEFAULT_COST_MODEL,
     ) -> None:
         self._parser = Parser.with_limits(ignore_case=True)
         self._max_dice_value = max_dice_value
+        self._result_cache = result_cache
+        self._table_cache = table_cache
+        self._engine = engine
+        self._table_store = table_store
+        self._response_bundle = response_bundle
+        self._parse_cache = parse_cache
+        self._max_rolls = max_rolls
+        self._max_stats_dice_value = max_stats_dice_value
+        self._index_cache = index_cache
+        self._memory_budget = memory_budget
+        self._cost_model = cost_model
         self._num_and_die_delimiter = number_and_die_delimiter
         self._die_set_delimiter = die_set_delimiter
         self._assert_delimiters()
@@ -37,6 +119,50 @@ class DiceTablesRequestHandler(object):
     def die_set_delimiter(self) -> str:
         return self._die_set_delimiter
 
+    @property
+    def result_cache(self) -> Optional[ResultCache]:
+        return self._result_cache
+
+    @property
+    def table_cache(self) -> Optional[ResultCache]:
+        return self._table_cache
+
+    @property
+    def engine(self) -> DiceTablesEngine:
+        return self._engine
+
+    @property
+    def table_store(self) -> Optional["TableStore"]:
+        return self._table_store
+
+    @property
+    def response_bundle(self) -> Optional["ResponseBundle"]:
+        return self._response_bundle
+
+    @property
+    def parse_cache(self) -> Optional[ResultCache]:
+        return self._parse_cache
+
+    @property
+    def max_rolls(self) -> int:
+        return self._max_rolls
+
+    @property
+    def max_stats_dice_value(self) -> int:
+        return self._max_stats_dice_value
+
+    @property
+    def index_cache(self) -> Optional[ResultCache]:
+        return self._index_cache
+
+    @property
+    def memory_budget(self) -> Optional[int]:
+        return self._memory_budget
+
+    @property
+    def cost_model(self) -> CostModel:
+        return self._cost_model
+
     @staticmethod
     def allowed_delimiters() -> str:
         return "!\"#$%&'*+./;<>?@\\^`|~\t\n\r"
@@ -52,9 +178,19 @@ class DiceTablesRequestHandler(object):
                 "Delimiters may only be: {}".format(self.allowed_delimiters())
             )
 
-    def create_dice_record(self, instructions: str) -> DiceRecord:
-
+    def create_dice_record(
+        self, instructions: str, max_dice_value: Optional[int] = None
+    ) -> DiceRecord:
+        """
+        :param max_dice_value: defaults to `max_dice_value`
+        :raises ValueError: as soon as the dice so far are over max_dice_value, before the rest are parsed.
+            each die is counted with `estimate_dict_size`, and the real sizes are only measured when the
+            estimate is over.
+        """
+        if max_dice_value is None:
+            max_dice_value = self.max_dice_value
         record = DiceRecord.new()
+        size = 0
 
         if instructions.strip() == "":
             number_die_pairs = []
@@ -68,78 +204,644 @@ class DiceTablesRequestHandler(object):
             else:
                 num, die = pair.split(self.number_and_die_delimiter)
                 number = int(num)
-            die = self._parser.parse_die(die)
+            if number > 0 and size + number > max_dice_value:
+                size = record_size(record)
+                if size + number > max_dice_value:
+                    raise ValueError(
+                        f"Record: {record} and {pair.strip()} have a sum of dictionaries "
+                        f"greater than {max_dice_value}"
+                    )
+            die = self.parse_die(die)
             record = record.add_die(die, number)
+            size += estimate_dict_size(die) * number
+            if size > max_dice_value:
+                self.assert_dice_record_within_limits(record, max_dice_value)
+                size = record_size(record)
         return record
 
-    def assert_dice_record_within_limits(self, record: DiceRecord) -> None:
-        all_record_dicts = sum(
-            len(die.get_dict()) * number for die, number in record.get_dict().items()
-        )
-        if all_record_dicts > self.max_dice_value:
+    def parse_die(self, die_string: str) -> ProtoDie:
+        """
+        parses with the parse cache, keyed on `normalize_die_string`. Die(n) and ModDie(n, m) within the
+        parser's limits skip the parser.
+        """
+        if self._parse_cache is None:
+            return self._parse_die(die_string)
+
+        key = normalize_die_string(die_string)
+        die = self._parse_cache.get(key)
+        if die is None:
+            die = self._parse_die(die_string, key)
+            self._parse_cache.put(key, die)
+        return die
+
+    def _parse_die(self, die_string: str, key: Optional[str] = None) -> ProtoDie:
+        if key is None:
+            key = normalize_die_string(die_string)
+        max_size = self._parser.checker.max_size
+        match = _DIE.fullmatch(key)
+        if match and int(match.group(1)) <= max_size:
+            return Die(int(match.group(1)))
+        match = _MOD_DIE.fullmatch(key)
+        if match and int(match.group(1)) <= max_size:
+            return ModDie(int(match.group(1)), int(match.group(2)))
+        return self._parser.parse_die(die_string)
+
+    def assert_dice_record_within_limits(
+        self, record: DiceRecord, max_dice_value: Optional[int] = None
+    ) -> None:
+        """:param max_dice_value: defaults to `max_dice_value`"""
+        if max_dice_value is None:
+            max_dice_value = self.max_dice_value
+        all_record_dicts = record_size(record)
+        if all_record_dicts > max_dice_value:
             raise ValueError(
-                f"Record: {record} has a sum of dictionaries greater than {self.max_dice_value}"
+                f"Record: {record} has a sum of dictionaries greater than {max_dice_value}"
             )
 
-    def get_response(self, input_str):
-        errors = (
-            ValueError,
-            SyntaxError,
-            AttributeError,
-            ParseError,
-            LimitsError,
-            InvalidEventsError,
-            DiceRecordError,
+    def estimate_cost(self, record: DiceRecord) -> Cost:
+        """the peak bytes and cpu seconds of building the record's table and its full response"""
+        return self._cost_model.estimate(record)
+
+    def assert_within_memory_budget(self, record: DiceRecord) -> None:
+        """
+        :raises MemoryBudgetError: if the cost model predicts more than memory_budget bytes. with no
+            budget, nothing is checked.
+        """
+        if self._memory_budget is None:
+            return
+        peak_bytes = self.estimate_cost(record).peak_bytes
+        if peak_bytes > self._memory_budget:
+            raise MemoryBudgetError(
+                f"Record: {record} needs about {peak_bytes / 2**20:.1f} MiB, more than the memory "
+                f"budget of {self._memory_budget / 2**20:.1f} MiB"
+            )
+
+    def assert_rolls_within_limits(self, rolls: int) -> None:
+        if not _is_int(rolls) or not 0 < rolls <= self._max_rolls:
+            raise ValueError(f"rolls must be an integer from 1 to {self._max_rolls}")
+
+    def get_response(
+        self,
+        input_str,
+        fields: Optional[Iterable[str]] = None,
+        timings: Optional["StageTimings"] = None,
+        queries: Optional[list] = None,
+        query_format: str = "percent",
+        max_points: Optional[int] = None,
+    ):
+        """
+        :param fields: the keys of the answer. see `make_dict`. with queries, defaults to none.
+        :param timings: records the stages: parse, table (building or loading it), then those of `make_dict`.
+            an answer from the result cache or the bundle has no table stages. queries add table and index,
+            unless the index is cached, then queries. max_points adds downsample.
+        :param queries: rolls and [low, high] ranges, answered in "queries". see `request_handler.queries`
+        :param query_format: "percent" or "fraction"
+        :param max_points: the most points in data. see `request_handler.downsample`
+        """
+        try:
+            assert_max_points(max_points)
+            if queries is not None:
+                from request_handler.queries import QUERY_FORMATS, parse_queries
+
+                queries = parse_queries(queries)
+                if query_format not in QUERY_FORMATS:
+                    raise ValueError(
+                        f"queryFormat must be one of {list(QUERY_FORMATS)}"
+                    )
+            record = _timed(timings, "parse", self.create_dice_record, input_str)
+            if queries is None:
+                answer = self._get_dict(record, self._table_cache, fields, timings)
+            else:
+                answer = self._get_query_dict(
+                    record, fields, queries, query_format, timings
+                )
+            return _downsample(answer, max_points, timings)
+        except ERRORS as e:
+            return _get_error_dict(e)
+
+    def get_responses(
+        self,
+        input_strs: List[str],
+        fields: Optional[Iterable[str]] = None,
+        timings: Optional["StageTimings"] = None,
+        max_points: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        the responses for many requests, in the same order. every record is parsed first, then the sub-tables
+        that records share are built once, then each table is built from them. an error in one request
+        is only reported in its own response.
+
+        :param fields: the keys of every answer. see `make_dict`
+        :param timings: the stages of `get_response`, added up over all requests, and sharedTables
+        :param max_points: the most points in the data of every answer
+        """
+        try:
+            assert_max_points(max_points)
+        except ValueError as e:
+            return [_get_error_dict(e) for _ in input_strs]
+
+        responses: Dict[int, dict] = {}
+        records: Dict[int, DiceRecord] = {}
+        for index, input_str in enumerate(input_strs):
+            try:
+                record = _timed(timings, "parse", self.create_dice_record, input_str)
+                records[index] = record
+            except ERRORS as e:
+                responses[index] = _get_error_dict(e)
+
+        table_cache = self._table_cache
+        if table_cache is None:
+            table_cache = ResultCache(
+                max_entries=2 * len(records), sizer=estimate_table_size
+            )
+        _timed(
+            timings,
+            "sharedTables",
+            self._build_shared_tables,
+            list(records.values()),
+            table_cache,
         )
 
+        for index in sorted(records, key=lambda el: record_size(records[el])):
+            try:
+                answer = self._get_dict(records[index], table_cache, fields, timings)
+                responses[index] = _downsample(answer, max_points, timings)
+            except ERRORS as e:
+                responses[index] = _get_error_dict(e)
+        return [responses[index] for index in range(len(input_strs))]
+
+    def get_rolls(
+        self,
+        input_str: str,
+        rolls: int,
+        seed: Optional[int] = None,
+        roll_format: str = "histogram",
+        timings: Optional["StageTimings"] = None,
+    ) -> dict:
+        """
+        rolls of the table, made on the server. see `request_handler.rolls`.
+
+        :param seed: the same seed and table give the same rolls. defaults to a random seed.
+        :param roll_format: "histogram" or "packed"
+        :param timings: records the stages: parse, table, rolls
+        :return: {"rolls": rolls, "seed": seed, roll_format: the rolls}
+        """
+        from random import Random, randrange
+
+        from request_handler.rolls import ROLL_FORMATS
+
+        try:
+            self.assert_rolls_within_limits(rolls)
+            if seed is None:
+                seed = randrange(2**32)
+            if not _is_int(seed):
+                raise ValueError("seed must be an integer")
+            if roll_format not in ROLL_FORMATS:
+                raise ValueError(f"rollFormat must be one of {list(ROLL_FORMATS)}")
+            record = _timed(timings, "parse", self.create_dice_record, input_str)
+            table = _timed(timings, "table", self._get_table, record, self._table_cache)
+            alias_table = AliasTable(table.get_dict())
+            answer = _timed(
+                timings,
+                "rolls",
+                ROLL_FORMATS[roll_format],
+                alias_table,
+                rolls,
+                Random(seed),
+            )
+        except ERRORS as e:
+            return _get_error_dict(e)
+        return {"rolls": rolls, "seed": seed, roll_format: answer}
+
+    def get_stats(
+        self,
+        input_str: str,
+        fields: Optional[Iterable[str]] = None,
+        timings: Optional["StageTimings"] = None,
+    ) -> dict:
+        """
+        range, mean and stddev, as `get_response` gives them, from the dice without building the table.
+        see `request_handler.stats`. the record may be up to `max_stats_dice_value`.
+
+        :param fields: some of STATS_FIELDS. defaults to all of them.
+        :param timings: records the stages: parse, stats
+        """
+        from request_handler.stats import STATS_FIELDS, get_record_stats
+
+        try:
+            fields = get_fields(STATS_FIELDS if fields is None else fields)
+            if not set(fields).issubset(STATS_FIELDS):
+                raise ValueError(f"statsOnly fields may only be {list(STATS_FIELDS)}")
+            record = _timed(
+                timings,
+                "parse",
+                self.create_dice_record,
+                input_str,
+                self._max_stats_dice_value,
+            )
+            stats = _timed(timings, "stats", get_record_stats, record)
+        except ERRORS as e:
+            return _get_error_dict(e)
+        return {field: stats[field] for field in fields}
+
+    def iter_response(
+        self, input_str: str, fields: Optional[Iterable[str]] = None
+    ) -> Iterator[str]:
+        """
+        the JSON of `get_response`, in pieces. a new table is written a row at a time by `iter_json`, so the
+        whole response is never in memory. answers from the result cache or the bundle and errors are one
+        piece. nothing is added to the result cache.
+        """
         try:
             record = self.create_dice_record(input_str)
-            self.assert_dice_record_within_limits(record)
-            table = construct_dice_table(record)
-            return make_dict(table)
-        except errors as e:
-            return {"errorMessage": e.args[0], "errorType": e.__class__.__name__}
+            fields = get_fields(fields)
+            answer = self._get_stored_dict(record, fields)
+            if answer is None:
+                return iter_json(self._get_table(record, self._table_cache), fields)
+        except ERRORS as e:
+            answer = _get_error_dict(e)
+        return iter([json.dumps(answer)])
+
+    def _get_dict(
+        self,
+        record: DiceRecord,
+        table_cache: Optional[ResultCache],
+        fields: Optional[Iterable[str]],
+        timings: Optional["StageTimings"] = None,
+    ) -> dict:
+        fields = get_fields(fields)
+        if self._result_cache is None:
+            return self._make_dict(record, table_cache, fields, timings)
+
+        key = (record_key(record), fields)
+        answer = self._result_cache.get(key)
+        if answer is None:
+            answer = self._make_dict(record, table_cache, fields, timings)
+            self._result_cache.put(key, answer)
+        return answer
+
+    def _make_dict(
+        self,
+        record: DiceRecord,
+        table_cache: Optional[ResultCache],
+        fields: Tuple[str, ...],
+        timings: Optional["StageTimings"] = None,
+    ) -> dict:
+        bundled = self._get_bundled_dict(record, fields)
+        if bundled is not None:
+            return bundled
+        table = _timed(timings, "table", self._get_table, record, table_cache)
+        return make_dict(table, fields, timings)
+
+    def _get_stored_dict(
+        self, record: DiceRecord, fields: Tuple[str, ...]
+    ) -> Optional[dict]:
+        if self._result_cache is not None:
+            answer = self._result_cache.get((record_key(record), fields))
+            if answer is not None:
+                return answer
+        return self._get_bundled_dict(record, fields)
+
+    def _get_bundled_dict(
+        self, record: DiceRecord, fields: Tuple[str, ...]
+    ) -> Optional[dict]:
+        if self._response_bundle is None:
+            return None
+        bundled = self._response_bundle.get(record)
+        if bundled is None or not bundled.keys() >= set(fields):
+            return None
+        return {field: bundled[field] for field in fields}
+
+    def _build_shared_tables(
+        self, records: List[DiceRecord], table_cache: ResultCache
+    ) -> None:
+        for shared in _get_shared_sub_records(records):
+            if (
+                self._memory_budget is None
+                or self.estimate_cost(shared).peak_bytes <= self._memory_budget
+            ):
+                construct_dice_table(shared, table_cache, self._engine)
+
+    def _get_query_dict(
+        self,
+        record: DiceRecord,
+        fields: Optional[Iterable[str]],
+        queries: list,
+        query_format: str,
+        timings: Optional["StageTimings"] = None,
+    ) -> dict:
+        from request_handler.queries import answer_queries
+
+        answer = {}
+        if fields is not None:
+            answer = self._get_dict(record, self._table_cache, fields, timings)
+        prefix_sums = self._get_prefix_sums(record, timings)
+        query_answers = _timed(
+            timings, "queries", answer_queries, prefix_sums, queries, query_format
+        )
+        return dict(answer, queries=query_answers)
+
+    def _get_prefix_sums(
+        self, record: DiceRecord, timings: Optional["StageTimings"] = None
+    ) -> "PrefixSums":
+        from request_handler.queries import PrefixSums
+
+        key = record_key(record)
+        if self._index_cache is not None:
+            prefix_sums = self._index_cache.get(key)
+            if prefix_sums is not None:
+                return prefix_sums
+
+        table = _timed(timings, "table", self._get_table, record, self._table_cache)
+        prefix_sums = _timed(timings, "index", PrefixSums, table)
+        if self._index_cache is not None:
+            self._index_cache.put(key, prefix_sums)
+        return prefix_sums
 
+    def _get_table(
+        self, record: DiceRecord, table_cache: Optional[ResultCache]
+    ) -> DiceTable:
+        self.assert_within_memory_budget(record)
+        if self._table_store is None:
+            return construct_dice_table(record, table_cache, self._engine)
 
-def construct_dice_table(record: DiceRecord) -> DiceTable:
-    table = DiceTable.new()
-    for die, number in record.get_dict().items():
-        table = table.add_die(die, number)
+        # the table cache is much faster than reading the store
+        key = record_key(record)
+        if table_cache is not None and key in table_cache:
+            return table_cache.get(key)
+        table = self._table_store.get(record)
+        if table is None:
+            table = construct_dice_table(record, table_cache, self._engine)
+            self._table_store.put(table)
+        elif table_cache is not None:
+            table_cache.put(key, table)
+        return table
+
+
+def _get_error_dict(error: Exception) -> dict:
+    return {"errorMessage": error.args[0], "errorType": error.__class__.__name__}
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def assert_max_points(max_points: Optional[int]) -> None:
+    if max_points is not None and (not _is_int(max_points) or max_points < MIN_POINTS):
+        raise ValueError(f"maxPoints must be an integer of at least {MIN_POINTS}")
+
+
+def _downsample(
+    answer: dict, max_points: Optional[int], timings: Optional["StageTimings"] = None
+) -> dict:
+    """a new answer with at most max_points in data. answers without data are returned as they are"""
+    if max_points is None or "data" not in answer:
+        return answer
+    data = answer["data"]
+    x_axis, y_axis = _timed(
+        timings, "downsample", lttb, data["x"], data["y"], max_points
+    )
+    return dict(answer, data={"x": x_axis, "y": y_axis})
+
+
+def _timed(
+    timings: Optional["StageTimings"], name: str, function: Callable, *args: Any
+) -> Any:
+    """function(*args), as the stage `name` of timings"""
+    if timings is None:
+        return function(*args)
+    with timings.stage(name):
+        return function(*args)
+
+
+def normalize_die_string(die_string: str) -> str:
+    """
+    lower case, without the spaces and tabs that the parser ignores. spaces between two numbers or names
+    are kept, so "Die(1 2)" is still an error.
+    """
+    return _SPACES.sub("", die_string).lower()
+
+
+def record_size(record: DiceRecord) -> int:
+    """the sum of len(die.get_dict()) * number for every die in the record"""
+    return sum(
+        len(die.get_dict()) * number for die, number in record.get_dict().items()
+    )
+
+
+def construct_dice_table(
+    record: DiceRecord,
+    table_cache: Optional[ResultCache] = None,
+    engine: DiceTablesEngine = DEFAULT_ENGINE,
+) -> DiceTable:
+    """
+    :param table_cache: tables already built, keyed by `record_key`. when given, the table starts from
+        the largest cached sub-record and only the missing dice are added. the new table is then cached.
+    :param engine: adds the dice to the table
+    """
+    if table_cache is None:
+        return engine.add_dice(DiceTable.new(), record.get_dict())
+
+    key = record_key(record)
+    table = table_cache.get(key)
+    if table is None:
+        start = _get_largest_sub_table(record, table_cache)
+        missing = {
+            die: number - start.number_of_dice(die)
+            for die, number in record.get_dict().items()
+        }
+        table = engine.add_dice(start, missing)
+        table_cache.put(key, table)
     return table
 
 
-def make_dict(dice_table: DiceTable):
-    calc = EventsCalculations(dice_table)
-    out = dict()
-    out["diceStr"] = "\n".join(
+def _get_largest_sub_table(record: DiceRecord, table_cache: ResultCache) -> DiceTable:
+    dice = record.get_dict()
+    sizes = {repr(die): len(die.get_dict()) for die in dice}
+    numbers = {repr(die): number for die, number in dice.items()}
+
+    best_key: Optional[RecordKey] = None
+    best_size = 0
+    for key in table_cache.keys():
+        if not isinstance(key, tuple) or not _is_sub_record(key, numbers):
+            continue
+        size = sum(sizes[die_repr] * number for die_repr, number in key)
+        if size > best_size:
+            best_key, best_size = key, size
+
+    if best_key is None:
+        return DiceTable.new()
+    return table_cache.get(best_key)
+
+
+def _get_shared_sub_records(records: List[DiceRecord]) -> List[DiceRecord]:
+    """
+    for each record, the largest sub-record it shares with any other record, smallest first.
+    records that are sub-records of others are included as themselves.
+    """
+    shared: Dict[RecordKey, DiceRecord] = {}
+    for index, record in enumerate(records):
+        best = None
+        best_size = 0
+        for other_index, other in enumerate(records):
+            if other_index == index:
+                continue
+            common = _get_common_record(record, other)
+            size = record_size(common)
+            if size > best_size:
+                best, best_size = common, size
+        if best is not None:
+            shared[record_key(best)] = best
+    return sorted(shared.values(), key=record_size)
+
+
+def _get_common_record(first: DiceRecord, second: DiceRecord) -> DiceRecord:
+    second_dict = second.get_dict()
+    return DiceRecord(
+        {
+            die: min(number, second_dict[die])
+            for die, number in first.get_dict().items()
+            if die in second_dict
+        }
+    )
+
+
+def _is_sub_record(key: RecordKey, numbers: Dict[str, int]) -> bool:
+    return all(number <= numbers.get(die_repr, 0) for die_repr, number in key)
+
+
+def make_dict(
+    dice_table: DiceTable,
+    fields: Optional[Iterable[str]] = None,
+    timings: Optional["StageTimings"] = None,
+) -> dict:
+    """
+    :param fields: the keys of the answer. defaults to all of FIELDS. OPTIONAL_FIELDS are only added when
+        they are asked for. only the sections that are asked for are computed.
+    :param timings: records the stages: calculations (EventsCalculations), then one per field
+    """
+    if timings is None:
+        calc = EventsCalculations(dice_table)
+        return {
+            field: _SECTIONS[field](dice_table, calc) for field in get_fields(fields)
+        }
+
+    with timings.stage("calculations"):
+        calc = EventsCalculations(dice_table)
+    answer = {}
+    for field in get_fields(fields):
+        with timings.stage(field):
+            answer[field] = _SECTIONS[field](dice_table, calc)
+    return answer
+
+
+def get_fields(fields: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    """
+    :return: the requested fields in the order of FIELDS and OPTIONAL_FIELDS. raises ValueError for unknown
+        fields.
+    """
+    if fields is None:
+        return FIELDS
+    if isinstance(fields, str):
+        raise ValueError("fields must be a list of strings")
+    requested = set(fields)
+    unknown = requested.difference(_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {sorted(map(str, unknown))}")
+    return tuple(field for field in _SECTIONS if field in requested)
+
+
+def _get_dice_str(dice_table: DiceTable, _: EventsCalculations) -> str:
+    return "\n".join(
         ["{!r}: {}".format(die, number) for die, number in dice_table.get_list()]
     )
-    out["name"] = repr(dice_table)
 
+
+def _get_name(dice_table: DiceTable, _: EventsCalculations) -> str:
+    return repr(dice_table)
+
+
+def _get_data(_: DiceTable, calc: EventsCalculations) -> dict:
     x_axis, y_axis = calc.percentage_axes()
-    out["data"] = {"x": x_axis, "y": y_axis}
-    out["tableString"] = calc.full_table_string()
+    return {"x": x_axis, "y": y_axis}
+
+
+def _get_table_string(_: DiceTable, calc: EventsCalculations) -> str:
+    return calc.full_table_string()
+
+
+def _get_for_scinum(_: DiceTable, calc: EventsCalculations) -> List[dict]:
+    return [
+        _get_sci_num(roll, occurrences)
+        for roll, occurrences in calc.info.all_events_include_zeroes()
+    ]
 
-    lines = calc.full_table_string(6, -1).split("\n")
-    for_scinum = [_get_json(el) for el in lines if el]
 
-    out["forSciNum"] = for_scinum
+def _get_range(_: DiceTable, calc: EventsCalculations) -> Tuple[int, int]:
+    return calc.info.events_range()
 
-    out["range"] = calc.info.events_range()
-    out["mean"] = round(calc.mean(), 3)
-    out["stddev"] = calc.stddev(3)
 
-    out["roller"] = _get_roller_data(dice_table)
-    return out
+def _get_mean(_: DiceTable, calc: EventsCalculations) -> float:
+    return round(calc.mean(), 3)
 
 
-def _get_json(full_table_str_line):
-    roll, number = full_table_str_line.split(": ")
-    if number == "0":
-        mantissa = exponent = "0"
-    else:
-        mantissa, exponent = number.split("e+")
-    return {"roll": int(roll), "mantissa": mantissa, "exponent": exponent}
+def _get_stddev(_: DiceTable, calc: EventsCalculations) -> float:
+    return calc.stddev(3)
+
+
+def _get_roller(dice_table: DiceTable, _: EventsCalculations) -> dict:
+    return _get_roller_data(dice_table)
+
+
+def _get_compact_roller(dice_table: DiceTable, _: EventsCalculations) -> dict:
+    return _get_compact_roller_data(dice_table)
+
+
+_SECTIONS: Dict[str, Callable[[DiceTable, EventsCalculations], Any]] = {
+    "diceStr": _get_dice_str,
+    "name": _get_name,
+    "data": _get_data,
+    "tableString": _get_table_string,
+    "forSciNum": _get_for_scinum,
+    "range": _get_range,
+    "mean": _get_mean,
+    "stddev": _get_stddev,
+    "roller": _get_roller,
+    "compactRoller": _get_compact_roller,
+}
+
+OPTIONAL_FIELDS = ("compactRoller",)
+FIELDS = tuple(field for field in _SECTIONS if field not in OPTIONAL_FIELDS)
+
+
+def _get_sci_num(roll: int, occurrences: int) -> dict:
+    """
+    the same mantissa and exponent as EventsCalculations.full_table_string(6, -1), without the string
+    round trip. occurrences that fit in a float are rounded as a float. bigger ones are truncated with
+    exact integer division first.
+    """
+    if not occurrences:
+        return {"roll": roll, "mantissa": "0", "exponent": "0"}
+    try:
+        sci_num = "{:.5e}".format(occurrences)
+        mantissa, exponent = sci_num[:7], int(sci_num[9:])
+    except OverflowError:
+        mantissa, exponent = _get_huge_mantissa_and_exponent(occurrences)
+    return {"roll": roll, "mantissa": mantissa, "exponent": str(exponent)}
+
+
+def _get_huge_mantissa_and_exponent(occurrences: int) -> Tuple[str, int]:
+    shown_digits = 6
+    extra_digits = 10
+    exponent = int(log10(occurrences))
+    truncated = occurrences // 10 ** (exponent - shown_digits - extra_digits)
+    mantissa = round(
+        truncated / 10.0 ** (shown_digits + extra_digits), shown_digits - 1
+    )
+    if mantissa == 10.0:
+        mantissa /= 10.0
+        exponent += 1
+    return "{:.5f}".format(mantissa), exponent
 
 
 def _get_roller_data(dice_table: DiceTable):
@@ -156,3 +858,143 @@ def _get_alias_dict(alias: Alias):
         "alternate": str(alias.alternate),
         "primaryHeight": str(alias.primary_height),
     }
+
+
+def _get_compact_roller_data(dice_table: DiceTable) -> dict:
+    """
+    the roller's aliases as parallel lists. rolls are numbers. a primaryHeight equal to the shared height
+    (an alias that always gives its primary) is null.
+    """
+    alias_table = Roller(dice_table).alias_table
+    height = alias_table.height
+    aliases = alias_table.to_list()
+    return {
+        "height": str(height),
+        "primaries": [alias.primary for alias in aliases],
+        "alternates": [alias.alternate for alias in aliases],
+        "primaryHeights": [_get_compact_height(alias, height) for alias in aliases],
+    }
+
+
+def _get_compact_height(alias: Alias, height: int) -> Optional[str]:
+    if alias.primary_height == height:
+        return None
+    return str(alias.primary_height)
+
+
+def iter_json(
+    dice_table: DiceTable,
+    fields: Optional[Iterable[str]] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[str]:
+    """
+    json.dumps(make_dict(dice_table, fields)) in pieces of about chunk_size characters. data, tableString,
+    forSciNum, roller and compactRoller are encoded a row at a time, so memory use does not grow with the
+    response.
+    """
+    fields = get_fields(fields)
+    calc = EventsCalculations(dice_table)
+    small_sections = make_dict(
+        dice_table, [field for field in fields if field not in _STREAMED_SECTIONS]
+    )
+    pieces = []
+    size = 0
+    for piece in _iter_json_pieces(dice_table, calc, fields, small_sections):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(pieces)
+            pieces = []
+            size = 0
+    if pieces:
+        yield "".join(pieces)
+
+
+def _iter_json_pieces(
+    dice_table: DiceTable,
+    calc: EventsCalculations,
+    fields: Tuple[str, ...],
+    small_sections: dict,
+) -> Iterator[str]:
+    yield "{"
+    for index, field in enumerate(fields):
+        if index:
+            yield ", "
+        yield f"{json.dumps(field)}: "
+        if field in _STREAMED_SECTIONS:
+            yield from _STREAMED_SECTIONS[field](dice_table, calc)
+        else:
+            yield json.dumps(small_sections[field])
+    yield "}"
+
+
+def _iter_events(calc: EventsCalculations) -> Iterator[Tuple[int, int]]:
+    """calc.info.all_events_include_zeroes(), without the list"""
+    start, stop = calc.info.events_range()
+    return (calc.info.get_event(event) for event in range(start, stop + 1))
+
+
+def _iter_list(values: Iterable[Any]) -> Iterator[str]:
+    yield "["
+    for index, value in enumerate(values):
+        yield ", " + json.dumps(value) if index else json.dumps(value)
+    yield "]"
+
+
+def _iter_data(_: DiceTable, calc: EventsCalculations) -> Iterator[str]:
+    total = calc.info.total_occurrences()
+    yield '{"x": '
+    yield from _iter_list(event for event, _ in _iter_events(calc))
+    yield ', "y": '
+    yield from _iter_list(
+        get_fast_pct_number(occurrences, total) for _, occurrences in _iter_events(calc)
+    )
+    yield "}"
+
+
+def _iter_table_string(_: DiceTable, calc: EventsCalculations) -> Iterator[str]:
+    """calc.full_table_string() a line at a time. JSON escapes each character alone, so lines can be joined"""
+    formatter = NumberFormatter(shown_digits=4, max_comma_exp=6)
+    right_just = max(len(str(event)) for event in calc.info.events_range())
+    yield '"'
+    for event, occurrences in _iter_events(calc):
+        line = "{:>{}}: {}\n".format(event, right_just, formatter.format(occurrences))
+        yield json.dumps(line)[1:-1]
+    yield '"'
+
+
+def _iter_for_scinum(_: DiceTable, calc: EventsCalculations) -> Iterator[str]:
+    return _iter_list(
+        _get_sci_num(event, occurrences) for event, occurrences in _iter_events(calc)
+    )
+
+
+def _iter_roller(dice_table: DiceTable, _: EventsCalculations) -> Iterator[str]:
+    alias_table = Roller(dice_table).alias_table
+    yield f'{{"height": {json.dumps(str(alias_table.height))}, "aliases": '
+    yield from _iter_list(_get_alias_dict(alias) for alias in alias_table.to_list())
+    yield "}"
+
+
+def _iter_compact_roller(dice_table: DiceTable, _: EventsCalculations) -> Iterator[str]:
+    alias_table = Roller(dice_table).alias_table
+    height = alias_table.height
+    aliases = alias_table.to_list()
+    yield f'{{"height": {json.dumps(str(height))}, "primaries": '
+    yield from _iter_list(alias.primary for alias in aliases)
+    yield ', "alternates": '
+    yield from _iter_list(alias.alternate for alias in aliases)
+    yield ', "primaryHeights": '
+    yield from _iter_list(_get_compact_height(alias, height) for alias in aliases)
+    yield "}"
+
+
+_STREAMED_SECTIONS: Dict[
+    str, Callable[[DiceTable, EventsCalculations], Iterator[str]]
+] = {
+    "data": _iter_data,
+    "tableString": _iter_table_string,
+    "forSciNum": _iter_for_scinum,
+    "roller": _iter_roller,
+    "compactRoller": _iter_compact_roller,
+}
@@ -0,0 +1,91 @@
+"""
+Cheap upper bounds on len(die.get_dict()), from the parameters of each die type.
+
+An estimate is never less than the real size, so a record whose estimated size is within limits is within
+limits. Only an estimate over the limit needs the real size.
+"""
+
+from math import factorial
+from typing import Callable, Dict, Type
+
+from dicetables import (
+    Die,
+    ModDie,
+    StrongDie,
+    Modifier,
+    Exploding,
+    ExplodingOn,
+    BestOfDicePool,
+    WorstOfDicePool,
+    UpperMidOfDicePool,
+    LowerMidOfDicePool,
+)
+from dicetables.dicepool_collection import DicePoolCollection
+from dicetables.eventsbases.protodie import ProtoDie
+
+
+def estimate_dict_size(die: ProtoDie) -> int:
+    """
+    an upper bound on len(die.get_dict()). exact for Modifier, Die and ModDie. die types without an
+    estimator, like WeightedDie, use the real size.
+    """
+    estimator = _ESTIMATORS.get(type(die))
+    if estimator is None:
+        return len(die.get_dict())
+    return estimator(die)
+
+
+def _estimate_die(die: Die) -> int:
+    return die.get_size()
+
+
+def _estimate_strong_die(die: StrongDie) -> int:
+    return estimate_dict_size(die.get_input_die())
+
+
+def _estimate_exploding(die: Exploding) -> int:
+    """each explosion level is the input die shifted by one more highest roll"""
+    return (die.get_explosions() + 1) * estimate_dict_size(die.get_input_die())
+
+
+def _estimate_exploding_on(die: ExplodingOn) -> int:
+    """
+    each explosion level is the input die shifted by a sum of `level` explodes_on values. there are at
+    most _comb(level + values - 1, level) of those sums.
+    """
+    values = len(die.get_explodes_on())
+    input_size = estimate_dict_size(die.get_input_die())
+    return input_size * sum(
+        _comb(level + values - 1, level) for level in range(die.get_explosions() + 1)
+    )
+
+
+def _estimate_pool(die: DicePoolCollection) -> int:
+    """
+    every roll is a sum of `select` input rolls: at most one per multiset of input rolls, and at most one
+    per value between the lowest and highest sums.
+    """
+    input_dict = die.get_pool().die.get_dict()
+    select = die.get_select()
+    multisets = _comb(len(input_dict) + select - 1, select)
+    span = select * (max(input_dict) - min(input_dict)) + 1
+    return min(multisets, span)
+
+
+def _comb(n: int, k: int) -> int:
+    """math.comb, which the python 3.7 lambda runtime does not have"""
+    return factorial(n) // (factorial(k) * factorial(n - k))
+
+
+_ESTIMATORS: Dict[Type[ProtoDie], Callable[[ProtoDie], int]] = {
+    Modifier: lambda die: 1,
+    Die: _estimate_die,
+    ModDie: _estimate_die,
+    StrongDie: _estimate_strong_die,
+    Exploding: _estimate_exploding,
+    ExplodingOn: _estimate_exploding_on,
+    BestOfDicePool: _estimate_pool,
+    WorstOfDicePool: _estimate_pool,
+    UpperMidOfDicePool: _estimate_pool,
+    LowerMidOfDicePool: _estimate_pool,
+}
@@ -0,0 +1,55 @@
+"""
+Fewer points of data for charts, by largest-triangle-three-buckets (Steinarsson, 2013).
+
+The first and last points are kept. The points between are split into max_points - 2 buckets of nearly
+equal size, and each bucket keeps the point that makes the largest triangle with the point kept before
+it and the mean of the next bucket. Every point kept is a real point of the table, and peaks and edges
+are kept where averaging would flatten them.
+"""
+
+from typing import Sequence, Tuple
+
+MIN_POINTS = 3
+
+
+def lttb(
+    x: Sequence[float], y: Sequence[float], max_points: int
+) -> Tuple[tuple, tuple]:
+    """
+    :param max_points: at least MIN_POINTS. with as many points as the data or more, x and y are returned
+        as tuples.
+    :return: (x, y) of at most max_points points, in order
+    """
+    if max_points < MIN_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_POINTS}")
+    length = len(x)
+    if length <= max_points:
+        return tuple(x), tuple(y)
+
+    every = (length - 2) / (max_points - 2)
+    bounds = [int(bucket * every) + 1 for bucket in range(max_points - 2)]
+    bounds.append(length - 1)
+
+    kept = [0]
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = bounds[bucket], bounds[bucket + 1]
+        next_stop = bounds[bucket + 2] if bucket + 2 < len(bounds) else length
+        next_size = next_stop - stop
+        mean_x = sum(x[stop:next_stop]) / next_size
+        mean_y = sum(y[stop:next_stop]) / next_size
+
+        previous_x, previous_y = x[previous], y[previous]
+        width = mean_x - previous_x
+        height = mean_y - previous_y
+        # twice the area of the triangle
+        best = max(
+            range(start, stop),
+            key=lambda index: abs(
+                width * (y[index] - previous_y) - height * (x[index] - previous_x)
+            ),
+        )
+        kept.append(best)
+        previous = best
+    kept.append(length - 1)
+    return tuple(x[index] for index in kept), tuple(y[index] for index in kept)
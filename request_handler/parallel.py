@@ -0,0 +1,175 @@
+"""
+Build the tables of different dice in parallel, in worker processes.
+
+Each die's k-fold events are found in its own worker, and the results are merged two at a time, also in
+the pool, until two are left to merge in this process. A record of one kind of die is not split: with
+repeated squaring, the last multiplication at full size costs as much as the rest, so halves in two
+workers would not finish sooner.
+
+Starting the pool costs more than adding small dice, so it is only used when the dice being added are
+at least min_size, there are at least two kinds of them, and more than one cpu is available. When a
+pool cannot be started (AWS Lambda has no /dev/shm for its locks), dice are added one after another.
+When a worker dies and breaks the pool, those dice are added in this process and the next dice start a
+new pool.
+"""
+
+import os
+import threading
+from logging import getLogger
+from typing import TYPE_CHECKING, Dict, Optional
+
+from dicetables import DiceTable
+from dicetables.eventsbases.protodie import ProtoDie
+from dicetables.tools.dictcombiner import DictCombiner
+
+from request_handler.convolution import (
+    DEFAULT_ENGINE,
+    DiceTablesEngine,
+    convolve,
+    is_dense,
+)
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+logger = getLogger(__name__)
+
+
+class ParallelEngine(DiceTablesEngine):
+    def __init__(
+        self,
+        engine: DiceTablesEngine = DEFAULT_ENGINE,
+        min_size: int = 2000,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        """
+        :param engine: adds the dice in each worker, and every die when the pool is not used
+        :param min_size: the sum of number * len(die.get_dict()) of the dice being added must be at least this
+        :param max_workers: the size of the pool. defaults to `available_cpus`. 1 or less never starts it.
+        """
+        self._engine = engine
+        self._min_size = min_size
+        self._max_workers = available_cpus() if max_workers is None else max_workers
+        self._executor: Optional["Executor"] = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._broken = False
+
+    @property
+    def engine(self) -> DiceTablesEngine:
+        return self._engine
+
+    @property
+    def min_size(self) -> int:
+        return self._min_size
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @max_workers.setter
+    def max_workers(self, max_workers: int) -> None:
+        """the size of the next pool that is started. a running pool keeps its size"""
+        self._max_workers = max_workers
+
+    def supports(self, table: DiceTable, die: ProtoDie, number: int) -> bool:
+        return self._engine.supports(table, die, number)
+
+    def add_die(self, table: DiceTable, die: ProtoDie, number: int) -> DiceTable:
+        return self._engine.add_die(table, die, number)
+
+    def uses_pool(self, dice: Dict[ProtoDie, int]) -> bool:
+        dice = {die: number for die, number in dice.items() if number}
+        if len(dice) < 2 or self._max_workers < 2 or self._broken:
+            return False
+        size = sum(len(die.get_dict()) * number for die, number in dice.items())
+        return size >= self._min_size
+
+    def add_dice(self, table: DiceTable, dice: Dict[ProtoDie, int]) -> DiceTable:
+        executor = self._get_executor() if self.uses_pool(dice) else None
+        if executor is None:
+            return self._engine.add_dice(table, dice)
+        from concurrent.futures import BrokenExecutor
+
+        dice = {die: number for die, number in dice.items() if number}
+        try:
+            events = self._get_events_in_pool(executor, table, dice)
+        except BrokenExecutor as e:
+            logger.warning(f"adding dice one at a time, and starting a new pool: {e}")
+            self._drop_executor(executor)
+            return self._engine.add_dice(table, dice)
+
+        record = table.dice_data()
+        for die, number in dice.items():
+            record = record.add_die(die, number)
+        return DiceTable(events, record)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_events_in_pool(
+        self, executor: "Executor", table: DiceTable, dice: Dict[ProtoDie, int]
+    ) -> Dict[int, int]:
+        futures = [
+            executor.submit(get_events, self._engine, die, number)
+            for die, number in dice.items()
+        ]
+        events = [future.result() for future in futures]
+        if table.get_dict() != {0: 1}:
+            events.append(table.get_dict())
+        while len(events) > 2:
+            pairs = [
+                executor.submit(merge, events[index], events[index + 1])
+                for index in range(0, len(events) - 1, 2)
+            ]
+            leftover = events[-1:] if len(events) % 2 else []
+            events = [future.result() for future in pairs] + leftover
+        if len(events) == 2:
+            events = [merge(*events)]
+        return events[0]
+
+    def _drop_executor(self, broken: "Executor") -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False)
+
+    def _get_executor(self) -> Optional["Executor"]:
+        # multiprocessing is only imported when it is used
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # a forked copy must not use its parent's pool
+                self._executor = None
+                self._pid = os.getpid()
+            if self._executor is None and not self._broken:
+                try:
+                    self._executor = ProcessPoolExecutor(self._max_workers)
+                except (OSError, NotImplementedError) as e:
+                    # no /dev/shm for the locks, or no working semaphores at all
+                    logger.warning(f"adding dice one at a time: {e}")
+                    self._broken = True
+            return self._executor
+
+
+def available_cpus() -> int:
+    """the cpus this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_events(engine: DiceTablesEngine, die: ProtoDie, number: int) -> Dict[int, int]:
+    """the events of number * die, added by engine"""
+    return engine.add_die(DiceTable.new(), die, number).get_dict()
+
+
+def merge(first: Dict[int, int], second: Dict[int, int]) -> Dict[int, int]:
+    """the events of rolling both. dense events are convolved and the rest combined by dicetables"""
+    if is_dense(first) and is_dense(second):
+        return convolve(first, second)
+    return DictCombiner(first).combine_by_fastest(second, 1)
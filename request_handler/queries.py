@@ -0,0 +1,88 @@
+"""
+Exact answers to range queries on a table, from a prefix-sum index of its occurrences.
+
+A query is a roll t, for the chance to roll at most t, or [low, high], for the chance to roll from low to
+high inclusive. Either end may be null. [15, null] is the chance to roll at least 15.
+"""
+
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from math import gcd
+from typing import Any, List, Optional, Tuple, Union
+
+from dicetables import DiceTable
+from dicetables.eventsinfo import get_fast_pct_number
+
+from request_handler.result_cache import estimate_size
+
+QUERY_FORMATS = ("percent", "fraction")
+MAX_QUERIES = 1000
+
+Query = Tuple[Optional[int], Optional[int]]
+
+
+class PrefixSums(object):
+    def __init__(self, table: DiceTable) -> None:
+        """the sorted rolls of the table and, for each, the occurrences of all rolls before it"""
+        events = sorted(table.get_dict().items())
+        self._rolls = [roll for roll, _ in events]
+        self._sums = [0] + list(accumulate(occurrences for _, occurrences in events))
+
+    @property
+    def total(self) -> int:
+        return self._sums[-1]
+
+    def count(self, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        """the occurrences of rolls from low to high, inclusive. None is unbounded"""
+        start = 0 if low is None else bisect_left(self._rolls, low)
+        stop = len(self._rolls) if high is None else bisect_right(self._rolls, high)
+        return self._sums[stop] - self._sums[start] if stop > start else 0
+
+    def size(self) -> int:
+        """a sizer for caches of PrefixSums"""
+        return estimate_size(self._rolls) + estimate_size(self._sums)
+
+
+def parse_queries(queries: Any) -> List[Query]:
+    """
+    :return: [(low, high), ...] with None for an unbounded end
+    :raises ValueError: for anything but a list of at most MAX_QUERIES rolls and [low, high] pairs
+    """
+    if not isinstance(queries, list) or len(queries) > MAX_QUERIES:
+        raise ValueError(f"queries must be a list of at most {MAX_QUERIES}")
+    return [_parse_query(query) for query in queries]
+
+
+def _parse_query(query: Any) -> Query:
+    if _is_roll(query):
+        return None, query
+    if (
+        isinstance(query, list)
+        and len(query) == 2
+        and all(end is None or _is_roll(end) for end in query)
+    ):
+        return query[0], query[1]
+    raise ValueError(f"A query must be a roll or [low, high], not {query!r}")
+
+
+def _is_roll(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def answer_queries(
+    prefix_sums: PrefixSums, queries: List[Query], query_format: str = "percent"
+) -> List[Union[float, str]]:
+    """
+    :param query_format: "percent" for floats like data.y, "fraction" for exact "numerator/denominator"
+        strings in lowest terms
+    """
+    total = prefix_sums.total
+    counts = [prefix_sums.count(low, high) for low, high in queries]
+    if query_format == "percent":
+        return [get_fast_pct_number(count, total) for count in counts]
+    return [_get_fraction(count, total) for count in counts]
+
+
+def _get_fraction(count: int, total: int) -> str:
+    divisor = gcd(count, total)
+    return f"{count // divisor}/{total // divisor}"
@@ -0,0 +1,93 @@
+"""
+A read-only file of precomputed responses, built by build_bundle.py and shipped in the deployment zip.
+
+layout: an 8-byte big-endian header length, a JSON header, then one zlib-compressed JSON response per
+entry. the header holds the table_version the bundle was built with and {record key: [offset, length]}.
+the header is read once; each lookup is a dict lookup and one slice of the memory-mapped file.
+"""
+
+import json
+import mmap
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+from dicetables import DiceRecord
+
+from request_handler.result_cache import RecordKey, record_key
+from request_handler.table_store import table_version
+
+HEADER_LENGTH_BYTES = 8
+
+
+def write_bundle(path: str, responses: Iterable[Tuple[DiceRecord, dict]]) -> None:
+    """
+    :param responses: (record, full response from make_dict). later duplicates replace earlier ones.
+    """
+    blobs: Dict[str, bytes] = {}
+    for record, response in responses:
+        blobs[_key_str(record_key(record))] = zlib.compress(
+            json.dumps(response).encode()
+        )
+
+    entries = {}
+    offset = 0
+    for key, blob in blobs.items():
+        entries[key] = [offset, len(blob)]
+        offset += len(blob)
+    header = json.dumps({"version": table_version(), "entries": entries}).encode()
+
+    with open(path, "wb") as bundle_file:
+        bundle_file.write(len(header).to_bytes(HEADER_LENGTH_BYTES, "big"))
+        bundle_file.write(header)
+        for blob in blobs.values():
+            bundle_file.write(blob)
+
+
+class ResponseBundle(object):
+    def __init__(self, path: str) -> None:
+        """
+        a bundle built with another table_version has no entries, so stale responses are never served.
+        """
+        self._path = path
+        with open(path, "rb") as bundle_file:
+            self._data = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length = int.from_bytes(self._data[:HEADER_LENGTH_BYTES], "big")
+        self._start = HEADER_LENGTH_BYTES + header_length
+        header = json.loads(self._data[HEADER_LENGTH_BYTES : self._start])
+        self._version = header["version"]
+        self._entries: Dict[str, list] = {}
+        if self._version == table_version():
+            self._entries = header["entries"]
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entry_sizes(self) -> Dict[str, int]:
+        """{record key as JSON: compressed bytes}"""
+        return {key: length for key, (_, length) in self._entries.items()}
+
+    def get(self, record: DiceRecord) -> Optional[dict]:
+        """
+        the full response for the record, or None. the response has been through JSON, so tuples are lists.
+        """
+        location = self._entries.get(_key_str(record_key(record)))
+        if location is None:
+            return None
+        offset, length = location
+        start = self._start + offset
+        return json.loads(zlib.decompress(self._data[start : start + length]))
+
+    def close(self) -> None:
+        self._data.close()
+
+
+def _key_str(key: RecordKey) -> str:
+    return json.dumps(key)
@@ -0,0 +1,41 @@
+"""
+Alternative layouts of handler responses.
+
+The columnar layout turns each list of row dicts (forSciNum and roller aliases) into a dict of parallel
+lists, so the row keys are sent once instead of once per row.
+"""
+
+from typing import Dict, List
+
+COLUMNAR_KEYS = {
+    "forSciNum": ("roll", "mantissa", "exponent"),
+    "aliases": ("primary", "alternate", "primaryHeight"),
+}
+
+
+def to_columnar(response: dict) -> dict:
+    """
+    :param response: from DiceTablesRequestHandler.get_response or a batch of them: {"results": [...]}
+    :return: a new dict. the input is not changed.
+    """
+    if "results" in response:
+        return {
+            "results": [
+                {**result, "body": to_columnar(result["body"])}
+                for result in response["results"]
+            ]
+        }
+    answer = dict(response)
+    if "forSciNum" in answer:
+        answer["forSciNum"] = _get_columns(answer["forSciNum"], "forSciNum")
+    if "roller" in answer:
+        roller = answer["roller"]
+        answer["roller"] = {
+            **roller,
+            "aliases": _get_columns(roller["aliases"], "aliases"),
+        }
+    return answer
+
+
+def _get_columns(rows: List[dict], name: str) -> Dict[str, list]:
+    return {key: [row[key] for row in rows] for key in COLUMNAR_KEYS[name]}
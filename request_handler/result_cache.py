@@ -0,0 +1,139 @@
+"""
+A bounded, least-recently-used cache for handler results, keyed on the canonical form of a DiceRecord
+"""
+
+import sys
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from dicetables import DiceRecord, DiceTable
+
+RecordKey = Tuple[Tuple[str, int], ...]
+
+
+def record_key(record: DiceRecord) -> RecordKey:
+    """
+    The canonical key of a record: ((repr(die), number), ...) sorted by repr.
+
+    Requests that differ only in spacing, case or die order parse to equal records and so get the same key.
+    """
+    return tuple(
+        sorted((repr(die), number) for die, number in record.get_dict().items())
+    )
+
+
+def estimate_size(obj: Any) -> int:
+    """a rough, recursive sys.getsizeof for the dicts, lists, tuples, strs and numbers in a response"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key) + estimate_size(val) for key, val in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(estimate_size(el) for el in obj)
+    return size
+
+
+def estimate_table_size(table: DiceTable) -> int:
+    """a sizer for caches of DiceTable: the size of its events dict"""
+    return estimate_size(table.get_dict())
+
+
+class ResultCache(object):
+    def __init__(
+        self,
+        max_entries: int = 128,
+        max_bytes: int = 32 * 2**20,
+        sizer: Callable[[Any], int] = estimate_size,
+    ) -> None:
+        """
+
+        :param max_entries: int >= 0 - the most values held at one time
+        :param max_bytes: int >= 0 - the most total bytes (as measured by `sizer`) held at one time
+        :param sizer: a function that estimates the size of a value in bytes
+        """
+        if max_entries < 0 or max_bytes < 0:
+            raise ValueError("max_entries and max_bytes may not be negative")
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizer = sizer
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._current_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def current_bytes(self) -> int:
+        return self._current_bytes
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def keys(self) -> List[Hashable]:
+        """all keys from least to most recently used. does not count as a hit or miss."""
+        return list(self._entries)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        return the value at key and mark it as most recently used. values are shared, so do not mutate them.
+        """
+        try:
+            value, _ = self._entries[key]
+        except KeyError:
+            self._misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        store value at key, evicting least recently used entries to stay within budget.
+        a value larger than max_bytes is not stored.
+        """
+        self._discard(key)
+        size = self._sizer(value)
+        if size > self._max_bytes or self._max_entries == 0:
+            return
+        self._entries[key] = (value, size)
+        self._current_bytes += size
+        while (
+            len(self._entries) > self._max_entries
+            or self._current_bytes > self._max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._current_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _discard(self, key: Hashable) -> None:
+        if key in self._entries:
+            _, size = self._entries.pop(key)
+            self._current_bytes -= size
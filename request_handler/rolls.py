@@ -0,0 +1,141 @@
+"""
+Rolls of a table, made on the server from its alias table.
+
+Rolls are made in batches of list comprehensions instead of a call to Roller.roll for each. A roll is one
+random integer: its high bits pick the alias and its low FRACTION_BITS are the start of a random fraction,
+which picks the alternate if it is at least primary_height / height. Only the rare fraction that ties
+with the first FRACTION_BITS of primary_height / height draws more bits, so rolls are exact without
+arithmetic on the big integer heights. The same seed and table always give the same rolls.
+"""
+
+import sys
+from array import array
+from base64 import b64encode
+from collections import Counter
+from random import Random
+from typing import Callable, Dict, Iterator, List
+
+from dicetables.tools.alias_table import AliasTable
+
+BATCH_SIZE = 2**16
+FRACTION_BITS = 64
+# packed rolls are base64 encoded, so this is under the 6MB a lambda can return
+MAX_PACKED_BYTES = 4 * 2**20
+# the typecodes array uses for 1, 2, 4 and 8 byte unsigned ints
+_PACKED_TYPECODES = ("B", "H", "I", "Q")
+
+
+def iter_outcomes(
+    alias_table: AliasTable, times: int, random_generator: Random
+) -> Iterator[List[int]]:
+    """
+    the rolls in batches of at most BATCH_SIZE, as outcome indices: 2 * alias for its primary and
+    2 * alias + 1 for its alternate. see `get_outcomes`.
+    """
+    height = alias_table.height
+    shifted_heights = [
+        alias.primary_height << FRACTION_BITS for alias in alias_table.to_list()
+    ]
+    thresholds = [shifted // height for shifted in shifted_heights]
+    mask = (1 << FRACTION_BITS) - 1
+    limit = alias_table.length << FRACTION_BITS
+    bits = (limit - 1).bit_length()
+    getrandbits = random_generator.getrandbits
+
+    def is_alternate_after_tie(alias: int) -> bool:
+        return _is_alternate_after_tie(
+            random_generator, shifted_heights[alias] % height, height
+        )
+
+    while times > 0:
+        draws = [getrandbits(bits) for _ in range(min(times, BATCH_SIZE))]
+        draws = [draw for draw in draws if draw < limit]
+        aliases = [draw >> FRACTION_BITS for draw in draws]
+        fractions = [draw & mask for draw in draws]
+        yield [
+            2 * alias
+            + (
+                fraction > threshold
+                or (fraction == threshold and is_alternate_after_tie(alias))
+            )
+            for alias, fraction, threshold in zip(
+                aliases, fractions, map(thresholds.__getitem__, aliases)
+            )
+        ]
+        times -= len(draws)
+
+
+def _is_alternate_after_tie(
+    random_generator: Random, remainder: int, height: int
+) -> bool:
+    """
+    whether the rest of the random fraction is at least remainder / height, FRACTION_BITS at a time.
+    """
+    while True:
+        threshold, remainder = divmod(remainder << FRACTION_BITS, height)
+        fraction = random_generator.getrandbits(FRACTION_BITS)
+        if fraction != threshold:
+            return fraction > threshold
+
+
+def get_outcomes(alias_table: AliasTable) -> List[int]:
+    """the roll for each outcome index of `iter_outcomes`"""
+    answer = []
+    for alias in alias_table.to_list():
+        answer += [alias.primary, alias.alternate]
+    return answer
+
+
+def get_histogram(
+    alias_table: AliasTable, times: int, random_generator: Random
+) -> dict:
+    """:return: {"x": [roll, ...], "y": [times rolled, ...]} for every roll that was rolled, in order"""
+    counts: Counter = Counter()
+    for batch in iter_outcomes(alias_table, times, random_generator):
+        counts.update(batch)
+    rolls: Counter = Counter()
+    outcomes = get_outcomes(alias_table)
+    for outcome, count in counts.items():
+        rolls[outcomes[outcome]] += count
+    x_axis = sorted(rolls)
+    return {"x": x_axis, "y": [rolls[roll] for roll in x_axis]}
+
+
+def get_packed(alias_table: AliasTable, times: int, random_generator: Random) -> dict:
+    """
+    :return: {"start": lowest roll, "itemSize": bytes, "data": base64 str} the rolls, in the order they were
+        rolled, as little-endian unsigned ints of roll - start.
+    """
+    outcomes = get_outcomes(alias_table)
+    start = min(outcomes)
+    typecode = get_packed_typecode(max(outcomes) - start)
+    item_size = array(typecode).itemsize
+    if times * item_size > MAX_PACKED_BYTES:
+        raise ValueError(
+            f"{times} packed rolls of {item_size} bytes are more than {MAX_PACKED_BYTES} bytes"
+        )
+    offsets = [outcome - start for outcome in outcomes]
+    packed = array(typecode)
+    for batch in iter_outcomes(alias_table, times, random_generator):
+        packed.extend([offsets[outcome] for outcome in batch])
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return {
+        "start": start,
+        "itemSize": packed.itemsize,
+        "data": b64encode(packed.tobytes()).decode(),
+    }
+
+
+def get_packed_typecode(span: int) -> str:
+    """the array typecode of the smallest unsigned int that holds 0 to span"""
+    for typecode in _PACKED_TYPECODES:
+        if span < 2 ** (8 * array(typecode).itemsize):
+            return typecode
+    raise ValueError(f"Rolls that differ by {span} are too far apart to pack")
+
+
+ROLL_FORMATS: Dict[str, Callable[[AliasTable, int, Random], dict]] = {
+    "histogram": get_histogram,
+    "packed": get_packed,
+}
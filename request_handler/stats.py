@@ -0,0 +1,49 @@
+"""
+The range, mean and stddev of a DiceRecord without building its table.
+
+The dice are independent, so the lowest rolls, highest rolls, means and variances of the dice add. Each
+die's are exact Fractions from its get_dict(), so the answer is exact until it is rounded to the three
+decimal places of make_dict.
+"""
+
+from collections import namedtuple
+from fractions import Fraction
+from math import sqrt
+from typing import Dict, Union
+
+from dicetables import DiceRecord
+from dicetables.eventsbases.protodie import ProtoDie
+
+STATS_FIELDS = ("range", "mean", "stddev")
+
+DieStats = namedtuple("DieStats", ["low", "high", "mean", "variance"])
+
+
+def get_die_stats(die: ProtoDie) -> DieStats:
+    """the stats of one roll of the die, with an exact mean and variance"""
+    events = die.get_dict()
+    total = sum(events.values())
+    mean = Fraction(
+        sum(roll * occurrences for roll, occurrences in events.items()), total
+    )
+    square_mean = Fraction(
+        sum(roll * roll * occurrences for roll, occurrences in events.items()), total
+    )
+    return DieStats(min(events), max(events), mean, square_mean - mean * mean)
+
+
+def get_record_stats(record: DiceRecord) -> Dict[str, Union[tuple, float]]:
+    """:return: {"range": (lowest, highest), "mean": float, "stddev": float} as make_dict would give them"""
+    low = high = 0
+    mean = variance = Fraction(0)
+    for die, number in record.get_dict().items():
+        die_stats = get_die_stats(die)
+        low += die_stats.low * number
+        high += die_stats.high * number
+        mean += die_stats.mean * number
+        variance += die_stats.variance * number
+    return {
+        "range": (low, high),
+        "mean": round(float(mean), 3),
+        "stddev": round(sqrt(variance), 3),
+    }
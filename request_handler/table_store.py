@@ -0,0 +1,149 @@
+"""
+A persistent SQLite store of built DiceTables, keyed on the canonical form of their DiceRecord.
+
+sqlite3 and hashlib are imported on first use, so a cold start without a store does not pay for them.
+
+Every entry is tagged with `table_version()`. It changes whenever the dicetables source or the entry
+format changes, and entries with any other version are never returned.
+"""
+
+import json
+import os
+import zlib
+from typing import TYPE_CHECKING, Optional
+
+import dicetables
+from dicetables import DiceRecord, DiceTable
+
+from request_handler.result_cache import record_key
+
+if TYPE_CHECKING:
+    import sqlite3
+
+FILE_NAME = "tables.sqlite3"
+ENTRY_FORMAT = 1
+
+_version = None
+
+
+def table_version() -> str:
+    """
+    a digest of the dicetables source and ENTRY_FORMAT. the deployment zip has no package metadata,
+    so the source itself is the version.
+    """
+    global _version
+    if _version is None:
+        import hashlib
+
+        digest = hashlib.sha256(str(ENTRY_FORMAT).encode())
+        package_dir = os.path.dirname(dicetables.__file__)
+        for root, _, files in sorted(os.walk(package_dir)):
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, package_dir).encode())
+                    with open(path, "rb") as source:
+                        digest.update(source.read())
+        _version = digest.hexdigest()[:16]
+    return _version
+
+
+def encode_events(table: DiceTable) -> bytes:
+    """the lowest event and every occurrence from there in hex (no int/str digit limit), compressed"""
+    events = table.get_dict()
+    lowest, highest = min(events), max(events)
+    occurrences = ",".join(
+        format(events.get(event, 0), "x") for event in range(lowest, highest + 1)
+    )
+    return zlib.compress(f"{lowest}:{occurrences}".encode())
+
+
+def decode_events(data: bytes) -> dict:
+    lowest, occurrences = zlib.decompress(data).decode().split(":")
+    events = {}
+    for event, hex_str in enumerate(occurrences.split(","), int(lowest)):
+        number = int(hex_str, 16)
+        if number:
+            events[event] = number
+    return events
+
+
+class TableStore(object):
+    def __init__(self, directory: str, min_events: int = 0) -> None:
+        """
+        errors reading or writing the file are treated as a miss, so a read-only or broken store never
+        fails a request.
+
+        :param directory: created if it does not exist and it is writable
+        :param min_events: tables with fewer events are cheap to rebuild and are not stored
+        """
+        self._path = os.path.join(directory, FILE_NAME)
+        self._min_events = min_events
+        self._connection: Optional["sqlite3.Connection"] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def min_events(self) -> int:
+        return self._min_events
+
+    def get(self, record: DiceRecord) -> Optional[DiceTable]:
+        import sqlite3
+
+        try:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT events FROM tables WHERE key = ? AND version = ?",
+                    (_key_str(record), table_version()),
+                )
+                .fetchone()
+            )
+        except (sqlite3.Error, OSError):
+            return None
+        if row is None:
+            return None
+        return DiceTable(decode_events(row[0]), record)
+
+    def put(self, table: DiceTable) -> None:
+        if len(table.get_dict()) < self._min_events:
+            return
+        import sqlite3
+
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO tables (key, version, events) VALUES (?, ?, ?)",
+                    (
+                        _key_str(table.dice_data()),
+                        table_version(),
+                        encode_events(table),
+                    ),
+                )
+        except (sqlite3.Error, OSError):
+            pass
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+    def _connect(self) -> "sqlite3.Connection":
+        import sqlite3
+
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            connection = sqlite3.connect(self._path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tables "
+                "(key TEXT PRIMARY KEY, version TEXT NOT NULL, events BLOB NOT NULL)"
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+
+def _key_str(record: DiceRecord) -> str:
+    return json.dumps(record_key(record))
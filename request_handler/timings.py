@@ -0,0 +1,72 @@
+"""
+Optional wall time, and memory, of each stage of a request.
+
+Code that takes `timings: Optional[StageTimings] = None` does nothing extra when it is None.
+tracemalloc is only imported by timings that trace allocations.
+"""
+
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, Optional, Union
+
+
+class StageTimings(object):
+    def __init__(self, trace_allocations: bool = False) -> None:
+        """
+        :param trace_allocations: also record the bytes allocated in each stage with tracemalloc, which is
+            started for each stage if it is not already running. this makes every stage much slower.
+        """
+        self._trace_allocations = trace_allocations
+        self._stages: Dict[str, Dict[str, Union[int, float]]] = {}
+
+    @property
+    def trace_allocations(self) -> bool:
+        return self._trace_allocations
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        times the block. a stage that is entered more than once is added up. stages should not be nested:
+        with trace_allocations, an inner stage resets the peak of the outer one.
+
+        allocatedBytes is the peak traced memory over the memory at the start of the stage. on python < 3.9
+        the peak cannot be reset, so it is the memory still held at the end of the stage.
+        """
+        started_tracing = False
+        start_bytes = 0
+        if self._trace_allocations:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            allocated: Optional[int] = None
+            if self._trace_allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                end_bytes = peak if hasattr(tracemalloc, "reset_peak") else current
+                allocated = max(end_bytes - start_bytes, 0)
+                if started_tracing:
+                    tracemalloc.stop()
+            self._add(name, seconds, allocated)
+
+    def _add(self, name: str, seconds: float, allocated: Optional[int]) -> None:
+        stage = self._stages.setdefault(name, {"ms": 0.0, "count": 0})
+        stage["ms"] += seconds * 1000
+        stage["count"] += 1
+        if allocated is not None:
+            stage["allocatedBytes"] = stage.get("allocatedBytes", 0) + allocated
+
+    def to_dict(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """{stage: {"ms": total, "count": times entered, ["allocatedBytes": total]}} in the order first seen"""
+        return {
+            name: dict(stage, ms=round(stage["ms"], 3))
+            for name, stage in self._stages.items()
+        }
@@ -0,0 +1,546 @@
+"""
+Serve lambda_handler over HTTP on your own machine, without Lambda.
+
+run from the repo root:
+    python server.py [--host 127.0.0.1] [--port 8080] [--workers N] [--max-concurrency M]
+                     [--cache-entries 1024] [--cache-bytes 67108864]
+
+POST a request body to any path, with the same headers API Gateway would pass on. Each request becomes a
+lambda event that runs in a pool of --workers processes, so a big table never blocks the event loop. At
+most --max-concurrency requests run at once and the rest wait. Connections are kept alive between
+requests. Successful responses are kept in a result cache in the server process, which every worker
+shares, so a repeated request is answered without a worker. If a worker dies, the requests in its pool
+get 503 Service Unavailable and a new pool takes their place.
+
+A request for the plain JSON of one table, with nothing else but fields and no Accept-Encoding, is
+written by iter_response in the worker. Each piece is passed back through a small queue as it is written
+and sent to HTTP/1.1 clients with Transfer-Encoding: chunked, so neither process holds the whole body.
+These responses are not kept in the result cache.
+
+Each worker builds big tables in its own ParallelEngine pool. Unless PARALLEL_WORKERS is set, those pools
+share the cpus: each has max(1, cpus // --workers) processes, instead of cpus each.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+from base64 import b64decode
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from itertools import chain
+from logging import getLogger
+from multiprocessing import Manager
+from queue import Empty, Queue
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from lambda_function import (
+    HANDLER,
+    JSON,
+    Response,
+    Status,
+    get_content_encoding,
+    get_content_type,
+    lambda_handler,
+)
+from request_handler.parallel import ParallelEngine, available_cpus
+from request_handler.result_cache import ResultCache
+
+KEEP_ALIVE_SECONDS = 5.0
+MAX_BODY_BYTES = 2**20
+MAX_HEADERS = 100
+# the only keys of a request body that is streamed
+STREAMED_KEYS = {"buildString", "fields"}
+# the pieces of a streamed body that a worker may write before the client has them
+STREAM_QUEUE_SIZE = 4
+# how long a worker waits for a slow or gone client before it gives up on a streamed body
+STREAM_TIMEOUT_SECONDS = 30.0
+# how often the server checks that a streaming worker is still alive
+STREAM_POLL_SECONDS = 0.1
+
+logger = getLogger(__name__)
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus) -> None:
+        super(HttpError, self).__init__(status.phrase)
+        self.status = status
+
+
+class Request(object):
+    def __init__(
+        self, method: str, path: str, version: str, headers: Dict[str, str], body: bytes
+    ) -> None:
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        """HTTP/1.1 keeps the connection unless asked to close it. HTTP/1.0 closes it unless asked not to"""
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class LocalServer(object):
+    def __init__(
+        self,
+        executor: Executor,
+        max_concurrency: int,
+        result_cache: Optional[ResultCache] = None,
+        keep_alive_seconds: float = KEEP_ALIVE_SECONDS,
+        executor_factory: Optional[Callable[[], Executor]] = None,
+        queue_factory: Optional[Callable[[int], "Queue[Any]"]] = None,
+    ) -> None:
+        """
+        :param executor: runs lambda_handler. a ProcessPoolExecutor keeps table builds off the event loop.
+        :param max_concurrency: the most requests given to the executor at once
+        :param result_cache: responses to successful requests, shared by every worker
+        :param keep_alive_seconds: how long an idle connection is kept open
+        :param executor_factory: makes a new executor when a worker dies and breaks the pool
+        :param queue_factory: makes the bounded queue that the executor streams a response through. a
+            ProcessPoolExecutor needs a manager's Queue. without one, nothing is streamed.
+        """
+        self._executor = executor
+        self._executor_factory = executor_factory
+        self._max_concurrency = max_concurrency
+        self._result_cache = result_cache
+        self._keep_alive_seconds = keep_alive_seconds
+        self._queue_factory = queue_factory
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def result_cache(self) -> Optional[ResultCache]:
+        return self._result_cache
+
+    @property
+    def executor(self) -> Executor:
+        return self._executor
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+
+    async def start(self, host: str, port: int) -> "asyncio.Server":
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        read_request(reader), self._keep_alive_seconds
+                    )
+                except HttpError as e:
+                    writer.write(get_error_bytes(e.status))
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                if request.method != "POST":
+                    writer.write(
+                        get_error_bytes(
+                            HTTPStatus.METHOD_NOT_ALLOWED, {"Allow": "POST"}
+                        )
+                    )
+                    await writer.drain()
+                    return
+                response = await self.get_response(request)
+                if "chunks" in response:
+                    if not await write_chunked(writer, response, request.keep_alive):
+                        return
+                else:
+                    writer.write(to_http(response, request.keep_alive))
+                    await writer.drain()
+                if not request.keep_alive:
+                    return
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            writer.close()
+
+    async def get_response(self, request: Request) -> dict:
+        """
+        the lambda response to the request, from the result cache or a worker. a streamed response has the
+        pieces of its body in "chunks", an async iterator, instead of "body".
+        """
+        event = to_event(request)
+        key = get_cache_key(event)
+        if key is not None and self._result_cache is not None:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                return cached
+
+        chunks = None
+        if (
+            self._queue_factory is not None
+            and request.version == "HTTP/1.1"
+            and is_streamed(event)
+        ):
+            chunks = self._queue_factory(STREAM_QUEUE_SIZE)
+        assert self._semaphore is not None, "the server has not been started"
+        await self._semaphore.acquire()
+        executor = self._executor
+        try:
+            if chunks is None:
+                response = await self._submit(executor, lambda_handler, event, None)
+            else:
+                future = self._submit(executor, stream_handler, event, chunks)
+                response = await get_streamed(chunks, future)
+                if "body" not in response:
+                    response["chunks"] = self._iter_chunks(executor, chunks, future)
+                    return response
+        except BrokenExecutor:
+            self._replace_executor(executor)
+            return get_error_response(HTTPStatus.SERVICE_UNAVAILABLE)
+        except Exception as e:
+            logger.exception(e)
+            return get_error_response(HTTPStatus.INTERNAL_SERVER_ERROR)
+        if (
+            key is not None
+            and self._result_cache is not None
+            and response["statusCode"] == HTTPStatus.OK
+        ):
+            self._result_cache.put(key, response)
+        return response
+
+    def _submit(
+        self, executor: Executor, handler: Callable[..., Any], *args: Any
+    ) -> "asyncio.Future[Any]":
+        """runs the handler with the semaphore that the caller acquired, which is released when it is done"""
+        assert self._semaphore is not None
+        try:
+            future = asyncio.get_event_loop().run_in_executor(executor, handler, *args)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        semaphore = self._semaphore
+        future.add_done_callback(lambda _: semaphore.release())
+        return future
+
+    async def _iter_chunks(
+        self, executor: Executor, chunks: "Queue[Any]", future: "asyncio.Future[Any]"
+    ) -> AsyncIterator[str]:
+        while True:
+            try:
+                chunk = await get_streamed(chunks, future)
+            except BrokenExecutor:
+                self._replace_executor(executor)
+                raise
+            if chunk is None:
+                return
+            yield chunk
+
+    def _replace_executor(self, broken: Executor) -> None:
+        """every request that was running in the broken executor fails, but it is only replaced once"""
+        if self._executor is not broken or self._executor_factory is None:
+            return
+        broken.shutdown(wait=False)
+        self._executor = self._executor_factory()
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """the next request on the connection, or None if it was closed before one started"""
+    request_line = await _read_line(reader)
+    if not request_line:
+        return None
+    try:
+        method, path, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await _read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "transfer-encoding" in headers:
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED)
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length > 0 else b""
+    return Request(method.upper(), path, version.upper(), headers, body)
+
+
+async def _read_line(reader: asyncio.StreamReader) -> bytes:
+    try:
+        return await reader.readline()
+    except ValueError:
+        # longer than the reader's limit
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+
+def to_event(request: Request) -> dict:
+    """the API Gateway proxy event that lambda_handler expects"""
+    return {
+        "body": request.body.decode("utf-8", "replace"),
+        "isBase64Encoded": False,
+        "headers": request.headers,
+        "httpMethod": request.method,
+        "path": request.path,
+    }
+
+
+def get_cache_key(event: dict) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    None for requests whose response should not be reused: bodies that are not JSON objects, timings, and
+    rolls without a seed.
+    """
+    try:
+        body = json.loads(event["body"])
+    except ValueError:
+        return None
+    if not isinstance(body, dict) or "timings" in body:
+        return None
+    if "rolls" in body and body.get("seed") is None:
+        return None
+    return (
+        json.dumps(body, sort_keys=True),
+        get_content_type(event),
+        get_content_encoding(event),
+    )
+
+
+def is_streamed(event: dict) -> bool:
+    """whether the event is for the plain JSON of one table, which `stream_handler` answers"""
+    try:
+        body = json.loads(event["body"])
+    except ValueError:
+        return False
+    if not isinstance(body, dict):
+        return False
+    fields = body.get("fields")
+    return (
+        isinstance(body.get("buildString"), str)
+        and (
+            fields is None
+            or isinstance(fields, list)
+            and all(isinstance(field, str) for field in fields)
+        )
+        and set(body) <= STREAMED_KEYS
+        and get_content_type(event) == JSON
+        and get_content_encoding(event) is None
+    )
+
+
+def stream_handler(event: dict, chunks: "Queue[Any]") -> None:
+    """
+    runs in a worker for events that `is_streamed` and puts a lambda response on chunks. when
+    HANDLER.iter_response writes the body in more than one piece, the response has no "body": each piece
+    follows it as soon as it is written, then None. chunks is bounded, so a worker is never far ahead of
+    its client, and one that waits STREAM_TIMEOUT_SECONDS to put a piece gives up with queue.Full. anything
+    that goes wrong before the first piece is a 400, as it is in lambda_handler.
+    """
+    try:
+        body = json.loads(event["body"])
+        pieces = HANDLER.iter_response(body["buildString"], body.get("fields"))
+        first = next(pieces)
+        second = next(pieces, None)
+    except Exception as e:
+        logger.exception(e)
+        chunks.put(
+            Response(
+                Status.BAD_REQUEST, {"errorMessage": "could not process"}
+            ).to_json()
+        )
+        return
+    headers = {"Content-Type": JSON}
+    if second is None:
+        # an error is always one piece. a cached answer may be too big to parse again
+        status = (
+            HTTPStatus.NOT_FOUND
+            if first.startswith('{"errorMessage"')
+            else HTTPStatus.OK
+        )
+        chunks.put({"body": first, "statusCode": status.value, "headers": headers})
+        return
+    put = partial(chunks.put, timeout=STREAM_TIMEOUT_SECONDS)
+    put({"statusCode": HTTPStatus.OK.value, "headers": headers})
+    for piece in chain([first, second], pieces):
+        put(piece)
+    put(None)
+
+
+async def get_streamed(chunks: "Queue[Any]", future: "asyncio.Future[Any]") -> Any:
+    """
+    the next thing that `stream_handler` puts on chunks. if the worker stops without putting it, this
+    raises the worker's error instead of waiting forever.
+    """
+    loop = asyncio.get_event_loop()
+    get = partial(chunks.get, timeout=STREAM_POLL_SECONDS)
+    while True:
+        try:
+            return await loop.run_in_executor(None, get)
+        except Empty:
+            if future.done():
+                break
+    try:
+        # put just before the worker finished
+        return chunks.get_nowait()
+    except Empty:
+        future.result()
+        raise RuntimeError("the worker stopped before the end of the response")
+
+
+async def write_chunked(
+    writer: asyncio.StreamWriter, response: dict, keep_alive: bool
+) -> bool:
+    """
+    writes a streamed response with Transfer-Encoding: chunked, a piece at a time. if the worker fails part
+    way through, this is False and the connection must be closed without the last chunk, so that the
+    client knows the body was cut short.
+    """
+    writer.write(to_http_head(response, keep_alive))
+    try:
+        async for chunk in response["chunks"]:
+            if chunk:
+                writer.write(_to_chunk(chunk.encode()))
+                await writer.drain()
+    except ConnectionError:
+        raise
+    except Exception as e:
+        logger.exception(e)
+        return False
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+    return True
+
+
+def to_http(response: dict, keep_alive: bool) -> bytes:
+    """the bytes of a lambda response as an HTTP/1.1 response"""
+    body = response["body"]
+    if response.get("isBase64Encoded"):
+        body_bytes = b64decode(body)
+    else:
+        body_bytes = body.encode()
+    return to_http_head(response, keep_alive, len(body_bytes)) + body_bytes
+
+
+def to_http_head(
+    response: dict, keep_alive: bool, content_length: Optional[int] = None
+) -> bytes:
+    """the status line and headers of a lambda response. without a length, the body is sent chunked"""
+    status = HTTPStatus(response["statusCode"])
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    lines += [f"{name}: {value}" for name, value in response["headers"].items()]
+    if content_length is None:
+        lines.append("Transfer-Encoding: chunked")
+    else:
+        lines.append(f"Content-Length: {content_length}")
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _to_chunk(data: bytes) -> bytes:
+    return f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n"
+
+
+def get_error_bytes(
+    status: HTTPStatus, headers: Optional[Dict[str, str]] = None
+) -> bytes:
+    """an error the server answers itself, which closes the connection"""
+    return to_http(get_error_response(status, headers), keep_alive=False)
+
+
+def get_error_response(
+    status: HTTPStatus, headers: Optional[Dict[str, str]] = None
+) -> dict:
+    """a lambda response for an error the server answers itself"""
+    return {
+        "body": json.dumps({"errorMessage": status.phrase}),
+        "statusCode": status.value,
+        "headers": {"Content-Type": "application/json", **(headers or {})},
+    }
+
+
+def get_parallel_workers(workers: int) -> int:
+    """the ParallelEngine pool size for each of the workers, so that together they use every cpu once"""
+    return max(1, available_cpus() // workers)
+
+
+def init_worker(parallel_workers: int) -> None:
+    """runs in each worker as it starts. PARALLEL_WORKERS, when it is set, wins over parallel_workers"""
+    if isinstance(HANDLER.engine, ParallelEngine) and not os.environ.get(
+        "PARALLEL_WORKERS"
+    ):
+        HANDLER.engine.max_workers = parallel_workers
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--max-concurrency", type=int, help="defaults to twice the workers"
+    )
+    parser.add_argument("--cache-entries", type=int, default=1024)
+    parser.add_argument("--cache-bytes", type=int, default=64 * 2**20)
+    args = parser.parse_args(argv)
+
+    result_cache = None
+    if args.cache_entries > 0:
+        result_cache = ResultCache(
+            max_entries=args.cache_entries, max_bytes=args.cache_bytes
+        )
+    executor_factory = partial(
+        ProcessPoolExecutor,
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(get_parallel_workers(args.workers),),
+    )
+    # the workers put streamed pieces on the manager's queues, which the server reads from
+    manager = Manager()
+    server = LocalServer(
+        executor_factory(),
+        args.max_concurrency or 2 * args.workers,
+        result_cache,
+        executor_factory=executor_factory,
+        queue_factory=manager.Queue,
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        manager.shutdown()
+    return 0
+
+
+async def serve(server: LocalServer, host: str, port: int, workers: int) -> None:
+    """serves until SIGINT or SIGTERM, then returns so that the pool of workers is shut down"""
+    stopped = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stopped.set)
+        except NotImplementedError:
+            # windows has no signal handlers in the event loop. ctrl-c is a KeyboardInterrupt
+            pass
+    http_server = await server.start(host, port)
+    print(f"serving on http://{host}:{port} with {workers} workers", flush=True)
+    async with http_server:
+        await stopped.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import pytest
+from dicetables import (
+    DiceTable,
+    DiceRecord,
+    Die,
+    ModDie,
+    WeightedDie,
+    StrongDie,
+    Exploding,
+)
+
+from request_handler.convolution import (
+    DiceTablesEngine,
+    PackedDecimalEngine,
+    convolve,
+    is_dense,
+    power,
+)
+from tests.test_requesthandler import DICE_EXAMPLES
+
+ALWAYS_PACKED = PackedDecimalEngine(min_size=0, max_table_ratio=10**6)
+
+
+@pytest.mark.parametrize(
+    "events, expected",
+    [
+        ({}, False),
+        ({1: 1}, True),
+        ({1: 1, 2: 1}, True),
+        ({1: 1, 5: 1}, False),
+        ({1: 1, 4: 1}, True),
+    ],
+)
+def test_is_dense(events, expected):
+    assert is_dense(events) == expected
+
+
+def test_convolve_simple():
+    assert convolve({1: 1, 2: 1}, {1: 1, 2: 1}) == {2: 1, 3: 2, 4: 1}
+
+
+def test_convolve_negative_events_and_gaps():
+    first = {-2: 3, 0: 1}
+    second = {-1: 1, 1: 2}
+    assert convolve(first, second) == {-3: 3, -1: 7, 1: 2}
+
+
+def test_convolve_identity():
+    events = {3: 5, 4: 7}
+    assert convolve({0: 1}, events) == events
+    assert convolve(events, {0: 1}) == events
+
+
+def test_convolve_huge_occurrences():
+    first = {1: 1, 2: 9**5000}
+    second = {0: 2, 1: 3}
+    expected = {1: 2, 2: 3 + 2 * 9**5000, 3: 3 * 9**5000}
+    assert convolve(first, second) == expected
+
+
+def test_power_zero_times():
+    assert power({1: 1, 2: 1}, 0) == {0: 1}
+
+
+@pytest.mark.parametrize(
+    "die", [Die(6), ModDie(4, -2), WeightedDie({1: 2, 2: 0, 3: 5}), Exploding(Die(3))]
+)
+@pytest.mark.parametrize("times", [1, 2, 7, 8, 33])
+def test_power_matches_dicetables(die, times):
+    expected = DiceTable.new().add_die(die, times).get_dict()
+    assert power(die.get_dict(), times) == expected
+
+
+def test_power_sparse_die_still_exact():
+    die = StrongDie(Die(2), 5)
+    expected = DiceTable.new().add_die(die, 9).get_dict()
+    assert power(die.get_dict(), 9) == expected
+
+
+def test_dice_tables_engine_add_die():
+    table = DiceTable.new().add_die(Die(2))
+    actual = DiceTablesEngine().add_die(table, Die(3), 2)
+    assert actual == table.add_die(Die(3), 2)
+
+
+def test_packed_engine_defaults():
+    engine = PackedDecimalEngine()
+    assert engine.min_size == 64
+    assert engine.max_table_ratio == 4
+
+
+def test_packed_engine_supports_min_size():
+    engine = PackedDecimalEngine(min_size=12)
+    assert engine.supports(DiceTable.new(), Die(6), 2)
+    assert not engine.supports(DiceTable.new(), Die(6), 1)
+
+
+def test_packed_engine_supports_sparse_dice():
+    engine = PackedDecimalEngine(min_size=0)
+    assert not engine.supports(DiceTable.new(), StrongDie(Die(6), 10), 10)
+    sparse_table = DiceTable.new().add_die(StrongDie(Die(6), 10))
+    assert not engine.supports(sparse_table, Die(6), 10)
+
+
+def test_packed_engine_supports_max_table_ratio():
+    engine = PackedDecimalEngine(min_size=0, max_table_ratio=2)
+    table = DiceTable.new().add_die(Die(11), 2)
+    assert engine.supports(table, Die(11), 1)
+    assert not engine.supports(table, Die(6), 1)
+
+
+def test_packed_engine_falls_back_when_not_supported():
+    engine = PackedDecimalEngine(min_size=0)
+    die = StrongDie(Die(6), 10)
+    table = DiceTable.new().add_die(Die(3))
+    assert engine.add_die(table, die, 10) == table.add_die(die, 10)
+
+
+@pytest.mark.parametrize("die", DICE_EXAMPLES)
+@pytest.mark.parametrize("number", [1, 3, 20])
+def test_packed_engine_matches_dice_tables_engine(die, number):
+    start = DiceTable.new().add_die(Die(4), 2)
+    expected = DiceTablesEngine().add_die(start, die, number)
+    actual = ALWAYS_PACKED.add_die(start, die, number)
+    assert actual == expected
+    assert actual.dice_data() == DiceRecord.new().add_die(Die(4), 2).add_die(
+        die, number
+    )
+
+
+def test_dice_tables_engine_add_dice():
+    start = DiceTable.new().add_die(Die(2))
+    actual = DiceTablesEngine().add_dice(
+        start, {Die(3): 2, Die(6): 0, WeightedDie({1: 1, 3: 2}): 1}
+    )
+    assert actual == start.add_die(Die(3), 2).add_die(WeightedDie({1: 1, 3: 2}))
+    assert actual.dice_data() == DiceRecord(
+        {Die(2): 1, Die(3): 2, WeightedDie({1: 1, 3: 2}): 1}
+    )
+
+
+def test_packed_engine_add_dice_uses_add_die():
+    dice = {Die(6): 20, StrongDie(Die(6), 10): 3}
+    assert ALWAYS_PACKED.add_dice(DiceTable.new(), dice) == DiceTablesEngine().add_dice(
+        DiceTable.new(), dice
+    )
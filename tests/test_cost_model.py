@@ -0,0 +1,90 @@
+from math import log10
+
+import pytest
+from dicetables import DiceRecord, Die, ModDie, Modifier, StrongDie, WeightedDie
+
+from request_handler.cost_model import (
+    DEFAULT_COST_MODEL,
+    Cost,
+    CostModel,
+    MemoryBudgetError,
+    get_features,
+)
+from request_handler.dice_tables_tequest_handler import construct_dice_table
+from tests.test_requesthandler import DICE_EXAMPLES
+
+
+def test_memory_budget_error_is_value_error():
+    assert issubclass(MemoryBudgetError, ValueError)
+
+
+def test_get_features_empty_record():
+    assert get_features(DiceRecord.new()) == (1, 1.0)
+
+
+@pytest.mark.parametrize(
+    "record, events",
+    [
+        (DiceRecord({Die(6): 1}), 6),
+        (DiceRecord({Die(6): 10}), 51),
+        (DiceRecord({Die(6): 2, ModDie(4, -3): 3}), 20),
+        (DiceRecord({Modifier(5): 3}), 1),
+        (DiceRecord({StrongDie(Die(6), 10): 4}), 21),
+        (DiceRecord({StrongDie(Die(6), 10): 4, StrongDie(Die(6), 4): 1}), 111),
+        (DiceRecord({Die(6): 3, Die(4): 0}), 16),
+    ],
+)
+def test_get_features_events(record, events):
+    assert get_features(record)[0] == events
+
+
+@pytest.mark.parametrize("die", DICE_EXAMPLES)
+@pytest.mark.parametrize("number", [1, 3, 10])
+def test_get_features_are_upper_bounds(die, number):
+    record = DiceRecord({die: number})
+    events, digits = get_features(record)
+    table = construct_dice_table(record)
+    assert len(table.get_dict()) <= events
+    assert len(str(max(table.get_dict().values()))) <= digits
+
+
+def test_get_features_digits():
+    weights = {1: 10**50, 2: 1}
+    _, digits = get_features(DiceRecord({WeightedDie(weights): 3, Die(10): 2}))
+    assert digits == pytest.approx(1 + 3 * log10(10**50 + 1) + 2)
+
+
+def test_cost_model_estimate():
+    model = CostModel(100, 10, 1, 0.5, 0.25, 0.125)
+    cost = model.estimate(DiceRecord({Die(10): 2}))
+    assert cost == Cost(19, 3.0, 100 + 190 + 57, 0.5 + 4.75 + 7.125)
+    assert isinstance(cost.peak_bytes, int)
+
+
+def test_cost_model_coefficients():
+    model = CostModel(1, 2, 3, 4, 5, 6)
+    assert model.bytes_coefficients == (1, 2, 3)
+    assert model.seconds_coefficients == (4, 5, 6)
+
+
+def test_default_cost_model_grows_with_dice():
+    costs = [
+        DEFAULT_COST_MODEL.estimate(DiceRecord({Die(6): number}))
+        for number in (1, 10, 100, 1000)
+    ]
+    assert [cost.peak_bytes for cost in costs] == sorted(
+        cost.peak_bytes for cost in costs
+    )
+    assert [cost.cpu_seconds for cost in costs] == sorted(
+        cost.cpu_seconds for cost in costs
+    )
+    assert costs[0].peak_bytes < 2**20 < costs[-1].peak_bytes
+
+
+def test_default_cost_model_counts_wide_occurrences():
+    few_wide = DiceRecord({WeightedDie({1: 10**1000, 2: 1, 3: 1, 4: 1}): 1000})
+    many_narrow = DiceRecord({Die(4): 1000})
+    assert (
+        DEFAULT_COST_MODEL.estimate(few_wide).peak_bytes
+        > 100 * DEFAULT_COST_MODEL.estimate(many_narrow).peak_bytes
+    )
@@ -0,0 +1,113 @@
+import random
+
+import pytest
+from dicetables import (
+    Die,
+    ModDie,
+    WeightedDie,
+    ModWeightedDie,
+    StrongDie,
+    Modifier,
+    Exploding,
+    ExplodingOn,
+    BestOfDicePool,
+    WorstOfDicePool,
+    UpperMidOfDicePool,
+    LowerMidOfDicePool,
+)
+from dicetables.dicepool import DicePool
+
+from request_handler.die_size import estimate_dict_size
+
+POOLS = [BestOfDicePool, WorstOfDicePool, UpperMidOfDicePool, LowerMidOfDicePool]
+
+
+def random_simple_die(rng):
+    choice = rng.randrange(5)
+    if choice == 0:
+        return Die(rng.randint(1, 12))
+    if choice == 1:
+        return ModDie(rng.randint(1, 12), rng.randint(-5, 5))
+    weights = {
+        roll: rng.choice([0, 1, 1, 2, 5]) for roll in rng.sample(range(1, 15), 4)
+    }
+    weights[rng.randint(1, 15)] = 1
+    if choice == 2:
+        return WeightedDie(weights)
+    if choice == 3:
+        return ModWeightedDie(weights, rng.randint(-5, 5))
+    return StrongDie(Die(rng.randint(1, 6)), rng.randint(-3, 3))
+
+
+def random_die(rng):
+    die = random_simple_die(rng)
+    choice = rng.randrange(4)
+    if choice == 0:
+        return die
+    if choice == 1:
+        return Exploding(die, rng.randint(0, 4))
+    if choice == 2:
+        rolls = sorted(die.get_dict())
+        explodes_on = rng.sample(rolls, rng.randint(1, min(3, len(rolls))))
+        return ExplodingOn(die, explodes_on, rng.randint(0, 3))
+    pool_size = rng.randint(1, 4)
+    return rng.choice(POOLS)(DicePool(die, pool_size), rng.randint(1, pool_size))
+
+
+@pytest.mark.parametrize(
+    "die",
+    [
+        Modifier(-3),
+        Die(1),
+        Die(500),
+        ModDie(6, -10),
+        StrongDie(Die(6), 0),
+        StrongDie(Exploding(Die(4), 3), -2),
+        Exploding(Die(6)),
+        Exploding(WeightedDie({1: 1, 3: 0, 5: 2}), 5),
+        ExplodingOn(Die(6), (1, 6), 3),
+        ExplodingOn(Die(10), (8, 9, 10), 4),
+        BestOfDicePool(DicePool(Die(6), 4), 3),
+        WorstOfDicePool(DicePool(WeightedDie({1: 1, 100: 1}), 5), 2),
+        UpperMidOfDicePool(DicePool(Die(20), 3), 1),
+        LowerMidOfDicePool(DicePool(ModDie(4, 2), 6), 4),
+    ],
+)
+def test_estimate_dict_size_is_an_upper_bound(die):
+    assert estimate_dict_size(die) >= len(die.get_dict())
+
+
+def test_estimate_dict_size_is_an_upper_bound_for_random_dice():
+    rng = random.Random(1234)
+    for _ in range(2000):
+        die = random_die(rng)
+        assert estimate_dict_size(die) >= len(die.get_dict()), repr(die)
+
+
+@pytest.mark.parametrize(
+    "die",
+    [Modifier(5), Die(1), Die(6), Die(500), ModDie(4, -2), WeightedDie({2: 3, 5: 1})],
+)
+def test_estimate_dict_size_is_exact(die):
+    assert estimate_dict_size(die) == len(die.get_dict())
+
+
+@pytest.mark.parametrize(
+    "die, expected",
+    [
+        (Exploding(Die(6)), 18),
+        (ExplodingOn(Die(6), (5, 6), 2), 6 * (1 + 2 + 3)),
+        (BestOfDicePool(DicePool(Die(6), 4), 3), 16),
+        (BestOfDicePool(DicePool(WeightedDie({1: 1, 100: 1}), 4), 3), 4),
+    ],
+)
+def test_estimate_dict_size_bounds(die, expected):
+    assert estimate_dict_size(die) == expected
+
+
+def test_estimate_dict_size_unknown_die_uses_real_size():
+    class OddDie(Die):
+        def get_dict(self):
+            return {1: 1, 3: 1}
+
+    assert estimate_dict_size(OddDie(6)) == 2
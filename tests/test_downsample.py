@@ -0,0 +1,68 @@
+import pytest
+from dicetables import DiceTable, Die, EventsCalculations, Exploding, WeightedDie
+
+from request_handler.downsample import MIN_POINTS, lttb
+
+
+def test_min_points():
+    assert MIN_POINTS == 3
+
+
+@pytest.mark.parametrize("max_points", [0, 1, 2])
+def test_lttb_too_few_points(max_points):
+    with pytest.raises(ValueError, match="max_points must be at least 3"):
+        lttb([1, 2, 3, 4], [1, 2, 3, 4], max_points)
+
+
+@pytest.mark.parametrize("max_points", [5, 6, 100])
+def test_lttb_enough_points(max_points):
+    assert lttb([1, 2, 3, 4, 5], [0.5, 1.5, 0.0, 1.0, 2.0], max_points) == (
+        (1, 2, 3, 4, 5),
+        (0.5, 1.5, 0.0, 1.0, 2.0),
+    )
+
+
+def test_lttb_keeps_peak():
+    assert lttb([1, 2, 3, 4, 5], [0, 5, 0, 1, 0], 3) == ((1, 2, 5), (0, 5, 0))
+
+
+def test_lttb_keeps_spike_in_flat_data():
+    x = list(range(100))
+    y = [1.0] * 100
+    y[37] = 9.0
+    new_x, new_y = lttb(x, y, 10)
+    assert 37 in new_x
+    assert 9.0 in new_y
+
+
+def test_lttb_straight_line():
+    x = list(range(101))
+    new_x, new_y = lttb(x, [2.0 * roll for roll in x], 11)
+    assert new_y == tuple(2.0 * roll for roll in new_x)
+
+
+@pytest.mark.parametrize(
+    "table",
+    [
+        DiceTable.new().add_die(Die(6), 10),
+        DiceTable.new().add_die(Die(100), 20),
+        DiceTable.new().add_die(Exploding(Die(6), 3), 5),
+        DiceTable.new().add_die(WeightedDie({1: 1, 50: 2, 100: 5}), 3),
+    ],
+)
+@pytest.mark.parametrize("max_points", [3, 10, 50])
+def test_lttb_points_of_table(table, max_points):
+    x, y = EventsCalculations(table).percentage_axes()
+    new_x, new_y = lttb(x, y, max_points)
+    assert len(new_x) == len(new_y) == min(max_points, len(x))
+    assert (new_x[0], new_x[-1]) == (x[0], x[-1])
+    assert list(new_x) == sorted(set(new_x))
+    points = dict(zip(x, y))
+    assert all(points[roll] == pct for roll, pct in zip(new_x, new_y))
+
+
+def test_lttb_one_point_per_bucket():
+    x = list(range(1002))
+    new_x, _ = lttb(x, [roll % 7 for roll in x], 12)
+    # 1000 points between the ends in 10 buckets of 100
+    assert [(roll - 1) // 100 for roll in new_x[1:-1]] == list(range(10))
@@ -1,10 +1,34 @@
-from base64 import b64encode
+from base64 import b64decode, b64encode
+import gzip
 import json
+import os
+import subprocess
+import sys
+import zlib
 from unittest.mock import patch
 
 import pytest
 
-from lambda_function import lambda_handler
+from lambda_function import (
+    lambda_handler,
+    get_content_type,
+    get_content_encoding,
+    COMPRESSION_MIN_BYTES,
+    MAX_BATCH_SIZE,
+    JSON,
+    COLUMNAR_JSON,
+    warm,
+    get_fields,
+    HANDLER,
+    get_memory_budget,
+    get_engine,
+    get_response_bundle,
+    get_table_store,
+)
+from request_handler.convolution import DEFAULT_ENGINE
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler, FIELDS
+from request_handler.parallel import ParallelEngine
+from request_handler.result_cache import ResultCache
 
 
 def make_response_for_tests(body: dict, status: int):
@@ -90,3 +114,542 @@ def test_good_build_string_base64_encoded(event, expected_body):
     response = lambda_handler(event, None)
     expected_status = 200
     assert response == make_response_for_tests(expected_body, expected_status)
+
+
+def test_batch_request():
+    event = {
+        "body": {"buildStrings": ["Die(1)", "Die(1, 2)", "Die(2)"]},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+
+    assert response["statusCode"] == 200
+    results = json.loads(response["body"])["results"]
+    assert [result["statusCode"] for result in results] == [200, 404, 200]
+    assert results[0]["body"]["diceStr"] == "Die(1): 1"
+    assert results[1]["body"] == {
+        "errorMessage": "Too many parameters for class: Die",
+        "errorType": "ParseError",
+    }
+    assert results[2]["body"]["diceStr"] == "Die(2): 1"
+
+
+def test_batch_request_empty():
+    event = {"body": {"buildStrings": []}, "isBase64Encoded": False}
+    response = lambda_handler(event, None)
+    assert response == make_response_for_tests({"results": []}, 200)
+
+
+@pytest.mark.parametrize("build_strings", ["Die(1)", ["Die(1)"] * (MAX_BATCH_SIZE + 1)])
+def test_batch_request_bad_build_strings(build_strings):
+    event = {"body": {"buildStrings": build_strings}, "isBase64Encoded": False}
+    response = lambda_handler(event, None)
+
+    expected_body = {"errorMessage": "could not process"}
+    assert response == make_response_for_tests(expected_body, 400)
+
+
+def test_fields_request(event):
+    event["body"]["fields"] = ["mean", "range"]
+    response = lambda_handler(event, None)
+    assert response == make_response_for_tests({"range": [1, 1], "mean": 1.0}, 200)
+
+
+def test_fields_batch_request():
+    event = {
+        "body": {"buildStrings": ["Die(1)", "Die(2)"], "fields": ["mean"]},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    expected_body = {
+        "results": [
+            {"statusCode": 200, "body": {"mean": 1.0}},
+            {"statusCode": 200, "body": {"mean": 1.5}},
+        ]
+    }
+    assert response == make_response_for_tests(expected_body, 200)
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        (None, JSON),
+        ({}, JSON),
+        ({"Accept": "*/*"}, JSON),
+        ({"Accept": "application/json"}, JSON),
+        ({"Accept": COLUMNAR_JSON}, COLUMNAR_JSON),
+        (
+            {"accept": "text/html, application/vnd.allthedice.columnar+json;q=0.9"},
+            COLUMNAR_JSON,
+        ),
+        ({"ACCEPT": "application/json, " + COLUMNAR_JSON}, JSON),
+        ({"Accept": COLUMNAR_JSON + ";q=0"}, JSON),
+        ({"Accept": COLUMNAR_JSON + "; q=0.0, application/json;q=0.1"}, JSON),
+        ({"Accept": "application/json;q=0, " + COLUMNAR_JSON}, COLUMNAR_JSON),
+        ({"Accept": COLUMNAR_JSON + ";q=bad"}, JSON),
+    ],
+)
+def test_get_content_type(headers, expected):
+    assert get_content_type({"headers": headers}) == expected
+
+
+def test_columnar_request(event):
+    event["headers"] = {"Accept": COLUMNAR_JSON}
+    response = lambda_handler(event, None)
+
+    assert response["headers"] == {"Content-Type": COLUMNAR_JSON}
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["forSciNum"] == {
+        "roll": [1],
+        "mantissa": ["1.00000"],
+        "exponent": ["0"],
+    }
+    assert "roller" not in body
+    assert body["compactRoller"] == {
+        "height": "1",
+        "primaries": [1],
+        "alternates": [1],
+        "primaryHeights": [None],
+    }
+    assert response["body"] == json.dumps(body, separators=(",", ":"))
+
+
+def test_columnar_request_fields(event):
+    event["headers"] = {"Accept": COLUMNAR_JSON}
+    event["body"]["fields"] = ["roller", "mean"]
+    body = json.loads(lambda_handler(event, None)["body"])
+    assert body == {
+        "mean": 1.0,
+        "compactRoller": {
+            "height": "1",
+            "primaries": [1],
+            "alternates": [1],
+            "primaryHeights": [None],
+        },
+    }
+
+
+def test_json_request_compact_roller(event):
+    event["body"]["fields"] = ["roller", "compactRoller"]
+    body = json.loads(lambda_handler(event, None)["body"])
+    assert body["roller"] == {
+        "height": "1",
+        "aliases": [{"primary": "1", "alternate": "1", "primaryHeight": "1"}],
+    }
+    assert body["compactRoller"] == {
+        "height": "1",
+        "primaries": [1],
+        "alternates": [1],
+        "primaryHeights": [None],
+    }
+
+
+@pytest.mark.parametrize(
+    "fields, content_type, expected",
+    [
+        (None, JSON, None),
+        (["roller"], JSON, ["roller"]),
+        (
+            None,
+            COLUMNAR_JSON,
+            [field if field != "roller" else "compactRoller" for field in FIELDS],
+        ),
+        (["mean", "roller"], COLUMNAR_JSON, ["mean", "compactRoller"]),
+        ("roller", COLUMNAR_JSON, "roller"),
+    ],
+)
+def test_get_fields(fields, content_type, expected):
+    assert get_fields(fields, content_type) == expected
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        (None, None),
+        ({"Accept-Encoding": ""}, None),
+        ({"Accept-Encoding": "br"}, None),
+        ({"Accept-Encoding": "gzip"}, "gzip"),
+        ({"accept-encoding": "deflate, gzip"}, "gzip"),
+        ({"Accept-Encoding": "deflate"}, "deflate"),
+        ({"Accept-Encoding": "gzip;q=0, deflate;q=0.5"}, "deflate"),
+        ({"Accept-Encoding": "gzip;q=0.05"}, "gzip"),
+        ({"Accept-Encoding": "gzip;q=bad"}, None),
+        ({"Accept-Encoding": "*"}, "gzip"),
+        ({"Accept-Encoding": "*;q=0"}, None),
+        ({"Accept-Encoding": "gzip;q=0, deflate;q=0, *"}, None),
+        ({"Accept-Encoding": "*, gzip;q=0"}, "deflate"),
+        ({"Accept-Encoding": "br, *;q=0.1"}, "gzip"),
+        ({"Accept-Encoding": "deflate, *;q=0"}, "deflate"),
+    ],
+)
+def test_get_content_encoding(headers, expected):
+    assert get_content_encoding({"headers": headers}) == expected
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress", [("gzip", gzip.decompress), ("deflate", zlib.decompress)]
+)
+def test_compressed_request(encoding, decompress):
+    event = {
+        "body": {"buildString": "10*Die(6)"},
+        "isBase64Encoded": False,
+        "headers": {"Accept-Encoding": encoding},
+    }
+    uncompressed = lambda_handler(
+        {"body": {"buildString": "10*Die(6)"}, "isBase64Encoded": False}, None
+    )
+    assert len(uncompressed["body"]) >= COMPRESSION_MIN_BYTES
+
+    response = lambda_handler(event, None)
+    assert response["isBase64Encoded"] is True
+    assert response["headers"] == {
+        "Content-Type": "application/json",
+        "Content-Encoding": encoding,
+    }
+    assert response["statusCode"] == 200
+    assert decompress(b64decode(response["body"])).decode() == uncompressed["body"]
+
+
+def test_small_response_not_compressed(event, expected_body):
+    event["headers"] = {"Accept-Encoding": "gzip"}
+    response = lambda_handler(event, None)
+    assert response == make_response_for_tests(expected_body, 200)
+
+
+def test_warm_fills_caches(tmp_path):
+    manifest = tmp_path / "warm_manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {"buildString": "3*Die(6)"},
+                {"buildString": "Die(20)", "fields": ["mean"]},
+                {"buildString": "notadie(3)"},
+            ]
+        )
+    )
+    result_cache = ResultCache()
+    handler = DiceTablesRequestHandler(result_cache=result_cache)
+    assert warm(handler, str(manifest)) == 3
+    assert len(result_cache) == 2
+
+    handler.get_response("Die(20)", ["mean"])
+    assert result_cache.hits == 1
+
+
+@pytest.mark.parametrize("contents", [None, "not json", '{"buildString": 3}', "[3]"])
+def test_warm_bad_manifest(tmp_path, contents):
+    manifest = tmp_path / "warm_manifest.json"
+    if contents is not None:
+        manifest.write_text(contents)
+    with patch("lambda_function.logger") as mock_logger:
+        assert warm(DiceTablesRequestHandler(), str(manifest)) == 0
+        mock_logger.exception.assert_called_once()
+
+
+def test_timings_off_by_default(event, expected_body):
+    with patch("lambda_function.logger") as mock_logger:
+        response = lambda_handler(event, None)
+    assert response == make_response_for_tests(expected_body, 200)
+    assert not any(
+        str(call.args[0]).startswith("timings")
+        for call in mock_logger.info.call_args_list
+    )
+
+
+def test_timings_in_request(event, expected_body):
+    event["body"]["timings"] = True
+    with patch("lambda_function.logger") as mock_logger:
+        response = lambda_handler(event, None)
+    body = json.loads(response["body"])
+    stages = body.pop("timings")
+    assert body == expected_body
+    assert list(stages)[0] == "parse"
+    assert all("allocatedBytes" not in stage for stage in stages.values())
+
+    logged = [
+        call
+        for call in mock_logger.info.call_args_list
+        if str(call.args[0]).startswith("timings")
+    ]
+    assert len(logged) == 1
+    assert list(logged[0].kwargs["extra"]["timings"]) == list(stages) + ["encode"]
+
+
+def test_timings_in_batch_request():
+    event = {
+        "body": {"buildStrings": ["Die(6)", "2*Die(4)"], "timings": True},
+        "isBase64Encoded": False,
+    }
+    body = json.loads(lambda_handler(event, None)["body"])
+    assert body["timings"]["parse"]["count"] == 2
+    assert len(body["results"]) == 2
+
+
+@pytest.mark.parametrize("setting, traced", [("1", False), ("memory", True)])
+def test_timings_from_environment(event, expected_body, setting, traced):
+    with patch("lambda_function.TIMINGS", setting):
+        with patch("lambda_function.logger") as mock_logger:
+            response = lambda_handler(event, None)
+    assert response == make_response_for_tests(expected_body, 200)
+    logged = [
+        call
+        for call in mock_logger.info.call_args_list
+        if str(call.args[0]).startswith("timings")
+    ]
+    stages = logged[0].kwargs["extra"]["timings"]
+    assert ("allocatedBytes" in stages["parse"]) is traced
+
+
+def test_rolls_request():
+    event = {
+        "body": {"buildString": "2*Die(6)", "rolls": 100, "seed": 3},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body == HANDLER.get_rolls("2*Die(6)", 100, 3)
+    assert sum(body["histogram"]["y"]) == 100
+
+
+def test_rolls_request_packed():
+    event = {
+        "body": {
+            "buildString": "2*Die(6)",
+            "rolls": 100,
+            "seed": 3,
+            "rollFormat": "packed",
+        },
+        "isBase64Encoded": False,
+    }
+    body = json.loads(lambda_handler(event, None)["body"])
+    assert body == HANDLER.get_rolls("2*Die(6)", 100, 3, "packed")
+
+
+@pytest.mark.parametrize("rolls", [0, HANDLER.max_rolls + 1])
+def test_rolls_request_over_limit(rolls):
+    event = {
+        "body": {"buildString": "2*Die(6)", "rolls": rolls},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 404
+    assert json.loads(response["body"])["errorMessage"] == (
+        f"rolls must be an integer from 1 to {HANDLER.max_rolls}"
+    )
+
+
+def test_stats_only_request():
+    event = {
+        "body": {"buildString": "100000*Die(6)", "statsOnly": True},
+        "isBase64Encoded": False,
+        "headers": {"Accept": COLUMNAR_JSON},
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == {
+        "range": [100000, 600000],
+        "mean": 350000.0,
+        "stddev": 540.062,
+    }
+
+
+def test_stats_only_request_fields():
+    event = {
+        "body": {"buildString": "3*Die(6)", "statsOnly": True, "fields": ["mean"]},
+        "isBase64Encoded": False,
+    }
+    assert json.loads(lambda_handler(event, None)["body"]) == {"mean": 10.5}
+
+
+def test_stats_only_batch_request():
+    event = {
+        "body": {"buildStrings": ["3*Die(6)", "notadie(5)"], "statsOnly": True},
+        "isBase64Encoded": False,
+    }
+    body = json.loads(lambda_handler(event, None)["body"])
+    assert body["results"][0] == {
+        "statusCode": 200,
+        "body": {"range": [3, 18], "mean": 10.5, "stddev": 2.958},
+    }
+    assert body["results"][1]["statusCode"] == 404
+
+
+def test_queries_request():
+    event = {
+        "body": {
+            "buildString": "2*Die(6)",
+            "queries": [7, [7, 7], [15, None]],
+            "queryFormat": "fraction",
+        },
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == {"queries": ["7/12", "1/6", "0/1"]}
+
+
+@pytest.mark.parametrize("headers", [{}, {"Accept": COLUMNAR_JSON}])
+def test_queries_request_default_fields(headers):
+    event = {
+        "body": {"buildString": "3*Die(6)", "queries": [10]},
+        "isBase64Encoded": False,
+        "headers": headers,
+    }
+    assert json.loads(lambda_handler(event, None)["body"]) == {"queries": [50.0]}
+
+
+def test_queries_request_fields():
+    event = {
+        "body": {
+            "buildString": "3*Die(6)",
+            "queries": [[11, None]],
+            "fields": ["mean"],
+        },
+        "isBase64Encoded": False,
+    }
+    assert json.loads(lambda_handler(event, None)["body"]) == {
+        "mean": 10.5,
+        "queries": [50.0],
+    }
+
+
+def test_queries_request_bad_queries():
+    event = {
+        "body": {"buildString": "3*Die(6)", "queries": [[1, 2, 3]]},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 404
+    assert (
+        json.loads(response["body"])["errorMessage"]
+        == "A query must be a roll or [low, high], not [1, 2, 3]"
+    )
+
+
+def test_max_points_request():
+    event = {
+        "body": {"buildString": "10*Die(6)", "fields": ["data"], "maxPoints": 5},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 200
+    data = json.loads(response["body"])["data"]
+    assert len(data["x"]) == len(data["y"]) == 5
+    assert (data["x"][0], data["x"][-1]) == (10, 60)
+
+
+def test_max_points_batch_request():
+    event = {
+        "body": {
+            "buildStrings": ["10*Die(6)", "2*Die(6)"],
+            "fields": ["data"],
+            "maxPoints": 5,
+        },
+        "isBase64Encoded": False,
+    }
+    results = json.loads(lambda_handler(event, None)["body"])["results"]
+    assert [len(result["body"]["data"]["x"]) for result in results] == [5, 5]
+
+
+def test_max_points_request_bad_max_points():
+    event = {
+        "body": {"buildString": "10*Die(6)", "maxPoints": 2},
+        "isBase64Encoded": False,
+    }
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 404
+    assert (
+        json.loads(response["body"])["errorMessage"]
+        == "maxPoints must be an integer of at least 3"
+    )
+
+
+def test_handler_engine_is_parallel():
+    assert isinstance(HANDLER.engine, ParallelEngine)
+    assert HANDLER.engine.engine is DEFAULT_ENGINE
+    assert HANDLER.engine.min_size == 2000
+
+
+def test_get_engine_on_lambda(monkeypatch):
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "allthedice")
+    assert get_engine() is DEFAULT_ENGINE
+
+
+def test_get_engine_parallel_workers_one(monkeypatch):
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+    monkeypatch.setattr("lambda_function.PARALLEL_WORKERS", 1)
+    assert get_engine() is DEFAULT_ENGINE
+    monkeypatch.setattr("lambda_function.PARALLEL_WORKERS", 3)
+    assert get_engine().max_workers == 3
+
+
+def test_get_table_store(monkeypatch, tmp_path):
+    monkeypatch.setattr("lambda_function.TABLE_STORE_DIR", None)
+    assert get_table_store() is None
+    monkeypatch.setattr("lambda_function.TABLE_STORE_DIR", str(tmp_path))
+    assert get_table_store().min_events == 500
+
+
+def test_get_response_bundle_no_file(monkeypatch, tmp_path):
+    monkeypatch.setattr("lambda_function.RESPONSE_BUNDLE", str(tmp_path / "none.bin"))
+    assert get_response_bundle() is None
+
+
+def test_import_on_lambda_leaves_optional_modules():
+    optional = [
+        "request_handler.parallel",
+        "request_handler.queries",
+        "request_handler.response_bundle",
+        "request_handler.rolls",
+        "request_handler.stats",
+        "request_handler.table_store",
+        "request_handler.timings",
+        "array",
+        "fractions",
+        "tracemalloc",
+    ]
+    code = (
+        "import sys, lambda_function; "
+        f"print([name for name in {optional!r} if name in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={
+            "AWS_LAMBDA_FUNCTION_NAME": "allthedice",
+            "RESPONSE_BUNDLE": "none.bin",
+            "WARM_MANIFEST": "none.json",
+            "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        },
+    ).stdout
+    assert output.splitlines()[-1] == "[]"
+
+
+@pytest.mark.parametrize(
+    "environment, expected",
+    [
+        ({}, None),
+        ({"MEMORY_BUDGET": "1000"}, 1000),
+        ({"AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024"}, 512 * 2**20),
+        ({"AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024", "MEMORY_BUDGET": "1000"}, 1000),
+        ({"MEMORY_BUDGET": ""}, None),
+    ],
+)
+def test_get_memory_budget(monkeypatch, environment, expected):
+    monkeypatch.delenv("MEMORY_BUDGET", raising=False)
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", raising=False)
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+    assert get_memory_budget() == expected
+
+
+def test_over_memory_budget_request():
+    event = {"body": {"buildString": "2000*Die(2)"}, "isBase64Encoded": False}
+    with patch.object(HANDLER, "_memory_budget", 2**20):
+        response = lambda_handler(event, None)
+    assert response["statusCode"] == 404
+    assert json.loads(response["body"])["errorType"] == "MemoryBudgetError"
@@ -0,0 +1,198 @@
+import os
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+from dicetables import DiceTable, DiceRecord, Die, Exploding, StrongDie, WeightedDie
+
+from request_handler.convolution import (
+    DEFAULT_ENGINE,
+    DiceTablesEngine,
+    PackedDecimalEngine,
+)
+from request_handler.dice_tables_tequest_handler import construct_dice_table
+from request_handler.parallel import ParallelEngine, available_cpus, get_events, merge
+from request_handler.result_cache import ResultCache, estimate_table_size
+from tests.test_requesthandler import DICE_EXAMPLES
+
+
+@pytest.fixture(scope="module")
+def parallel():
+    engine = ParallelEngine(min_size=0, max_workers=2)
+    yield engine
+    engine.shutdown()
+
+
+def test_available_cpus():
+    assert 1 <= available_cpus() <= (os.cpu_count() or 1)
+
+
+def test_parallel_engine_defaults():
+    engine = ParallelEngine()
+    assert engine.engine is DEFAULT_ENGINE
+    assert engine.min_size == 2000
+    assert engine.max_workers == available_cpus()
+
+
+def test_parallel_engine_set_max_workers():
+    engine = ParallelEngine(min_size=0, max_workers=2)
+    engine.max_workers = 1
+    assert engine.max_workers == 1
+    assert not engine.uses_pool({Die(6): 10, Die(10): 5})
+
+
+def test_parallel_engine_add_die_uses_engine():
+    engine = ParallelEngine(DiceTablesEngine(), min_size=0, max_workers=2)
+    table = DiceTable.new().add_die(Die(4))
+    assert engine.add_die(table, Die(6), 3) == table.add_die(Die(6), 3)
+    assert engine.supports(table, Die(6), 3)
+
+
+def test_parallel_engine_uses_pool():
+    engine = ParallelEngine(min_size=100, max_workers=2)
+    assert engine.uses_pool({Die(6): 10, Die(10): 5})
+    assert not engine.uses_pool({Die(6): 10, Die(10): 3})
+    assert not engine.uses_pool({Die(6): 100})
+    assert not engine.uses_pool({Die(6): 100, Die(10): 0})
+
+
+def test_parallel_engine_one_worker_never_uses_pool():
+    assert not ParallelEngine(min_size=0, max_workers=1).uses_pool(
+        {Die(6): 10, Die(10): 5}
+    )
+
+
+def test_get_events():
+    assert (
+        get_events(DEFAULT_ENGINE, Die(6), 3)
+        == DiceTable.new().add_die(Die(6), 3).get_dict()
+    )
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ({1: 1, 2: 1}, {1: 2, 2: 1}),
+        ({1: 1, 50: 2}, {1: 1, 2: 1}),
+        ({-3: 1}, {10: 4, 20: 5}),
+    ],
+)
+def test_merge(first, second):
+    expected = (
+        DiceTable(first, DiceRecord.new())
+        .combine(DiceTable(second, DiceRecord.new()))
+        .get_dict()
+    )
+    assert merge(first, second) == expected
+
+
+@pytest.mark.parametrize(
+    "dice",
+    [
+        {Die(6): 10, Die(10): 5},
+        {Die(6): 10, Die(10): 5, Die(20): 2},
+        {Die(4): 3, Die(6): 2, Die(8): 1, Die(12): 2, Die(20): 1},
+        {StrongDie(Die(6), 10): 3, Die(6): 4, Exploding(Die(4), 2): 3},
+        {WeightedDie({1: 1, 30: 2}): 2, Die(3): 0, Die(100): 2},
+        dict((die, 2) for die in DICE_EXAMPLES),
+    ],
+)
+def test_parallel_engine_matches_dice_tables_engine(parallel, dice):
+    expected = DiceTablesEngine().add_dice(DiceTable.new(), dice)
+    actual = parallel.add_dice(DiceTable.new(), dice)
+    assert actual == expected
+    assert actual.dice_data() == expected.dice_data()
+
+
+def test_parallel_engine_from_start_table(parallel):
+    start = DiceTable.new().add_die(Die(6), 3)
+    dice = {Die(6): 2, Die(10): 4}
+    actual = parallel.add_dice(start, dice)
+    assert actual == start.add_die(Die(6), 2).add_die(Die(10), 4)
+    assert actual.dice_data() == DiceRecord({Die(6): 5, Die(10): 4})
+
+
+def test_parallel_engine_under_min_size_adds_in_process():
+    engine = ParallelEngine(min_size=10**6, max_workers=2)
+    with patch("concurrent.futures.ProcessPoolExecutor") as mock_pool:
+        table = engine.add_dice(DiceTable.new(), {Die(6): 2, Die(4): 2})
+    mock_pool.assert_not_called()
+    assert table == DiceTable.new().add_die(Die(6), 2).add_die(Die(4), 2)
+
+
+@pytest.mark.parametrize(
+    "error", [OSError("no /dev/shm"), NotImplementedError("no semaphores")]
+)
+def test_parallel_engine_no_pool_adds_in_process(error):
+    engine = ParallelEngine(min_size=0, max_workers=2)
+    with patch(
+        "concurrent.futures.ProcessPoolExecutor", side_effect=error
+    ) as mock_pool:
+        first = engine.add_dice(DiceTable.new(), {Die(6): 2, Die(4): 2})
+        second = engine.add_dice(DiceTable.new(), {Die(6): 3, Die(4): 2})
+    assert mock_pool.call_count == 1
+    assert first == DiceTable.new().add_die(Die(6), 2).add_die(Die(4), 2)
+    assert second == DiceTable.new().add_die(Die(6), 3).add_die(Die(4), 2)
+    assert not engine.uses_pool({Die(6): 2, Die(4): 2})
+
+
+def broken_future(*args):
+    future = Future()
+    future.set_exception(BrokenProcessPool("a worker died"))
+    return future
+
+
+@pytest.mark.parametrize(
+    "submit",
+    [
+        {"side_effect": BrokenProcessPool("a worker died")},
+        {"side_effect": broken_future},
+    ],
+)
+def test_parallel_engine_broken_pool_adds_in_process_and_starts_a_new_one(submit):
+    engine = ParallelEngine(min_size=0, max_workers=2)
+    dice = {Die(6): 2, Die(4): 2}
+    with patch("concurrent.futures.ProcessPoolExecutor") as mock_pool:
+        mock_pool.return_value.submit.configure_mock(**submit)
+        first = engine.add_dice(DiceTable.new(), dice)
+        mock_pool.return_value.shutdown.assert_called_once_with(wait=False)
+        second = engine.add_dice(DiceTable.new(), dice)
+    assert first == second == DiceTable.new().add_die(Die(6), 2).add_die(Die(4), 2)
+    assert first.dice_data() == DiceRecord(dice)
+    assert mock_pool.call_count == 2
+    assert engine.uses_pool(dice)
+
+
+def test_parallel_engine_worker_dies(parallel):
+    broken = parallel._get_executor()
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result(10)
+    dice = {Die(6): 3, Die(8): 2}
+    assert parallel.add_dice(DiceTable.new(), dice) == DiceTablesEngine().add_dice(
+        DiceTable.new(), dice
+    )
+    assert parallel._get_executor() is not broken
+    assert parallel.add_dice(DiceTable.new(), dice) == DiceTablesEngine().add_dice(
+        DiceTable.new(), dice
+    )
+
+
+def test_parallel_engine_with_construct_dice_table(parallel):
+    table_cache = ResultCache(sizer=estimate_table_size)
+    construct_dice_table(DiceRecord({Die(6): 4}), table_cache, parallel)
+    record = DiceRecord({Die(6): 6, Die(8): 3, Die(20): 2})
+    actual = construct_dice_table(record, table_cache, parallel)
+    assert actual == construct_dice_table(record)
+    assert actual.dice_data() == record
+
+
+def test_parallel_engine_wrapping_packed_engine():
+    engine = ParallelEngine(PackedDecimalEngine(min_size=0), min_size=0, max_workers=2)
+    dice = {Die(100): 10, Die(6): 30}
+    try:
+        assert engine.add_dice(DiceTable.new(), dice) == DiceTablesEngine().add_dice(
+            DiceTable.new(), dice
+        )
+    finally:
+        engine.shutdown()
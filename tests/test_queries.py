@@ -0,0 +1,153 @@
+from fractions import Fraction
+
+import pytest
+from dicetables import DiceTable, Die, WeightedDie
+from dicetables.eventsinfo import get_fast_pct_number
+
+from request_handler.dice_tables_tequest_handler import make_dict
+from request_handler.queries import (
+    MAX_QUERIES,
+    PrefixSums,
+    answer_queries,
+    parse_queries,
+)
+
+
+@pytest.fixture
+def two_d6():
+    return PrefixSums(DiceTable.new().add_die(Die(6), 2))
+
+
+def test_prefix_sums_total(two_d6):
+    assert two_d6.total == 36
+
+
+@pytest.mark.parametrize(
+    "low, high, expected",
+    [
+        (None, None, 36),
+        (None, 2, 1),
+        (None, 7, 21),
+        (7, 7, 6),
+        (7, None, 21),
+        (12, None, 1),
+        (2, 12, 36),
+        (-100, 100, 36),
+        (None, 1, 0),
+        (13, None, 0),
+        (8, 7, 0),
+        (10, 3, 0),
+    ],
+)
+def test_prefix_sums_count(two_d6, low, high, expected):
+    assert two_d6.count(low, high) == expected
+
+
+def test_prefix_sums_count_sparse_table():
+    table = DiceTable.new().add_die(WeightedDie({1: 1, 5: 2, 10: 3}))
+    prefix_sums = PrefixSums(table)
+    assert prefix_sums.count(2, 9) == 2
+    assert prefix_sums.count(6, 9) == 0
+    assert prefix_sums.count(None, 5) == 3
+    assert prefix_sums.count(6, None) == 3
+
+
+def test_prefix_sums_count_matches_table():
+    table = DiceTable.new().add_die(Die(6), 3).add_die(Die(4), 2)
+    events = table.get_dict()
+    prefix_sums = PrefixSums(table)
+    for low in range(4, 27):
+        for high in range(low, 27):
+            expected = sum(events.get(roll, 0) for roll in range(low, high + 1))
+            assert prefix_sums.count(low, high) == expected
+
+
+def test_prefix_sums_empty_record():
+    prefix_sums = PrefixSums(DiceTable.new())
+    assert prefix_sums.total == 1
+    assert prefix_sums.count(None, 0) == 1
+
+
+def test_prefix_sums_size(two_d6):
+    bigger = PrefixSums(DiceTable.new().add_die(Die(6), 20))
+    assert 0 < two_d6.size() < bigger.size()
+
+
+def test_parse_queries():
+    assert parse_queries([3, [2, 5], [None, 4], [7, None], [None, None]]) == [
+        (None, 3),
+        (2, 5),
+        (None, 4),
+        (7, None),
+        (None, None),
+    ]
+
+
+def test_parse_queries_empty():
+    assert parse_queries([]) == []
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        True,
+        1.5,
+        "3",
+        None,
+        [1],
+        [1, 2, 3],
+        [1, "2"],
+        [1.0, 2],
+        [False, 2],
+        (1, 2),
+        {"low": 1},
+    ],
+)
+def test_parse_queries_bad_query(query):
+    with pytest.raises(ValueError, match="A query must be a roll or \\[low, high\\]"):
+        parse_queries([query])
+
+
+@pytest.mark.parametrize("queries", [3, "3", {"a": 1}, [1] * (MAX_QUERIES + 1)])
+def test_parse_queries_not_a_list(queries):
+    with pytest.raises(
+        ValueError, match=f"queries must be a list of at most {MAX_QUERIES}"
+    ):
+        parse_queries(queries)
+
+
+def test_answer_queries_percent(two_d6):
+    queries = parse_queries([7, [7, 7], [15, None]])
+    assert answer_queries(two_d6, queries) == [
+        get_fast_pct_number(21, 36),
+        get_fast_pct_number(6, 36),
+        0.0,
+    ]
+
+
+def test_answer_queries_fraction(two_d6):
+    queries = parse_queries([7, [7, 7], [15, None], [None, None], [12, 12]])
+    assert answer_queries(two_d6, queries, "fraction") == [
+        "7/12",
+        "1/6",
+        "0/1",
+        "1/1",
+        "1/36",
+    ]
+
+
+def test_answer_queries_fraction_is_exact():
+    table = DiceTable.new().add_die(Die(6), 100)
+    prefix_sums = PrefixSums(table)
+    [answer] = answer_queries(prefix_sums, [(None, 350)], "fraction")
+    numerator, denominator = map(int, answer.split("/"))
+    events = table.get_dict()
+    expected = Fraction(sum(events[roll] for roll in range(100, 351)), 6**100)
+    assert Fraction(numerator, denominator) == expected
+    assert (numerator, denominator) == (expected.numerator, expected.denominator)
+
+
+def test_answer_queries_percent_matches_data(two_d6):
+    data = make_dict(DiceTable.new().add_die(Die(6), 2), ("data",))["data"]
+    answers = answer_queries(two_d6, [(roll, roll) for roll in data["x"]])
+    assert answers == list(data["y"])
@@ -1,3 +1,5 @@
+from base64 import b64decode
+import json
 import string
 
 import pytest
@@ -22,13 +24,51 @@ from dicetables import (
     LowerMidOfDicePool,
     UpperMidOfDicePool,
     DicePool,
+    EventsCalculations,
+    Roller,
 )
+from dicetables.eventsinfo import get_fast_pct_number
 
 from request_handler.dice_tables_tequest_handler import (
     DiceTablesRequestHandler,
     make_dict,
     construct_dice_table,
+    get_fields,
+    normalize_die_string,
+    iter_json,
+    FIELDS,
+    OPTIONAL_FIELDS,
 )
+from request_handler.convolution import (
+    DEFAULT_ENGINE,
+    DiceTablesEngine,
+    PackedDecimalEngine,
+)
+from request_handler.cost_model import DEFAULT_COST_MODEL, CostModel, MemoryBudgetError
+from request_handler.downsample import lttb
+from request_handler.result_cache import ResultCache, record_key
+from request_handler.timings import StageTimings
+
+CREATE_DICE_RECORD_ERRORS = [
+    ("2*Die(5) & *Die(4)", ValueError),
+    ('3 * die("a")', ValueError),
+    ("* Die(4)", ValueError),
+    ("WeightedDie({-1: 1})", ValueError),
+    ("Die(4) * 3 * Die(5)", ValueError),
+    ("2 * die(5) $ 4 * die(6)", ValueError),
+    ("3 die(3)", SyntaxError),
+    ("4 $ die(5)", SyntaxError),
+    ("die(5", SyntaxError),
+    ("3 * moddie(2)", ParseError),
+    ("die(1, 2, 3)", ParseError),
+    ("notadie(5)", ParseError),
+    ("die(30000)", LimitsError),
+    ("-2*die(2)", DiceRecordError),
+    ("3 & die(3)", AttributeError),
+    ("WeightedDie({1, 2})", AttributeError),
+    ("WeightedDie({1: -1})", InvalidEventsError),
+    ("die(-1)", InvalidEventsError),
+]
 
 
 @pytest.fixture
@@ -144,29 +184,7 @@ class TestRequestHandler(object):
         request = "dIe(DiE_sIzE=3)"
         assert handler.create_dice_record(request) == expected
 
-    @pytest.mark.parametrize(
-        "instructions, error",
-        [
-            ("2*Die(5) & *Die(4)", ValueError),
-            ('3 * die("a")', ValueError),
-            ("* Die(4)", ValueError),
-            ("WeightedDie({-1: 1})", ValueError),
-            ("Die(4) * 3 * Die(5)", ValueError),
-            ("2 * die(5) $ 4 * die(6)", ValueError),
-            ("3 die(3)", SyntaxError),
-            ("4 $ die(5)", SyntaxError),
-            ("die(5", SyntaxError),
-            ("3 * moddie(2)", ParseError),
-            ("die(1, 2, 3)", ParseError),
-            ("notadie(5)", ParseError),
-            ("die(30000)", LimitsError),
-            ("-2*die(2)", DiceRecordError),
-            ("3 & die(3)", AttributeError),
-            ("WeightedDie({1, 2})", AttributeError),
-            ("WeightedDie({1: -1})", InvalidEventsError),
-            ("die(-1)", InvalidEventsError),
-        ],
-    )
+    @pytest.mark.parametrize("instructions, error", CREATE_DICE_RECORD_ERRORS)
     def test_create_dice_record_each_error_raised(self, handler, instructions, error):
         with pytest.raises(error):
             handler.create_dice_record(instructions)
@@ -216,6 +234,50 @@ class TestRequestHandler(object):
         else:
             handler.assert_dice_record_within_limits(record)
 
+    def test_create_dice_record_rejects_large_number_before_parsing(self):
+        handler = DiceTablesRequestHandler(max_dice_value=100)
+        with pytest.raises(ValueError) as error:
+            handler.create_dice_record("101*notadie(5)")
+        assert error.value.args[0] == (
+            "Record: DiceRecord({}) and 101*notadie(5) have a sum of dictionaries greater than 100"
+        )
+
+    def test_create_dice_record_rejects_before_parsing_later_dice(self, monkeypatch):
+        handler = DiceTablesRequestHandler(max_dice_value=100)
+        parsed = []
+        parse_die = handler.parse_die
+
+        def counting_parse_die(die_string):
+            parsed.append(die_string)
+            return parse_die(die_string)
+
+        monkeypatch.setattr(handler, "parse_die", counting_parse_die)
+        with pytest.raises(ValueError):
+            handler.create_dice_record("&".join(["10*Die(6)"] * 1000))
+        assert len(parsed) == 2
+
+    @pytest.mark.parametrize(
+        "instructions, max_dice_value",
+        [
+            ("2*Exploding(Die(6))", 32),
+            ("ExplodingOn(Die(6), (5, 6), 2)", 17),
+            ("3*BestOfDicePool(DicePool(WeightedDie({1: 1, 10: 1}), 4), 3)", 12),
+            ("Die(6) & 2*ExplodingOn(Die(4), (3, 4), 3) & Modifier(2)", 6 + 2 * 15 + 1),
+        ],
+    )
+    def test_create_dice_record_estimates_do_not_reject_records_within_limits(
+        self, instructions, max_dice_value
+    ):
+        handler = DiceTablesRequestHandler(max_dice_value=max_dice_value)
+        record = handler.create_dice_record(instructions)
+        handler.assert_dice_record_within_limits(record)
+
+        handler_that_errors = DiceTablesRequestHandler(
+            max_dice_value=max_dice_value - 1
+        )
+        with pytest.raises(ValueError):
+            handler_that_errors.create_dice_record(instructions)
+
     def test_construct_dice_table_single_die(self):
         die = Die(2)
         number = 3
@@ -244,6 +306,15 @@ class TestRequestHandler(object):
         )
         assert actual == expected
 
+    @pytest.mark.parametrize("die", DICE_EXAMPLES)
+    @pytest.mark.parametrize("number", [1, 10, 50])
+    def test_construct_dice_table_many_of_each_die(self, die, number):
+        record = DiceRecord.new().add_die(Die(3), 2).add_die(die, number)
+        actual = construct_dice_table(record)
+
+        expected = DiceTable.new().add_die(Die(3), 2).add_die(die, number)
+        assert actual == expected
+
     def test_make_dict_simple_table(self, handler):
         answer = make_dict(DiceTable.new().add_die(Die(4)))
         expected = {
@@ -274,7 +345,7 @@ class TestRequestHandler(object):
         assert answer == expected
 
     def test_make_dict_large_number_table(self, handler):
-        table = DiceTable({1: 1, 2: 9 ** 351}, DiceRecord.new())
+        table = DiceTable({1: 1, 2: 9**351}, DiceRecord.new())
         answer = make_dict(table)
         expected = {
             "data": {"x": (1, 2), "y": (0.0, 100.0)},
@@ -506,10 +577,16 @@ class TestRequestHandler(object):
                     "errorType": "ValueError",
                 },
             ),
-            ("3 die(3)", {"errorMessage": "invalid syntax", "errorType": "SyntaxError"}),
+            (
+                "3 die(3)",
+                {"errorMessage": "invalid syntax", "errorType": "SyntaxError"},
+            ),
             (
                 '3 * die("a")',
-                {"errorMessage": "Expected an integer, but got: 'a'", "errorType": "ValueError"},
+                {
+                    "errorMessage": "Expected an integer, but got: 'a'",
+                    "errorType": "ValueError",
+                },
             ),
             (
                 "3 * moddie(1)",
@@ -527,7 +604,10 @@ class TestRequestHandler(object):
             ),
             (
                 "die(1, 2, 3)",
-                {"errorMessage": "Too many parameters for class: die", "errorType": "ParseError"},
+                {
+                    "errorMessage": "Too many parameters for class: die",
+                    "errorType": "ParseError",
+                },
             ),
             (
                 "die(30000)",
@@ -564,3 +644,851 @@ class TestRequestHandler(object):
     ):
         response = handler.get_response(instructions)
         assert response == expected
+
+    def test_init_result_cache_default_none(self, handler):
+        assert handler.result_cache is None
+
+    def test_get_response_with_result_cache_matches_uncached(self, handler):
+        cached_handler = DiceTablesRequestHandler(result_cache=ResultCache())
+        request = "2*Die(6)&Die(4)"
+        assert cached_handler.get_response(request) == handler.get_response(request)
+
+    def test_get_response_result_cache_uses_canonical_record(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(result_cache=cache)
+        first = handler.get_response("2*Die(6)&Die(4)")
+        second = handler.get_response("die(4) & 2*DIE(6)")
+        assert first is second
+        assert cache.stats() == {
+            "entries": 1,
+            "bytes": cache.current_bytes,
+            "hits": 1,
+            "misses": 1,
+        }
+
+    def test_get_response_result_cache_does_not_store_errors(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(max_dice_value=6, result_cache=cache)
+        response = handler.get_response("3*Die(6)")
+        assert response["errorType"] == "ValueError"
+        assert len(cache) == 0
+
+    def test_init_parse_cache_default_none(self, handler):
+        assert handler.parse_cache is None
+
+    @pytest.mark.parametrize(
+        "die_string, expected",
+        [
+            ("Die(6)", "die(6)"),
+            ("  DIE ( 6 )\t", "die(6)"),
+            ("ModDie(4, -2)", "moddie(4,-2)"),
+            (
+                "moddie( die_size = 4 , modifier = - 2 )",
+                "moddie(die_size=4,modifier=-2)",
+            ),
+            ("Die(1 2)", "die(1 2)"),
+            ("StrongDie(Die(6),  2)", "strongdie(die(6),2)"),
+        ],
+    )
+    def test_normalize_die_string(self, die_string, expected):
+        assert normalize_die_string(die_string) == expected
+
+    def test_parse_die_with_parse_cache_uses_normalized_key(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(parse_cache=cache)
+        assert handler.parse_cache is cache
+        first = handler.parse_die("Exploding(Die(6), 3)")
+        second = handler.parse_die(" exploding ( die(6),3 )")
+        assert first is second
+        assert first == Exploding(Die(6), 3)
+        assert cache.keys() == ["exploding(die(6),3)"]
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_parse_die_with_parse_cache_does_not_store_errors(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(parse_cache=cache)
+        handler.parse_die("Die(12)")
+        with pytest.raises(SyntaxError):
+            handler.parse_die("Die(1 2)")
+        with pytest.raises(LimitsError):
+            handler.parse_die("Die(501)")
+        assert cache.keys() == ["die(12)"]
+
+    @pytest.mark.parametrize("instructions, error", CREATE_DICE_RECORD_ERRORS)
+    def test_create_dice_record_with_parse_cache_each_error_raised(
+        self, instructions, error
+    ):
+        handler = DiceTablesRequestHandler(parse_cache=ResultCache())
+        with pytest.raises(error):
+            handler.create_dice_record(instructions)
+
+    @pytest.mark.parametrize(
+        "die_string, expected",
+        [
+            ("Die(6)", Die(6)),
+            ("die( 500 )", Die(500)),
+            ("MODDIE(4, -2)", ModDie(4, -2)),
+            ("ModDie(1, 0)", ModDie(1, 0)),
+        ],
+    )
+    def test_parse_die_fast_path_skips_parser(self, monkeypatch, die_string, expected):
+        handler = DiceTablesRequestHandler()
+
+        def fail(*_):
+            raise AssertionError("should not use the parser")
+
+        monkeypatch.setattr(handler._parser, "parse_die", fail)
+        assert handler.parse_die(die_string) == expected
+
+    @pytest.mark.parametrize(
+        "die_string, error",
+        [
+            ("Die(501)", LimitsError),
+            ("ModDie(501, 1)", LimitsError),
+            ("Die(0)", InvalidEventsError),
+            ("Die(-3)", InvalidEventsError),
+            ("Die(06)", SyntaxError),
+            ("ModDie(4, 07)", SyntaxError),
+            ("ModDie(4, -07)", SyntaxError),
+            ("ModDie(4, +2)", ValueError),
+        ],
+    )
+    def test_parse_die_fast_path_leaves_errors_to_parser(self, die_string, error):
+        with pytest.raises(error):
+            DiceTablesRequestHandler().parse_die(die_string)
+
+    def test_parse_die_fast_path_matches_parser(self, handler):
+        for die_string in ["Die({})".format(size) for size in range(1, 501)] + [
+            "ModDie({}, {})".format(size, mod)
+            for size in range(1, 20)
+            for mod in range(-20, 20)
+        ]:
+            expected = handler._parser.parse_die(die_string)
+            assert handler.parse_die(die_string) == expected
+
+    def test_init_table_cache_default_none(self, handler):
+        assert handler.table_cache is None
+
+    def test_init_engine_default(self, handler):
+        assert handler.engine is DEFAULT_ENGINE
+
+    def test_construct_dice_table_with_engine(self):
+        record = DiceRecord.new().add_die(Die(6), 30).add_die(Die(2), 2)
+        packed = construct_dice_table(record, engine=PackedDecimalEngine(min_size=0))
+        reference = construct_dice_table(record, engine=DiceTablesEngine())
+        assert packed == reference
+
+    def test_get_response_with_engine(self, handler):
+        engine_handler = DiceTablesRequestHandler(engine=DiceTablesEngine())
+        request = "20*Die(6)&Die(4)"
+        assert engine_handler.get_response(request) == handler.get_response(request)
+
+    def test_construct_dice_table_with_table_cache_stores_table(self):
+        cache = ResultCache()
+        record = DiceRecord.new().add_die(Die(2), 3)
+        actual = construct_dice_table(record, cache)
+        assert actual == DiceTable.new().add_die(Die(2), 3)
+        assert cache.get(record_key(record)) is actual
+
+    def test_construct_dice_table_with_table_cache_returns_cached_table(self):
+        cache = ResultCache()
+        record = DiceRecord.new().add_die(Die(2), 3)
+        first = construct_dice_table(record, cache)
+        assert construct_dice_table(record, cache) is first
+
+    def test_construct_dice_table_starts_from_largest_sub_record(self):
+        cache = ResultCache()
+        small = DiceRecord.new().add_die(Die(6), 2)
+        large = DiceRecord.new().add_die(Die(6), 10)
+        not_sub_record = DiceRecord.new().add_die(Die(6), 11)
+        for record in (small, large, not_sub_record):
+            construct_dice_table(record, cache)
+
+        target = DiceRecord.new().add_die(Die(6), 10).add_die(Die(8), 1)
+        hits = cache.hits
+        actual = construct_dice_table(target, cache)
+
+        assert actual == DiceTable.new().add_die(Die(6), 10).add_die(Die(8), 1)
+        assert cache.hits == hits + 1
+        assert cache.keys()[-1] == record_key(target)
+
+    @pytest.mark.parametrize("die", DICE_EXAMPLES)
+    def test_construct_dice_table_with_table_cache_matches_uncached(self, die):
+        cache = ResultCache()
+        construct_dice_table(DiceRecord.new().add_die(die, 1), cache)
+        record = DiceRecord.new().add_die(die, 2).add_die(Die(3), 1)
+        assert construct_dice_table(record, cache) == construct_dice_table(record)
+
+    def test_get_response_with_table_cache(self, handler):
+        cache = ResultCache()
+        cached_handler = DiceTablesRequestHandler(table_cache=cache)
+        cached_handler.get_response("10*Die(6)")
+        request = "10*Die(6)&Die(8)"
+        assert cached_handler.get_response(request) == handler.get_response(request)
+        assert len(cache) == 2
+
+    def test_get_responses_empty(self, handler):
+        assert handler.get_responses([]) == []
+
+    def test_get_responses_same_order_as_get_response(self, handler):
+        requests = ["10*Die(6)&Die(8)", "Die(4)", "10*Die(6)", "10*Die(6)&Die(4)"]
+        expected = [handler.get_response(request) for request in requests]
+        assert handler.get_responses(requests) == expected
+
+    def test_get_responses_bad_entries_do_not_fail_batch(self, handler):
+        requests = ["Die(2)", "die(30000)", 3, "3 die(3)", "Die(2)"]
+        responses = handler.get_responses(requests)
+        assert responses[0] == handler.get_response("Die(2)")
+        assert responses[1]["errorType"] == "LimitsError"
+        assert responses[2]["errorType"] == "AttributeError"
+        assert responses[3]["errorType"] == "SyntaxError"
+        assert responses[4] == responses[0]
+
+    def test_get_responses_builds_shared_sub_tables_once(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(table_cache=cache)
+        handler.get_responses(["10*Die(6)&Die(8)", "10*Die(6)&Die(4)"])
+        assert sorted(cache.keys()) == [
+            (("Die(4)", 1), ("Die(6)", 10)),
+            (("Die(6)", 10),),
+            (("Die(6)", 10), ("Die(8)", 1)),
+        ]
+
+    def test_get_responses_uses_result_cache(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(result_cache=cache)
+        first, second = handler.get_responses(["2*Die(6)&Die(4)", "die(4) & 2*DIE(6)"])
+        assert first is second
+        assert cache.hits == 1
+
+    def test_get_fields_default_is_all(self):
+        assert get_fields() == FIELDS
+        assert FIELDS == (
+            "diceStr",
+            "name",
+            "data",
+            "tableString",
+            "forSciNum",
+            "range",
+            "mean",
+            "stddev",
+            "roller",
+        )
+
+    def test_optional_fields(self):
+        assert OPTIONAL_FIELDS == ("compactRoller",)
+        assert get_fields(["compactRoller", "roller", "mean"]) == (
+            "mean",
+            "roller",
+            "compactRoller",
+        )
+
+    def test_get_fields_ordered_and_without_duplicates(self):
+        assert get_fields(["mean", "data", "mean"]) == ("data", "mean")
+
+    @pytest.mark.parametrize("fields", [["mean", "nope"], "mean", [1]])
+    def test_get_fields_bad_fields(self, fields):
+        with pytest.raises(ValueError):
+            get_fields(fields)
+
+    def test_make_dict_fields(self):
+        table = DiceTable.new().add_die(Die(4))
+        answer = make_dict(table, ["mean", "data"])
+        assert answer == {
+            "data": {"x": (1, 2, 3, 4), "y": (25.0, 25.0, 25.0, 25.0)},
+            "mean": 2.5,
+        }
+
+    def test_make_dict_compact_roller(self):
+        table = DiceTable.new().add_die(Die(6), 3)
+        alias_table = Roller(table).alias_table
+        aliases = alias_table.to_list()
+        compact = make_dict(table, ["compactRoller"])["compactRoller"]
+        assert compact == {
+            "height": "216",
+            "primaries": [alias.primary for alias in aliases],
+            "alternates": [alias.alternate for alias in aliases],
+            "primaryHeights": [
+                None if alias.primary_height == 216 else str(alias.primary_height)
+                for alias in aliases
+            ],
+        }
+        assert compact["primaryHeights"][:3] == ["16", "40", "160"]
+        assert compact["primaryHeights"][-1] is None
+
+    @pytest.mark.parametrize("die", DICE_EXAMPLES)
+    def test_make_dict_compact_roller_matches_roller(self, die):
+        table = DiceTable.new().add_die(die, 2)
+        answer = make_dict(table, ["roller", "compactRoller"])
+        roller, compact = answer["roller"], answer["compactRoller"]
+        assert compact["height"] == roller["height"]
+        expected = [
+            (alias["primary"], alias["alternate"], alias["primaryHeight"])
+            for alias in roller["aliases"]
+        ]
+        heights = [
+            roller["height"] if height is None else height
+            for height in compact["primaryHeights"]
+        ]
+        primaries = [str(primary) for primary in compact["primaries"]]
+        alternates = [str(alternate) for alternate in compact["alternates"]]
+        assert list(zip(primaries, alternates, heights)) == expected
+
+    def test_make_dict_default_has_no_compact_roller(self):
+        assert "compactRoller" not in make_dict(DiceTable.new().add_die(Die(4)))
+
+    def test_make_dict_fields_empty(self):
+        assert make_dict(DiceTable.new().add_die(Die(4)), []) == {}
+
+    def test_make_dict_fields_only_computes_requested(self, monkeypatch):
+        def fail(*_):
+            raise AssertionError("should not be called")
+
+        monkeypatch.setattr(EventsCalculations, "full_table_string", fail)
+        monkeypatch.setattr(Roller, "__init__", fail)
+        answer = make_dict(DiceTable.new().add_die(Die(4)), ["mean"])
+        assert answer == {"mean": 2.5}
+
+    def test_get_response_fields(self, handler):
+        full = handler.get_response("2*Die(6)")
+        answer = handler.get_response("2*Die(6)", ["range", "stddev"])
+        assert answer == {"range": full["range"], "stddev": full["stddev"]}
+
+    def test_get_response_bad_fields(self, handler):
+        answer = handler.get_response("2*Die(6)", ["nope"])
+        assert answer == {
+            "errorMessage": "Unknown fields: ['nope']",
+            "errorType": "ValueError",
+        }
+
+    def test_get_response_fields_cached_separately(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(result_cache=cache)
+        full = handler.get_response("2*Die(6)")
+        partial = handler.get_response("2*Die(6)", ["mean"])
+        assert partial == {"mean": full["mean"]}
+        assert len(cache) == 2
+
+    def test_get_responses_fields(self, handler):
+        answers = handler.get_responses(["Die(2)", "Die(1, 2)"], ["mean"])
+        assert answers == [
+            {"mean": 1.5},
+            {
+                "errorMessage": "Too many parameters for class: Die",
+                "errorType": "ParseError",
+            },
+        ]
+
+    @pytest.mark.parametrize(
+        "occurrences",
+        [
+            1,
+            9,
+            10,
+            999_999,
+            999_999_5,
+            123_456_789_012_345,
+            10**15 - 1,
+            2**1023,
+            10**308,
+            2**1024 - 1,
+            2**1024,
+            10**309 - 1,
+            10**400,
+            9**351,
+            7**5000,
+        ],
+    )
+    def test_make_dict_for_scinum_matches_full_table_string(self, occurrences):
+        table = DiceTable({-1: 3, 0: occurrences, 2: 1}, DiceRecord.new())
+        expected = []
+        for line in EventsCalculations(table).full_table_string(6, -1).split("\n"):
+            if not line:
+                continue
+            roll, number = line.split(": ")
+            mantissa, exponent = ("0", "0") if number == "0" else number.split("e+")
+            expected.append(
+                {"roll": int(roll), "mantissa": mantissa, "exponent": exponent}
+            )
+
+        assert make_dict(table, ["forSciNum"]) == {"forSciNum": expected}
+
+    @pytest.mark.parametrize("die", DICE_EXAMPLES)
+    def test_iter_json_matches_make_dict(self, die):
+        table = DiceTable.new().add_die(die, 3).add_die(Die(4), 2)
+        assert "".join(iter_json(table)) == json.dumps(make_dict(table))
+
+    @pytest.mark.parametrize(
+        "events",
+        [{0: 1}, {-20: 3, -3: 1, 5: 2}, {1: 10**400, 3: 1}, {-1: 3, 0: 7**5000, 2: 1}],
+    )
+    def test_iter_json_matches_make_dict_odd_events(self, events):
+        table = DiceTable(events, DiceRecord.new())
+        assert "".join(iter_json(table)) == json.dumps(make_dict(table))
+
+    @pytest.mark.parametrize(
+        "fields",
+        [
+            [],
+            ["mean"],
+            ["forSciNum", "name"],
+            ["roller", "data", "tableString"],
+            ["compactRoller", "mean"],
+        ],
+    )
+    def test_iter_json_fields(self, fields):
+        table = DiceTable.new().add_die(Die(6), 3)
+        assert "".join(iter_json(table, fields)) == json.dumps(make_dict(table, fields))
+
+    def test_iter_json_chunk_size(self):
+        table = DiceTable.new().add_die(Die(6), 30)
+        chunks = list(iter_json(table, chunk_size=1000))
+        assert len(chunks) > 10
+        assert all(len(chunk) >= 1000 for chunk in chunks[:-1])
+        assert all(len(chunk) < 2000 for chunk in chunks)
+        assert "".join(chunks) == json.dumps(make_dict(table))
+
+    def test_iter_json_is_lazy(self, monkeypatch):
+        table = DiceTable.new().add_die(Die(6), 30)
+        chunks = iter_json(table, ["forSciNum"], chunk_size=100)
+        next(chunks)
+
+        def fail(*_):
+            raise AssertionError("should not build the whole list")
+
+        monkeypatch.setattr(
+            "request_handler.dice_tables_tequest_handler._get_for_scinum", fail
+        )
+        assert len(list(chunks)) > 10
+
+    @pytest.mark.parametrize("fields", [None, ["range", "roller"]])
+    def test_iter_response_matches_get_response(self, handler, fields):
+        expected = json.dumps(
+            handler.get_response("2*Die(6)&Exploding(Die(4))", fields)
+        )
+        chunks = handler.iter_response("2*Die(6)&Exploding(Die(4))", fields)
+        assert "".join(chunks) == expected
+
+    @pytest.mark.parametrize("instructions", ["notadie(5)", "20000*Die(6)"])
+    def test_iter_response_error(self, handler, instructions):
+        chunks = list(handler.iter_response(instructions))
+        assert chunks == [json.dumps(handler.get_response(instructions))]
+
+    def test_iter_response_unknown_fields(self, handler):
+        response = json.loads("".join(handler.iter_response("Die(6)", ["nope"])))
+        assert response["errorType"] == "ValueError"
+
+    def test_iter_response_uses_result_cache_without_adding(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(result_cache=cache)
+        assert "".join(handler.iter_response("3*Die(6)"))
+        assert len(cache) == 0
+
+        answer = handler.get_response("3*Die(6)")
+        assert list(handler.iter_response("3*Die(6)")) == [json.dumps(answer)]
+
+    def test_make_dict_with_timings(self):
+        table = DiceTable.new().add_die(Die(6), 3)
+        timings = StageTimings()
+        assert make_dict(table, timings=timings) == make_dict(table)
+        assert list(timings.to_dict()) == ["calculations"] + list(FIELDS)
+
+    def test_get_response_with_timings(self, handler):
+        timings = StageTimings()
+        response = handler.get_response("3*Die(6)", ["mean", "range"], timings)
+        assert response == handler.get_response("3*Die(6)", ["mean", "range"])
+        stages = timings.to_dict()
+        assert list(stages) == ["parse", "table", "calculations", "range", "mean"]
+        assert all(stage["count"] == 1 for stage in stages.values())
+
+    def test_get_response_with_timings_cached(self):
+        handler = DiceTablesRequestHandler(result_cache=ResultCache())
+        handler.get_response("3*Die(6)")
+        timings = StageTimings()
+        handler.get_response("3*Die(6)", timings=timings)
+        assert list(timings.to_dict()) == ["parse"]
+
+    def test_get_response_with_timings_error(self, handler):
+        timings = StageTimings()
+        assert "errorMessage" in handler.get_response("notadie(3)", timings=timings)
+        assert list(timings.to_dict()) == ["parse"]
+
+    def test_get_responses_with_timings(self, handler):
+        timings = StageTimings()
+        handler.get_responses(["3*Die(6)", "2*Die(6)", "notadie(3)"], ["mean"], timings)
+        stages = timings.to_dict()
+        assert list(stages) == [
+            "parse",
+            "sharedTables",
+            "table",
+            "calculations",
+            "mean",
+        ]
+        assert stages["parse"]["count"] == 3
+        assert stages["table"]["count"] == 2
+
+    def test_max_rolls(self):
+        assert DiceTablesRequestHandler().max_rolls == 10**6
+        assert DiceTablesRequestHandler(max_rolls=10).max_rolls == 10
+
+    def test_get_rolls_histogram(self, handler):
+        answer = handler.get_rolls("3*Die(6)", 1000, seed=4)
+        assert list(answer) == ["rolls", "seed", "histogram"]
+        assert answer["rolls"] == 1000
+        assert answer["seed"] == 4
+        assert sum(answer["histogram"]["y"]) == 1000
+        assert set(answer["histogram"]["x"]) <= set(range(3, 19))
+
+    def test_get_rolls_packed(self, handler):
+        answer = handler.get_rolls("Die(6)&Die(4)", 10, seed=4, roll_format="packed")
+        assert list(answer) == ["rolls", "seed", "packed"]
+        assert answer["packed"]["start"] == 2
+        assert answer["packed"]["itemSize"] == 1
+        assert len(b64decode(answer["packed"]["data"])) == 10
+
+    def test_get_rolls_seed(self, handler):
+        first = handler.get_rolls("2*Die(20)", 500, seed=10)
+        assert handler.get_rolls("2*Die(20)", 500, seed=10) == first
+        assert handler.get_rolls("2*Die(20)", 500, seed=11) != first
+
+    def test_get_rolls_random_seed_is_returned(self, handler):
+        answer = handler.get_rolls("2*Die(20)", 500)
+        assert isinstance(answer["seed"], int)
+        assert handler.get_rolls("2*Die(20)", 500, answer["seed"]) == answer
+
+    @pytest.mark.parametrize("rolls", [0, -1, 11, 1.0, "5", True, None])
+    def test_get_rolls_bad_rolls(self, rolls):
+        handler = DiceTablesRequestHandler(max_rolls=10)
+        assert handler.get_rolls("Die(6)", rolls) == {
+            "errorMessage": "rolls must be an integer from 1 to 10",
+            "errorType": "ValueError",
+        }
+
+    def test_get_rolls_max_rolls(self):
+        handler = DiceTablesRequestHandler(max_rolls=10)
+        assert sum(handler.get_rolls("Die(6)", 10)["histogram"]["y"]) == 10
+
+    @pytest.mark.parametrize("seed", [1.5, "1", True, [1]])
+    def test_get_rolls_bad_seed(self, handler, seed):
+        assert handler.get_rolls("Die(6)", 10, seed) == {
+            "errorMessage": "seed must be an integer",
+            "errorType": "ValueError",
+        }
+
+    def test_get_rolls_bad_roll_format(self, handler):
+        assert handler.get_rolls("Die(6)", 10, 1, "list") == {
+            "errorMessage": "rollFormat must be one of ['histogram', 'packed']",
+            "errorType": "ValueError",
+        }
+
+    @pytest.mark.parametrize("instructions", ["notadie(5)", "20000*Die(6)"])
+    def test_get_rolls_bad_instructions(self, handler, instructions):
+        expected = handler.get_response(instructions)
+        assert handler.get_rolls(instructions, 10) == expected
+
+    def test_get_rolls_uses_table_cache(self):
+        cache = ResultCache()
+        handler = DiceTablesRequestHandler(table_cache=cache)
+        handler.get_rolls("3*Die(6)", 10)
+        assert record_key(handler.create_dice_record("3*Die(6)")) in cache
+
+    def test_get_rolls_with_timings(self, handler):
+        timings = StageTimings()
+        handler.get_rolls("3*Die(6)", 10, timings=timings)
+        assert list(timings.to_dict()) == ["parse", "table", "rolls"]
+
+    def test_max_stats_dice_value(self):
+        assert DiceTablesRequestHandler().max_stats_dice_value == 10**9
+        assert (
+            DiceTablesRequestHandler(max_stats_dice_value=10).max_stats_dice_value == 10
+        )
+
+    def test_get_stats(self, handler):
+        expected = handler.get_response(
+            "3*Die(6)&Exploding(Die(4))", ["range", "mean", "stddev"]
+        )
+        assert handler.get_stats("3*Die(6)&Exploding(Die(4))") == expected
+
+    def test_get_stats_fields(self, handler):
+        assert handler.get_stats("3*Die(6)", ["stddev", "range"]) == {
+            "range": (3, 18),
+            "stddev": 2.958,
+        }
+
+    @pytest.mark.parametrize("fields", [["mean", "data"], ["roller"]])
+    def test_get_stats_other_fields(self, handler, fields):
+        assert handler.get_stats("3*Die(6)", fields) == {
+            "errorMessage": "statsOnly fields may only be ['range', 'mean', 'stddev']",
+            "errorType": "ValueError",
+        }
+
+    def test_get_stats_unknown_fields(self, handler):
+        assert handler.get_stats("3*Die(6)", ["nope"]) == {
+            "errorMessage": "Unknown fields: ['nope']",
+            "errorType": "ValueError",
+        }
+
+    def test_get_stats_does_not_build_a_table(self, monkeypatch):
+        def fail(*_):
+            raise AssertionError("should not build a table")
+
+        monkeypatch.setattr(
+            "request_handler.dice_tables_tequest_handler.construct_dice_table", fail
+        )
+        handler = DiceTablesRequestHandler(max_dice_value=100)
+        assert handler.get_stats("1000000*Die(6)&Die(20)") == {
+            "range": (1000001, 6000020),
+            "mean": 3500010.5,
+            "stddev": round((1000000 * 35 / 12 + 399 / 12) ** 0.5, 3),
+        }
+        assert "errorMessage" in handler.get_response("1000000*Die(6)&Die(20)")
+
+    def test_get_stats_over_max_stats_dice_value(self):
+        handler = DiceTablesRequestHandler(max_dice_value=10, max_stats_dice_value=100)
+        assert handler.get_stats("16*Die(6)")["range"] == (16, 96)
+        assert handler.get_stats("17*Die(6)") == {
+            "errorMessage": "Record: DiceRecord({Die(6): 17}) has a sum of dictionaries greater than 100",
+            "errorType": "ValueError",
+        }
+
+    @pytest.mark.parametrize("instructions", ["notadie(5)", "-2*Die(6)"])
+    def test_get_stats_bad_instructions(self, handler, instructions):
+        assert handler.get_stats(instructions) == handler.get_response(instructions)
+
+    def test_get_stats_with_timings(self, handler):
+        timings = StageTimings()
+        handler.get_stats("3*Die(6)", timings=timings)
+        assert list(timings.to_dict()) == ["parse", "stats"]
+
+    def test_create_dice_record_max_dice_value(self, handler):
+        record = handler.create_dice_record("2000*Die(10)", 20000)
+        assert record.get_number(Die(10)) == 2000
+        with pytest.raises(ValueError):
+            handler.create_dice_record("2000*Die(10)", 1000)
+
+    def test_init_index_cache_default_none(self, handler):
+        assert handler.index_cache is None
+
+    def test_get_response_queries(self, handler):
+        assert handler.get_response(
+            "2*Die(6)", queries=[7, [7, 7], [15, None]], query_format="fraction"
+        ) == {"queries": ["7/12", "1/6", "0/1"]}
+
+    def test_get_response_queries_percent(self, handler):
+        answer = handler.get_response("2*Die(6)", queries=[[12, None]])
+        assert answer == {"queries": [get_fast_pct_number(1, 36)]}
+
+    def test_get_response_queries_with_fields(self, handler):
+        answer = handler.get_response("2*Die(6)", ["mean", "range"], queries=[2])
+        assert answer == {
+            "mean": 7.0,
+            "range": (2, 12),
+            "queries": [get_fast_pct_number(1, 36)],
+        }
+
+    @pytest.mark.parametrize(
+        "queries, query_format, message",
+        [
+            ([1.5], "percent", "A query must be a roll or [low, high], not 1.5"),
+            ("7", "percent", "queries must be a list of at most 1000"),
+            ([7], "odds", "queryFormat must be one of ['percent', 'fraction']"),
+        ],
+    )
+    def test_get_response_bad_queries(self, handler, queries, query_format, message):
+        answer = handler.get_response(
+            "2*Die(6)", queries=queries, query_format=query_format
+        )
+        assert answer == {"errorMessage": message, "errorType": "ValueError"}
+
+    def test_get_response_queries_bad_instructions(self, handler):
+        assert handler.get_response("notadie(5)", queries=[3]) == handler.get_response(
+            "notadie(5)"
+        )
+
+    def test_get_response_queries_index_cache(self):
+        index_cache = ResultCache()
+        table_cache = ResultCache()
+        handler = DiceTablesRequestHandler(
+            index_cache=index_cache, table_cache=table_cache
+        )
+        assert handler.index_cache is index_cache
+        first = handler.get_response("3*Die(6)", queries=[10])
+        second = handler.get_response(
+            "3 * die(6)", queries=[[11, None]], query_format="fraction"
+        )
+        assert first == {"queries": [50.0]}
+        assert second == {"queries": ["1/2"]}
+        assert index_cache.keys() == [record_key(DiceRecord({Die(6): 3}))]
+        assert (index_cache.hits, index_cache.misses) == (1, 1)
+        assert len(table_cache) == 1
+
+    def test_get_response_queries_skip_result_cache(self):
+        result_cache = ResultCache()
+        handler = DiceTablesRequestHandler(result_cache=result_cache)
+        handler.get_response("3*Die(6)", queries=[10])
+        assert len(result_cache) == 0
+        handler.get_response("3*Die(6)", ["mean"], queries=[10])
+        assert len(result_cache) == 1
+
+    def test_get_response_queries_with_timings(self, handler):
+        timings = StageTimings()
+        handler.get_response("3*Die(6)", timings=timings, queries=[10])
+        assert list(timings.to_dict()) == ["parse", "table", "index", "queries"]
+
+    def test_get_response_queries_with_timings_cached_index(self):
+        handler = DiceTablesRequestHandler(index_cache=ResultCache())
+        handler.get_response("3*Die(6)", queries=[10])
+        timings = StageTimings()
+        handler.get_response("3*Die(6)", timings=timings, queries=[10])
+        assert list(timings.to_dict()) == ["parse", "queries"]
+
+    def test_get_response_max_points(self, handler):
+        full = handler.get_response("10*Die(6)", ["data", "mean"])
+        answer = handler.get_response("10*Die(6)", ["data", "mean"], max_points=10)
+        assert answer["mean"] == full["mean"]
+        assert answer["data"] == dict(
+            zip(("x", "y"), lttb(full["data"]["x"], full["data"]["y"], 10))
+        )
+        assert len(answer["data"]["x"]) == 10
+
+    def test_get_response_max_points_more_than_data(self, handler):
+        assert handler.get_response("2*Die(6)", max_points=100) == handler.get_response(
+            "2*Die(6)"
+        )
+
+    def test_get_response_max_points_without_data(self, handler):
+        assert handler.get_response("10*Die(6)", ["mean"], max_points=10) == {
+            "mean": 35.0
+        }
+
+    def test_get_response_max_points_does_not_change_result_cache(self):
+        handler = DiceTablesRequestHandler(result_cache=ResultCache())
+        full = handler.get_response("10*Die(6)", ["data"])
+        assert (
+            len(handler.get_response("10*Die(6)", ["data"], max_points=5)["data"]["x"])
+            == 5
+        )
+        assert handler.get_response("10*Die(6)", ["data"]) == full
+        assert len(full["data"]["x"]) == 51
+
+    def test_get_response_max_points_with_queries(self, handler):
+        answer = handler.get_response("10*Die(6)", ["data"], queries=[35], max_points=5)
+        assert len(answer["data"]["x"]) == 5
+        assert len(answer["queries"]) == 1
+
+    @pytest.mark.parametrize("max_points", [2, 0, -5, 10.0, "10", True])
+    def test_get_response_bad_max_points(self, handler, max_points):
+        assert handler.get_response("10*Die(6)", max_points=max_points) == {
+            "errorMessage": "maxPoints must be an integer of at least 3",
+            "errorType": "ValueError",
+        }
+
+    def test_get_response_max_points_with_timings(self, handler):
+        timings = StageTimings()
+        handler.get_response("10*Die(6)", ["data"], timings, max_points=5)
+        assert list(timings.to_dict()) == [
+            "parse",
+            "table",
+            "calculations",
+            "data",
+            "downsample",
+        ]
+
+    def test_get_responses_max_points(self, handler):
+        answers = handler.get_responses(
+            ["10*Die(6)", "Die(4)", "notadie(5)"], ["data"], max_points=5
+        )
+        assert len(answers[0]["data"]["x"]) == 5
+        assert answers[1] == handler.get_response("Die(4)", ["data"])
+        assert "errorMessage" in answers[2]
+
+    def test_get_responses_bad_max_points(self, handler):
+        assert (
+            handler.get_responses(["Die(6)", "Die(4)"], max_points=1)
+            == [
+                {
+                    "errorMessage": "maxPoints must be an integer of at least 3",
+                    "errorType": "ValueError",
+                }
+            ]
+            * 2
+        )
+
+    def test_init_memory_budget_defaults(self, handler):
+        assert handler.memory_budget is None
+        assert handler.cost_model is DEFAULT_COST_MODEL
+
+    def test_estimate_cost(self):
+        model = CostModel(1, 2, 3)
+        handler = DiceTablesRequestHandler(cost_model=model)
+        record = DiceRecord({Die(6): 3})
+        assert handler.estimate_cost(record) == model.estimate(record)
+
+    def test_assert_within_memory_budget(self):
+        handler = DiceTablesRequestHandler(
+            memory_budget=1000, cost_model=CostModel(bytes_per_event=100)
+        )
+        handler.assert_within_memory_budget(DiceRecord({Die(10): 1}))
+        with pytest.raises(MemoryBudgetError) as error:
+            handler.assert_within_memory_budget(DiceRecord({Die(11): 1}))
+        assert error.value.args[0] == (
+            "Record: DiceRecord({Die(11): 1}) needs about 0.0 MiB, more than the memory budget of 0.0 MiB"
+        )
+
+    def test_assert_within_memory_budget_without_budget(self):
+        handler = DiceTablesRequestHandler(cost_model=CostModel(fixed_bytes=10**12))
+        handler.assert_within_memory_budget(DiceRecord({Die(10): 100}))
+
+    def test_get_response_over_memory_budget(self):
+        handler = DiceTablesRequestHandler(
+            memory_budget=2**20, cost_model=CostModel(bytes_per_event=2**10)
+        )
+        assert handler.get_response("500*Die(2)", ["mean"]) == {"mean": 750.0}
+        assert handler.get_response("2000*Die(2)", ["mean"]) == {
+            "errorMessage": (
+                "Record: DiceRecord({Die(2): 2000}) needs about 2.0 MiB, more than the memory budget of 1.0 MiB"
+            ),
+            "errorType": "MemoryBudgetError",
+        }
+
+    def test_memory_budget_with_wide_occurrences(self):
+        handler = DiceTablesRequestHandler(
+            max_dice_value=4000, memory_budget=512 * 2**20
+        )
+        weights = ", ".join(
+            f"{roll}: {10**1000 if roll == 1 else 1}" for roll in range(1, 5)
+        )
+        build_string = f"1000*WeightedDie({{{weights}}})"
+        handler.create_dice_record(build_string)
+        assert handler.get_response(build_string)["errorType"] == "MemoryBudgetError"
+
+    def test_memory_budget_rolls_and_queries(self):
+        handler = DiceTablesRequestHandler(
+            memory_budget=5, cost_model=CostModel(bytes_per_event=1)
+        )
+        assert handler.get_rolls("Die(6)", 10)["errorType"] == "MemoryBudgetError"
+        assert (
+            handler.get_response("Die(6)", queries=[3])["errorType"]
+            == "MemoryBudgetError"
+        )
+        assert handler.get_response("Die(4)", queries=[3]) == {"queries": [75.0]}
+
+    def test_memory_budget_does_not_apply_to_stats(self):
+        handler = DiceTablesRequestHandler(
+            memory_budget=10, cost_model=CostModel(bytes_per_event=1)
+        )
+        assert handler.get_stats("100*Die(6)")["range"] == (100, 600)
+
+    def test_get_responses_over_memory_budget(self):
+        handler = DiceTablesRequestHandler(
+            memory_budget=100, cost_model=CostModel(bytes_per_event=1)
+        )
+        answers = handler.get_responses(
+            ["20*Die(6)", "10*Die(6)", "30*Die(6)"], ["range"]
+        )
+        assert answers[1] == {"range": (10, 60)}
+        assert [answer.get("errorType") for answer in answers] == [
+            "MemoryBudgetError",
+            None,
+            "MemoryBudgetError",
+        ]
@@ -0,0 +1,143 @@
+import json
+
+import pytest
+from dicetables import DiceRecord, DiceTable, Die
+
+import build_bundle
+from request_handler.dice_tables_tequest_handler import (
+    DiceTablesRequestHandler,
+    make_dict,
+)
+from request_handler.response_bundle import ResponseBundle, write_bundle
+from request_handler.result_cache import record_key
+from request_handler.table_store import table_version
+
+
+def get_entry(die, number):
+    table = DiceTable.new().add_die(die, number)
+    return table.dice_data(), make_dict(table)
+
+
+@pytest.fixture
+def bundle_path(tmp_path):
+    path = str(tmp_path / "bundle.bin")
+    write_bundle(path, [get_entry(Die(6), 2), get_entry(Die(4), 3)])
+    return path
+
+
+@pytest.fixture
+def bundle(bundle_path):
+    answer = ResponseBundle(bundle_path)
+    yield answer
+    answer.close()
+
+
+def test_bundle_properties(bundle, bundle_path):
+    assert bundle.path == bundle_path
+    assert bundle.version == table_version()
+    assert len(bundle) == 2
+
+
+def test_get(bundle):
+    record, response = get_entry(Die(6), 2)
+    assert json.dumps(bundle.get(record)) == json.dumps(response)
+
+
+def test_get_missing(bundle):
+    assert bundle.get(DiceRecord.new().add_die(Die(6), 3)) is None
+
+
+def test_get_uses_canonical_record(tmp_path):
+    path = str(tmp_path / "bundle.bin")
+    table = DiceTable.new().add_die(Die(6), 2).add_die(Die(4), 1)
+    write_bundle(path, [(table.dice_data(), make_dict(table))])
+    bundle = ResponseBundle(path)
+    record = DiceRecord.new().add_die(Die(4), 1).add_die(Die(6), 2)
+    assert bundle.get(record)["diceStr"] == make_dict(table)["diceStr"]
+    bundle.close()
+
+
+def test_entry_sizes(bundle):
+    sizes = bundle.entry_sizes()
+    assert set(sizes) == {
+        json.dumps(record_key(DiceRecord.new().add_die(Die(6), 2))),
+        json.dumps(record_key(DiceRecord.new().add_die(Die(4), 3))),
+    }
+    assert all(size > 0 for size in sizes.values())
+
+
+def test_other_version_has_no_entries(bundle_path, monkeypatch):
+    monkeypatch.setattr(
+        "request_handler.response_bundle.table_version", lambda: "other"
+    )
+    bundle = ResponseBundle(bundle_path)
+    assert len(bundle) == 0
+    assert bundle.get(DiceRecord.new().add_die(Die(6), 2)) is None
+    bundle.close()
+
+
+def test_handler_serves_from_bundle(bundle, monkeypatch):
+    expected = json.dumps(DiceTablesRequestHandler().get_response("2*Die(6)"))
+
+    def fail(*_):
+        raise AssertionError("should read from the bundle")
+
+    monkeypatch.setattr(
+        "request_handler.dice_tables_tequest_handler.construct_dice_table", fail
+    )
+    handler = DiceTablesRequestHandler(response_bundle=bundle)
+    assert handler.response_bundle is bundle
+    assert json.dumps(handler.get_response("2*Die(6)")) == expected
+
+
+def test_handler_serves_fields_from_bundle(bundle):
+    handler = DiceTablesRequestHandler(response_bundle=bundle)
+    expected = DiceTablesRequestHandler().get_response("3*Die(4)", ["mean", "range"])
+    response = handler.get_response("3*Die(4)", ["mean", "range"])
+    assert json.dumps(response) == json.dumps(expected)
+
+
+def test_handler_builds_fields_missing_from_bundle(bundle):
+    handler = DiceTablesRequestHandler(response_bundle=bundle)
+    expected = DiceTablesRequestHandler().get_response(
+        "2*Die(6)", ["mean", "compactRoller"]
+    )
+    assert handler.get_response("2*Die(6)", ["mean", "compactRoller"]) == expected
+
+
+def test_handler_bundle_miss_builds_table(bundle):
+    handler = DiceTablesRequestHandler(response_bundle=bundle)
+    expected = DiceTablesRequestHandler().get_response("5*Die(6)")
+    assert handler.get_response("5*Die(6)") == expected
+
+
+def test_handler_default_no_bundle():
+    assert DiceTablesRequestHandler().response_bundle is None
+
+
+def test_get_build_strings(tmp_path):
+    build_strings_file = tmp_path / "build_strings.txt"
+    build_strings_file.write_text("Die(3)&Die(5)\n\n  2*Die(7)  \n")
+    assert build_bundle.get_build_strings(["Die(4)"], 2, str(build_strings_file)) == [
+        "1*Die(4)",
+        "2*Die(4)",
+        "Die(3)&Die(5)",
+        "2*Die(7)",
+    ]
+
+
+def test_build_bundle_main(tmp_path, capsys):
+    path = str(tmp_path / "bundle.bin")
+    argv = ["--out", path, "--dice", "Die(4)", "Die(6)", "--max-count", "2"]
+    assert build_bundle.main(argv) == 0
+    assert "4 entries" in capsys.readouterr().out
+    bundle = ResponseBundle(path)
+    assert bundle.get(DiceRecord.new().add_die(Die(6), 2)) is not None
+    bundle.close()
+
+
+def test_build_bundle_skips_errors(tmp_path, capsys):
+    path = str(tmp_path / "bundle.bin")
+    build_bundle.build(path, ["2*Die(4)", "Die(-1)"], 4000)
+    assert "skipped 'Die(-1)'" in capsys.readouterr().out
+    assert len(ResponseBundle(path)) == 1
@@ -0,0 +1,72 @@
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+from request_handler.response_formats import to_columnar
+
+
+def test_to_columnar_single_response():
+    response = DiceTablesRequestHandler().get_response("Die(2)")
+    answer = to_columnar(response)
+
+    assert answer["forSciNum"] == {
+        "roll": [1, 2],
+        "mantissa": ["1.00000", "1.00000"],
+        "exponent": ["0", "0"],
+    }
+    assert answer["roller"] == {
+        "height": "2",
+        "aliases": {
+            "primary": ["2", "1"],
+            "alternate": ["2", "1"],
+            "primaryHeight": ["2", "2"],
+        },
+    }
+    for key in ("diceStr", "name", "data", "tableString", "range", "mean", "stddev"):
+        assert answer[key] == response[key]
+
+
+def test_to_columnar_does_not_change_input():
+    response = DiceTablesRequestHandler().get_response("Die(2)")
+    aliases = response["roller"]["aliases"][:]
+    to_columnar(response)
+    assert isinstance(response["forSciNum"], list)
+    assert response["roller"]["aliases"] == aliases
+
+
+def test_to_columnar_partial_and_error_responses():
+    assert to_columnar({"mean": 1.5}) == {"mean": 1.5}
+    error = {"errorMessage": "oops", "errorType": "ValueError"}
+    assert to_columnar(error) == error
+
+
+def test_to_columnar_batch():
+    response = {
+        "results": [
+            {
+                "statusCode": 200,
+                "body": {
+                    "forSciNum": [{"roll": 1, "mantissa": "1.00000", "exponent": "0"}]
+                },
+            },
+            {
+                "statusCode": 404,
+                "body": {"errorMessage": "oops", "errorType": "ValueError"},
+            },
+        ]
+    }
+    assert to_columnar(response) == {
+        "results": [
+            {
+                "statusCode": 200,
+                "body": {
+                    "forSciNum": {
+                        "roll": [1],
+                        "mantissa": ["1.00000"],
+                        "exponent": ["0"],
+                    }
+                },
+            },
+            {
+                "statusCode": 404,
+                "body": {"errorMessage": "oops", "errorType": "ValueError"},
+            },
+        ]
+    }
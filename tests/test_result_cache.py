@@ -0,0 +1,119 @@
+import pytest
+from dicetables import DiceRecord, DiceTable, Die, ModDie
+
+from request_handler.result_cache import (
+    ResultCache,
+    record_key,
+    estimate_size,
+    estimate_table_size,
+)
+
+
+def constant_sizer(_):
+    return 10
+
+
+class TestResultCache(object):
+    def test_record_key_empty_record(self):
+        assert record_key(DiceRecord.new()) == ()
+
+    def test_record_key_ignores_die_order(self):
+        first = DiceRecord.new().add_die(Die(6), 2).add_die(Die(4), 1)
+        second = DiceRecord.new().add_die(Die(4), 1).add_die(Die(6), 2)
+        assert record_key(first) == record_key(second)
+        assert record_key(first) == (("Die(4)", 1), ("Die(6)", 2))
+
+    def test_record_key_different_records(self):
+        first = DiceRecord.new().add_die(Die(6), 2)
+        second = DiceRecord.new().add_die(ModDie(6, 0), 2)
+        assert record_key(first) != record_key(second)
+
+    def test_estimate_size_counts_contents(self):
+        assert estimate_size({"a": [1, 2, 3]}) > estimate_size({"a": []})
+        assert estimate_size(("abc",)) > estimate_size(())
+
+    def test_estimate_table_size(self):
+        table = DiceTable.new().add_die(Die(6), 2)
+        assert estimate_table_size(table) == estimate_size(table.get_dict())
+
+    def test_init_defaults(self):
+        cache = ResultCache()
+        assert cache.max_entries == 128
+        assert cache.max_bytes == 32 * 2**20
+        assert cache.current_bytes == 0
+        assert len(cache) == 0
+        assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 0}
+
+    @pytest.mark.parametrize("max_entries, max_bytes", [(-1, 10), (10, -1)])
+    def test_init_negative_values(self, max_entries, max_bytes):
+        with pytest.raises(ValueError):
+            ResultCache(max_entries, max_bytes)
+
+    def test_get_miss_and_hit(self):
+        cache = ResultCache(sizer=constant_sizer)
+        assert cache.get("a") is None
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_get_default(self):
+        cache = ResultCache()
+        assert cache.get("a", "default") == "default"
+
+    def test_put_tracks_bytes(self):
+        cache = ResultCache(sizer=constant_sizer)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.current_bytes == 20
+        cache.put("a", 3)
+        assert cache.current_bytes == 20
+        assert cache.get("a") == 3
+
+    def test_put_evicts_least_recently_used_by_entries(self):
+        cache = ResultCache(max_entries=2, sizer=constant_sizer)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+
+    def test_put_evicts_least_recently_used_by_bytes(self):
+        cache = ResultCache(max_bytes=25, sizer=constant_sizer)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        assert "a" not in cache
+        assert len(cache) == 2
+        assert cache.current_bytes == 20
+
+    def test_put_value_bigger_than_max_bytes_not_stored(self):
+        cache = ResultCache(max_bytes=5, sizer=constant_sizer)
+        cache.put("a", 1)
+        assert "a" not in cache
+        assert cache.current_bytes == 0
+
+    def test_put_zero_entries_stores_nothing(self):
+        cache = ResultCache(max_entries=0)
+        cache.put("a", 1)
+        assert len(cache) == 0
+
+    def test_clear_keeps_counters(self):
+        cache = ResultCache(sizer=constant_sizer)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.current_bytes == 0
+        assert cache.hits == 1
+
+    def test_keys_least_to_most_recent_without_counting(self):
+        cache = ResultCache(sizer=constant_sizer)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        assert cache.keys() == ["b", "a"]
+        assert cache.hits == 1
+        assert cache.misses == 0
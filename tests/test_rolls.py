@@ -0,0 +1,184 @@
+from base64 import b64decode
+from array import array
+from random import Random
+
+import pytest
+from dicetables import DiceTable, DiceRecord, Die, ModDie, Exploding
+from dicetables.tools.alias_table import AliasTable
+
+from request_handler.rolls import (
+    FRACTION_BITS,
+    MAX_PACKED_BYTES,
+    ROLL_FORMATS,
+    get_histogram,
+    get_outcomes,
+    get_packed,
+    get_packed_typecode,
+    iter_outcomes,
+)
+
+
+def get_alias_table(events: dict) -> AliasTable:
+    return AliasTable(DiceTable(events, DiceRecord.new()).get_dict())
+
+
+def unpack(packed: dict) -> list:
+    values = array(get_packed_typecode(256 ** packed["itemSize"] - 1))
+    values.frombytes(b64decode(packed["data"]))
+    return [packed["start"] + value for value in values]
+
+
+class FixedBits(object):
+    """getrandbits returns these values in order"""
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def getrandbits(self, _):
+        return self.values.pop(0)
+
+
+def test_roll_formats():
+    assert ROLL_FORMATS == {"histogram": get_histogram, "packed": get_packed}
+
+
+def test_get_outcomes():
+    alias_table = get_alias_table({1: 1, 2: 3})
+    expected = []
+    for alias in alias_table.to_list():
+        expected += [alias.primary, alias.alternate]
+    assert get_outcomes(alias_table) == expected
+
+
+@pytest.mark.parametrize("times", [1, 10, 65536, 65537, 200_000])
+def test_iter_outcomes_times(times):
+    alias_table = get_alias_table({1: 1, 2: 3, 5: 2})
+    batches = list(iter_outcomes(alias_table, times, Random(0)))
+    assert sum(len(batch) for batch in batches) == times
+    assert all(len(batch) <= 2**16 for batch in batches)
+
+
+def test_iter_outcomes_only_rolls_events():
+    events = {-3: 2, 0: 1, 7: 5, 8: 1}
+    alias_table = get_alias_table(events)
+    outcomes = get_outcomes(alias_table)
+    rolled = set()
+    for batch in iter_outcomes(alias_table, 10_000, Random(1)):
+        rolled.update(outcomes[outcome] for outcome in batch)
+    assert rolled == set(events)
+
+
+def test_iter_outcomes_picks_primary_below_threshold_and_alternate_above():
+    alias_table = get_alias_table({1: 1, 2: 3})
+    aliases = alias_table.to_list()
+    threshold = (aliases[0].primary_height << FRACTION_BITS) // alias_table.height
+    draws = [threshold - 1, threshold + 1, (1 << FRACTION_BITS) + 5]
+    outcomes = next(iter_outcomes(alias_table, 3, FixedBits(draws)))
+    assert outcomes == [0, 1, 2]
+
+
+@pytest.mark.parametrize("offset, expected", [(-1, 0), (1, 1)])
+@pytest.mark.parametrize("ties", [1, 3])
+def test_iter_outcomes_resolves_ties_with_more_bits(ties, offset, expected):
+    alias_table = get_alias_table({1: 1, 2: 2})
+    alias = alias_table.to_list()[0]
+    assert (alias.primary_height, alias_table.height) == (2, 3)
+    two_thirds = (2 << FRACTION_BITS) // 3
+    draws = [two_thirds] * ties + [two_thirds + offset]
+    outcomes = next(iter_outcomes(alias_table, 1, FixedBits(draws)))
+    assert outcomes == [expected]
+
+
+@pytest.mark.parametrize(
+    "length, bits", [(1, 64), (2, 65), (3, 66), (4, 66), (16, 68), (17, 69)]
+)
+def test_iter_outcomes_draws_the_fewest_bits(length, bits):
+    class RecordBits(object):
+        requested = set()
+
+        def getrandbits(self, number):
+            self.requested.add(number)
+            return 0
+
+    random_generator = RecordBits()
+    list(
+        iter_outcomes(
+            get_alias_table({roll: 1 for roll in range(length)}), 5, random_generator
+        )
+    )
+    assert random_generator.requested == {bits}
+
+
+def test_iter_outcomes_rejects_draws_past_the_last_alias():
+    alias_table = get_alias_table({1: 1, 2: 1, 3: 1})
+    limit = 3 << FRACTION_BITS
+    draws = [limit, limit + 1, 0, (2 << FRACTION_BITS) + 1]
+    batches = list(iter_outcomes(alias_table, 2, FixedBits(draws)))
+    assert [len(batch) for batch in batches] == [0, 2]
+
+
+@pytest.mark.parametrize(
+    "table",
+    [
+        DiceTable.new().add_die(Die(6), 2),
+        DiceTable.new().add_die(ModDie(4, -3), 3),
+        DiceTable.new().add_die(Exploding(Die(4)), 2),
+        DiceTable.new().add_die(Die(2), 300),
+    ],
+)
+def test_histogram_matches_probabilities(table):
+    times = 100_000
+    histogram = get_histogram(AliasTable(table.get_dict()), times, Random(2))
+    assert sum(histogram["y"]) == times
+    assert histogram["x"] == sorted(histogram["x"])
+    total = sum(table.get_dict().values())
+    for roll, count in zip(histogram["x"], histogram["y"]):
+        expected = times * table.get_dict()[roll] / total
+        assert abs(count - expected) < 6 * expected**0.5 + 1
+
+
+def test_histogram_same_seed_same_rolls():
+    alias_table = AliasTable(DiceTable.new().add_die(Die(20), 3).get_dict())
+    first = get_histogram(alias_table, 10_000, Random(12))
+    assert get_histogram(alias_table, 10_000, Random(12)) == first
+    assert get_histogram(alias_table, 10_000, Random(13)) != first
+
+
+def test_packed_matches_histogram():
+    alias_table = AliasTable(DiceTable.new().add_die(Die(6), 3).get_dict())
+    packed = get_packed(alias_table, 1000, Random(5))
+    assert packed["start"] == 3
+    assert packed["itemSize"] == 1
+    rolls = unpack(packed)
+    histogram = get_histogram(alias_table, 1000, Random(5))
+    assert [rolls.count(roll) for roll in histogram["x"]] == histogram["y"]
+
+
+def test_packed_item_size():
+    packed = get_packed(get_alias_table({-1000: 1, 1000: 1}), 50, Random(0))
+    assert packed["start"] == -1000
+    assert packed["itemSize"] == 2
+    assert set(unpack(packed)) == {-1000, 1000}
+
+
+def test_packed_too_many_bytes():
+    alias_table = get_alias_table({0: 1, 2**20: 1})
+    times = MAX_PACKED_BYTES // 4 + 1
+    with pytest.raises(ValueError) as e:
+        get_packed(alias_table, times, Random(0))
+    assert e.value.args[0] == (
+        f"{times} packed rolls of 4 bytes are more than {MAX_PACKED_BYTES} bytes"
+    )
+
+
+@pytest.mark.parametrize(
+    "span, typecode",
+    [(0, "B"), (255, "B"), (256, "H"), (2**16, "I"), (2**32, "Q"), (2**64 - 1, "Q")],
+)
+def test_get_packed_typecode(span, typecode):
+    assert get_packed_typecode(span) == typecode
+
+
+def test_get_packed_typecode_too_big():
+    with pytest.raises(ValueError):
+        get_packed_typecode(2**64)
@@ -0,0 +1,666 @@
+import asyncio
+from base64 import b64decode
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing import Manager
+from http import HTTPStatus
+from unittest.mock import patch
+
+import pytest
+
+from lambda_function import COLUMNAR_JSON, JSON, lambda_handler
+from request_handler.result_cache import ResultCache
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+from request_handler.parallel import ParallelEngine, available_cpus
+from server import (
+    LocalServer,
+    Request,
+    get_cache_key,
+    get_error_response,
+    get_parallel_workers,
+    init_worker,
+    is_streamed,
+    get_streamed,
+    stream_handler,
+    to_event,
+    to_http,
+    to_http_head,
+)
+
+
+def post(body, headers=None, version="HTTP/1.1") -> bytes:
+    body_bytes = json.dumps(body).encode() if not isinstance(body, bytes) else body
+    lines = [f"POST / {version}", f"Content-Length: {len(body_bytes)}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body_bytes
+
+
+async def read_response(reader: asyncio.StreamReader):
+    status_line = await reader.readline()
+    if not status_line:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.strip()] = value.strip()
+    if headers.get("Transfer-Encoding") == "chunked":
+        body = b""
+        while True:
+            size = int(await reader.readline(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers["Content-Length"]))
+    return int(status_line.split()[1]), headers, body
+
+
+async def exchange(server: LocalServer, *requests: bytes, keep_alive_seconds=None):
+    """sends the requests on one connection and reads responses until it is closed"""
+    http_server = await server.start("127.0.0.1", 0)
+    port = http_server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for request in requests:
+        writer.write(request)
+    await writer.drain()
+    responses = []
+    while True:
+        response = await asyncio.wait_for(read_response(reader), 10)
+        if response is None:
+            break
+        responses.append(response)
+        if len(responses) == len(requests) and keep_alive_seconds is None:
+            break
+    writer.close()
+    http_server.close()
+    await http_server.wait_closed()
+    return responses
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as answer:
+        yield answer
+
+
+def test_to_event():
+    request = Request("POST", "/x", "HTTP/1.1", {"accept": COLUMNAR_JSON}, b'{"a": 1}')
+    assert to_event(request) == {
+        "body": '{"a": 1}',
+        "isBase64Encoded": False,
+        "headers": {"accept": COLUMNAR_JSON},
+        "httpMethod": "POST",
+        "path": "/x",
+    }
+
+
+@pytest.mark.parametrize(
+    "version, connection, expected",
+    [
+        ("HTTP/1.1", None, True),
+        ("HTTP/1.1", "close", False),
+        ("HTTP/1.1", "Close", False),
+        ("HTTP/1.0", None, False),
+        ("HTTP/1.0", "keep-alive", True),
+    ],
+)
+def test_request_keep_alive(version, connection, expected):
+    headers = {} if connection is None else {"connection": connection}
+    assert Request("POST", "/", version, headers, b"").keep_alive is expected
+
+
+def test_to_http():
+    response = {
+        "body": '{"a": 1}',
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+    }
+    assert to_http(response, keep_alive=True) == (
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 8\r\n"
+        b'Connection: keep-alive\r\n\r\n{"a": 1}'
+    )
+
+
+def test_to_http_base64_body():
+    event = {
+        "body": {"buildString": "10*Die(6)"},
+        "isBase64Encoded": False,
+        "headers": {"Accept-Encoding": "gzip"},
+    }
+    response = lambda_handler(event, None)
+    assert response["isBase64Encoded"]
+    http = to_http(response, keep_alive=False)
+    assert b"Content-Encoding: gzip\r\n" in http
+    assert b"Connection: close\r\n" in http
+    assert http.endswith(b"\r\n\r\n" + b64decode(response["body"]))
+
+
+def test_get_cache_key():
+    first = get_cache_key({"body": '{"buildString": "Die(6)", "fields": ["mean"]}'})
+    second = get_cache_key({"body": '{"fields": ["mean"],  "buildString": "Die(6)"}'})
+    expected = (
+        '{"buildString": "Die(6)", "fields": ["mean"]}',
+        "application/json",
+        None,
+    )
+    assert first == second == expected
+
+
+def test_get_cache_key_headers():
+    event = {
+        "body": '{"buildString": "Die(6)"}',
+        "headers": {"Accept": COLUMNAR_JSON, "Accept-Encoding": "gzip"},
+    }
+    assert get_cache_key(event) == ('{"buildString": "Die(6)"}', COLUMNAR_JSON, "gzip")
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "not json",
+        "[1, 2]",
+        '{"buildString": "Die(6)", "timings": true}',
+        '{"buildString": "Die(6)", "rolls": 10}',
+        '{"buildString": "Die(6)", "rolls": 10, "seed": null}',
+    ],
+)
+def test_get_cache_key_not_cached(body):
+    assert get_cache_key({"body": body}) is None
+
+
+def test_get_cache_key_rolls_with_seed():
+    assert (
+        get_cache_key({"body": '{"buildString": "Die(6)", "rolls": 10, "seed": 1}'})
+        is not None
+    )
+
+
+def test_server_response(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    [(status, headers, body)] = asyncio.run(
+        exchange(server, post({"buildString": "2*Die(6)"}))
+    )
+    assert status == 200
+    assert headers["Content-Type"] == "application/json"
+    assert headers["Connection"] == "keep-alive"
+    event = {"body": {"buildString": "2*Die(6)"}, "isBase64Encoded": False}
+    assert body.decode() == lambda_handler(event, None)["body"]
+
+
+def test_server_passes_headers(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    request = post({"buildString": "2*Die(6)"}, {"Accept": COLUMNAR_JSON})
+    [(status, headers, body)] = asyncio.run(exchange(server, request))
+    assert headers["Content-Type"] == COLUMNAR_JSON
+    assert "compactRoller" in json.loads(body)
+
+
+def test_server_bad_body(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    [(status, _, body)] = asyncio.run(exchange(server, post(b"not json")))
+    assert status == 400
+    assert json.loads(body) == {"errorMessage": "could not process"}
+
+
+def test_server_bad_fields(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    [(status, _, body)] = asyncio.run(
+        exchange(server, post({"buildString": "Die(6)", "fields": 5}))
+    )
+    assert status == 400
+    assert json.loads(body) == {"errorMessage": "could not process"}
+
+
+def test_server_handler_error(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    with patch("server.lambda_handler", side_effect=RuntimeError("oops")):
+        responses = asyncio.run(
+            exchange(
+                server,
+                post({"buildString": "Die(6)", "rolls": 1}),
+                post({"buildString": "Die(4)", "rolls": 1}),
+            )
+        )
+    assert [status for status, _, _ in responses] == [500, 500]
+    assert json.loads(responses[0][2]) == {"errorMessage": "Internal Server Error"}
+
+
+def test_server_keep_alive(executor):
+    server = LocalServer(executor, max_concurrency=2, keep_alive_seconds=0.2)
+    requests = [post({"buildString": f"{number}*Die(6)"}) for number in range(1, 4)]
+    responses = asyncio.run(exchange(server, *requests, keep_alive_seconds=0.2))
+    assert [status for status, _, _ in responses] == [200, 200, 200]
+    assert [json.loads(body)["range"] for _, _, body in responses] == [
+        [1, 6],
+        [2, 12],
+        [3, 18],
+    ]
+
+
+@pytest.mark.parametrize(
+    "version, headers", [("HTTP/1.1", {"Connection": "close"}), ("HTTP/1.0", {})]
+)
+def test_server_closes_connection(executor, version, headers):
+    server = LocalServer(executor, max_concurrency=2, keep_alive_seconds=5)
+    first = post({"buildString": "Die(6)"}, headers, version)
+    second = post({"buildString": "Die(4)"})
+    responses = asyncio.run(exchange(server, first, second, keep_alive_seconds=5))
+    assert len(responses) == 1
+    assert responses[0][1]["Connection"] == "close"
+
+
+@pytest.mark.parametrize(
+    "request_bytes, status",
+    [
+        (b"nonsense\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nContent-Length: many\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", 411),
+        (b"POST / HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n", 413),
+        (b"POST / HTTP/1.1\r\nX-Long: " + b"a" * 2**17 + b"\r\n\r\n", 431),
+        (b"GET / HTTP/1.1\r\n\r\n", 405),
+    ],
+)
+def test_server_http_errors(executor, request_bytes, status):
+    server = LocalServer(executor, max_concurrency=2)
+    [(answer, headers, body)] = asyncio.run(
+        exchange(server, request_bytes, keep_alive_seconds=5)
+    )
+    assert answer == status
+    assert headers["Connection"] == "close"
+    assert "errorMessage" in json.loads(body)
+
+
+def test_server_method_not_allowed_header(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    [(_, headers, _)] = asyncio.run(
+        exchange(server, b"GET / HTTP/1.1\r\n\r\n", keep_alive_seconds=5)
+    )
+    assert headers["Allow"] == "POST"
+
+
+def test_server_result_cache(executor):
+    cache = ResultCache()
+    server = LocalServer(executor, max_concurrency=2, result_cache=cache)
+    assert server.result_cache is cache
+    first = post({"buildString": "3*Die(6)", "fields": ["mean"]})
+    second = post({"fields": ["mean"], "buildString": "3*Die(6)"})
+    with patch("server.lambda_handler", wraps=lambda_handler) as mock_handler:
+        responses = asyncio.run(exchange(server, first, second))
+    assert mock_handler.call_count == 1
+    assert responses[0] == responses[1]
+    assert len(cache) == 1
+
+
+def test_server_result_cache_skips_errors(executor):
+    cache = ResultCache()
+    server = LocalServer(executor, max_concurrency=2, result_cache=cache)
+    responses = asyncio.run(exchange(server, post({"buildString": "notadie(5)"})))
+    assert responses[0][0] == 404
+    assert len(cache) == 0
+
+
+def test_server_max_concurrency():
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def slow_handler(event, context):
+        with lock:
+            running.append(1)
+            most.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return lambda_handler(event, context)
+
+    async def many_connections(server):
+        http_server = await server.start("127.0.0.1", 0)
+        port = http_server.sockets[0].getsockname()[1]
+
+        async def one(number):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                post({"buildString": f"{number}*Die(4)"}, {"Connection": "close"})
+            )
+            answer = await read_response(reader)
+            writer.close()
+            return answer
+
+        answers = await asyncio.gather(*[one(number) for number in range(1, 9)])
+        http_server.close()
+        await http_server.wait_closed()
+        return answers
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        server = LocalServer(executor, max_concurrency=2)
+        with patch("server.lambda_handler", slow_handler):
+            answers = asyncio.run(many_connections(server))
+    assert [status for status, _, _ in answers] == [200] * 8
+    assert max(most) == 2
+
+
+def test_server_process_pool():
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        server = LocalServer(executor, max_concurrency=1)
+        request = post({"buildString": "2*Die(6)", "fields": ["mean"]})
+        [(status, _, body)] = asyncio.run(exchange(server, request))
+    assert status == 200
+    assert json.loads(body) == {"mean": 7.0}
+
+
+@pytest.mark.parametrize("signal_number", [signal.SIGINT, signal.SIGTERM])
+def test_server_stops_on_signal(signal_number):
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--port", "0", "--workers", "1"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert server.stdout is not None
+        assert server.stdout.readline().startswith("serving on")
+        server.send_signal(signal_number)
+        assert server.wait(10) == 0
+    finally:
+        server.kill()
+
+
+class BrokenExecutor(ThreadPoolExecutor):
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("a worker died")
+
+
+def test_get_error_response():
+    assert get_error_response(HTTPStatus.SERVICE_UNAVAILABLE, {"Allow": "POST"}) == {
+        "body": '{"errorMessage": "Service Unavailable"}',
+        "statusCode": 503,
+        "headers": {"Content-Type": "application/json", "Allow": "POST"},
+    }
+
+
+def test_server_replaces_broken_executor(executor):
+    broken = BrokenExecutor(max_workers=1)
+    server = LocalServer(broken, max_concurrency=2, executor_factory=lambda: executor)
+    first = post({"buildString": "2*Die(6)", "fields": ["mean"]})
+    second = post({"buildString": "3*Die(6)", "fields": ["mean"]})
+    responses = asyncio.run(exchange(server, first, second))
+    assert [status for status, _, _ in responses] == [503, 200]
+    assert responses[0][1]["Connection"] == "keep-alive"
+    assert json.loads(responses[1][2]) == {"mean": 10.5}
+    assert server.executor is executor
+
+
+def test_server_broken_executor_without_factory():
+    with BrokenExecutor(max_workers=1) as broken:
+        server = LocalServer(broken, max_concurrency=2)
+        responses = asyncio.run(
+            exchange(
+                server, post({"buildString": "Die(6)"}), post({"buildString": "Die(4)"})
+            )
+        )
+    assert [status for status, _, _ in responses] == [503, 503]
+    assert server.executor is broken
+
+
+def test_server_process_pool_worker_dies():
+    factory = partial(ProcessPoolExecutor, max_workers=1)
+    server = LocalServer(factory(), max_concurrency=1, executor_factory=factory)
+    broken = server.executor
+    try:
+        with pytest.raises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result(10)
+        responses = asyncio.run(
+            exchange(server, post({"buildString": "Die(6)", "fields": ["mean"]}))
+        )
+        responses += asyncio.run(
+            exchange(server, post({"buildString": "Die(6)", "fields": ["mean"]}))
+        )
+    finally:
+        server.shutdown()
+    assert [status for status, _, _ in responses] == [503, 200]
+    assert server.executor is not broken
+
+
+def get_parallel_engine_workers():
+    from lambda_function import HANDLER
+
+    return HANDLER.engine.max_workers
+
+
+@pytest.mark.parametrize("workers", [1, 2, 1000])
+def test_get_parallel_workers(workers):
+    assert get_parallel_workers(workers) == max(1, available_cpus() // workers)
+
+
+def test_init_worker(monkeypatch):
+    engine = ParallelEngine(max_workers=8)
+    monkeypatch.setattr("server.HANDLER", DiceTablesRequestHandler(engine=engine))
+    monkeypatch.delenv("PARALLEL_WORKERS", raising=False)
+    init_worker(2)
+    assert engine.max_workers == 2
+
+
+def test_init_worker_keeps_parallel_workers(monkeypatch):
+    engine = ParallelEngine(max_workers=8)
+    monkeypatch.setattr("server.HANDLER", DiceTablesRequestHandler(engine=engine))
+    monkeypatch.setenv("PARALLEL_WORKERS", "8")
+    init_worker(2)
+    assert engine.max_workers == 8
+
+
+def test_init_worker_in_process_pool(monkeypatch):
+    monkeypatch.delenv("PARALLEL_WORKERS", raising=False)
+    with ProcessPoolExecutor(
+        max_workers=1, initializer=init_worker, initargs=(3,)
+    ) as executor:
+        assert executor.submit(get_parallel_engine_workers).result(10) == 3
+
+
+@pytest.mark.parametrize(
+    "body, headers, expected",
+    [
+        ('{"buildString": "Die(6)"}', {}, True),
+        ('{"buildString": "Die(6)", "fields": ["data"]}', {"Accept": "*/*"}, True),
+        ('{"buildString": "Die(6)"}', {"Accept": COLUMNAR_JSON}, False),
+        ('{"buildString": "Die(6)"}', {"Accept-Encoding": "gzip"}, False),
+        ('{"buildString": "Die(6)", "timings": true}', {}, False),
+        ('{"buildString": "Die(6)", "maxPoints": 5}', {}, False),
+        ('{"buildString": "Die(6)", "rolls": 10, "seed": 1}', {}, False),
+        ('{"buildStrings": ["Die(6)"]}', {}, False),
+        ('{"buildString": 6}', {}, False),
+        ('{"buildString": "Die(6)", "fields": 5}', {}, False),
+        ('{"buildString": "Die(6)", "fields": "data"}', {}, False),
+        ('{"buildString": "Die(6)", "fields": [5]}', {}, False),
+        ("not json", {}, False),
+        ("[1, 2]", {}, False),
+    ],
+)
+def test_is_streamed(body, headers, expected):
+    assert is_streamed({"body": body, "headers": headers}) is expected
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"buildString": "40*Die(100)"},
+        {"buildString": "40*Die(100)", "fields": ["data", "mean"]},
+        {"buildString": "2*Die(6)"},
+        {"buildString": "notadie(5)"},
+        {"buildString": "Die(6)", "fields": 5},
+        {"buildString": "Die(6)", "fields": [["data"]]},
+    ],
+)
+def test_stream_handler_matches_lambda_handler(body):
+    event = {"body": json.dumps(body), "isBase64Encoded": False}
+    expected = lambda_handler(event, None)
+    response, pieces = run_stream_handler(event)
+    assert response["statusCode"] == expected["statusCode"]
+    assert response["headers"] == expected["headers"]
+    assert response.get("body", "") + "".join(pieces) == expected["body"]
+
+
+def run_stream_handler(event):
+    """the response that stream_handler puts first, and the pieces of the body that follow it"""
+    chunks = queue.Queue()
+    stream_handler(event, chunks)
+    items = [chunks.get_nowait() for _ in range(chunks.qsize())]
+    if "body" in items[0]:
+        assert len(items) == 1
+        return items[0], []
+    assert items[-1] is None
+    return items[0], items[1:-1]
+
+
+def test_stream_handler_chunks():
+    # a table that is not in HANDLER's result cache, which would be sent in one piece
+    response, pieces = run_stream_handler({"body": '{"buildString": "41*Die(97)"}'})
+    assert response == {"statusCode": 200, "headers": {"Content-Type": JSON}}
+    assert len(pieces) > 1
+
+
+def test_stream_handler_gives_up_on_slow_client():
+    chunks = queue.Queue(2)
+    with patch("server.STREAM_TIMEOUT_SECONDS", 0.01):
+        with pytest.raises(queue.Full):
+            stream_handler({"body": '{"buildString": "37*Die(96)"}'}, chunks)
+    assert chunks.qsize() == 2
+
+
+def test_get_streamed():
+    async def get_all():
+        chunks = queue.Queue()
+        future = asyncio.get_event_loop().create_future()
+        chunks.put("a")
+        first = await get_streamed(chunks, future)
+        threading.Timer(0.15, chunks.put, ["b"]).start()
+        second = await get_streamed(chunks, future)
+        chunks.put("c")
+        future.set_result(None)
+        return [first, second, await get_streamed(chunks, future)]
+
+    assert asyncio.run(get_all()) == ["a", "b", "c"]
+
+
+def test_get_streamed_worker_stops():
+    async def get(error):
+        future = asyncio.get_event_loop().create_future()
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+        return await get_streamed(queue.Queue(), future)
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(get(BrokenProcessPool()))
+    with pytest.raises(RuntimeError):
+        asyncio.run(get(None))
+
+
+def test_to_http_head():
+    response = {"statusCode": 200, "headers": {"Content-Type": "application/json"}}
+    assert to_http_head(response, keep_alive=True) == (
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n"
+        b"Connection: keep-alive\r\n\r\n"
+    )
+    assert to_http_head(response, keep_alive=False, content_length=5) == (
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 5\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+
+
+def test_server_streams_big_response(executor):
+    cache = ResultCache()
+    server = LocalServer(
+        executor, max_concurrency=2, result_cache=cache, queue_factory=queue.Queue
+    )
+    request = post({"buildString": "39*Die(98)"})
+    first, second = asyncio.run(exchange(server, request, request))
+    event = {"body": '{"buildString": "39*Die(98)"}', "isBase64Encoded": False}
+    expected = lambda_handler(event, None)
+    for status, headers, body in (first, second):
+        assert status == 200
+        assert headers["Transfer-Encoding"] == "chunked"
+        assert "Content-Length" not in headers
+        assert body.decode() == expected["body"]
+    assert len(cache) == 0
+
+
+def test_server_caches_small_streamed_response(executor):
+    cache = ResultCache()
+    server = LocalServer(
+        executor, max_concurrency=2, result_cache=cache, queue_factory=queue.Queue
+    )
+    request = post({"buildString": "2*Die(6)", "fields": ["range"]})
+    with patch("server.stream_handler", wraps=stream_handler) as mock_handler:
+        first, second = asyncio.run(exchange(server, request, request))
+    assert mock_handler.call_count == 1
+    assert first == second
+    assert first[1]["Content-Length"] == str(len(first[2]))
+    assert json.loads(first[2]) == {"range": [2, 12]}
+    assert len(cache) == 1
+
+
+def test_server_streams_from_process_pool():
+    with Manager() as manager, ProcessPoolExecutor(max_workers=1) as executor:
+        server = LocalServer(executor, max_concurrency=1, queue_factory=manager.Queue)
+        request = post({"buildString": "38*Die(99)", "fields": ["data"]})
+        [(status, headers, body)] = asyncio.run(exchange(server, request))
+    assert status == 200
+    assert headers["Transfer-Encoding"] == "chunked"
+    assert len(json.loads(body)["data"]["x"]) == 38 * 98 + 1
+
+
+def test_server_stream_fails_part_way(executor):
+    def iter_response(input_str, fields=None):
+        yield '{"data": ['
+        yield "1, 2"
+        raise RuntimeError("oops")
+
+    async def get_bytes(server):
+        http_server = await server.start("127.0.0.1", 0)
+        port = http_server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(post({"buildString": "Die(6)"}))
+        answer = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        http_server.close()
+        await http_server.wait_closed()
+        return answer
+
+    server = LocalServer(executor, max_concurrency=2, queue_factory=queue.Queue)
+    with patch("server.HANDLER.iter_response", iter_response):
+        answer = asyncio.run(get_bytes(server))
+    assert answer.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert answer.endswith(b"4\r\n1, 2\r\n")
+
+
+def test_server_does_not_stream_without_queue_factory(executor):
+    server = LocalServer(executor, max_concurrency=2)
+    [(status, headers, body)] = asyncio.run(
+        exchange(server, post({"buildString": "40*Die(100)"}))
+    )
+    assert "Transfer-Encoding" not in headers
+    assert json.loads(body)["range"] == [40, 4000]
+
+
+def test_server_does_not_stream_to_http_1_0(executor):
+    server = LocalServer(executor, max_concurrency=2, queue_factory=queue.Queue)
+    request = post(
+        {"buildString": "40*Die(100)"}, {"Connection": "keep-alive"}, "HTTP/1.0"
+    )
+    [(status, headers, body)] = asyncio.run(exchange(server, request))
+    assert "Transfer-Encoding" not in headers
+    assert json.loads(body)["range"] == [40, 4000]
@@ -0,0 +1,64 @@
+from fractions import Fraction
+
+import pytest
+from dicetables import (
+    DiceRecord,
+    DiceTable,
+    Die,
+    ModDie,
+    Modifier,
+    WeightedDie,
+    Exploding,
+)
+
+from request_handler.dice_tables_tequest_handler import make_dict
+from request_handler.stats import STATS_FIELDS, get_die_stats, get_record_stats
+from tests.test_requesthandler import DICE_EXAMPLES
+
+
+def test_stats_fields():
+    assert STATS_FIELDS == ("range", "mean", "stddev")
+
+
+@pytest.mark.parametrize(
+    "die, expected",
+    [
+        (Die(6), (1, 6, Fraction(7, 2), Fraction(35, 12))),
+        (ModDie(4, -3), (-2, 1, Fraction(-1, 2), Fraction(5, 4))),
+        (Modifier(5), (5, 5, Fraction(5), Fraction(0))),
+        (WeightedDie({1: 1, 3: 3, 4: 0}), (1, 3, Fraction(5, 2), Fraction(3, 4))),
+    ],
+)
+def test_get_die_stats(die, expected):
+    assert get_die_stats(die) == expected
+
+
+def test_get_record_stats_empty():
+    assert get_record_stats(DiceRecord.new()) == {
+        "range": (0, 0),
+        "mean": 0.0,
+        "stddev": 0.0,
+    }
+
+
+@pytest.mark.parametrize("die", DICE_EXAMPLES)
+def test_get_record_stats_matches_make_dict(die):
+    record = DiceRecord({die: 3, Die(4): 2})
+    table = DiceTable.new().add_die(die, 3).add_die(Die(4), 2)
+    stats = get_record_stats(record)
+    expected = make_dict(table, STATS_FIELDS)
+    assert stats["range"] == expected["range"]
+    assert stats["mean"] == expected["mean"]
+    assert stats["stddev"] == pytest.approx(expected["stddev"], abs=0.0011)
+
+
+def test_get_record_stats_is_exact():
+    record = DiceRecord({Die(6): 10**6, Exploding(Die(6)): 3})
+    die_stats = get_die_stats(Exploding(Die(6)))
+    mean = Fraction(7, 2) * 10**6 + 3 * die_stats.mean
+    variance = Fraction(35, 12) * 10**6 + 3 * die_stats.variance
+    assert get_record_stats(record) == {
+        "range": (10**6 + 3, 6 * 10**6 + 3 * die_stats.high),
+        "mean": round(float(mean), 3),
+        "stddev": round(float(variance) ** 0.5, 3),
+    }
@@ -0,0 +1,130 @@
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+from dicetables import DiceRecord, DiceTable, Die, WeightedDie
+
+from request_handler.dice_tables_tequest_handler import DiceTablesRequestHandler
+from request_handler.result_cache import ResultCache, record_key
+from request_handler.table_store import (
+    TableStore,
+    table_version,
+    encode_events,
+    decode_events,
+    FILE_NAME,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    answer = TableStore(str(tmp_path / "store"))
+    yield answer
+    answer.close()
+
+
+def test_table_version_is_stable():
+    assert table_version() == table_version()
+    assert len(table_version()) == 16
+
+
+@pytest.mark.parametrize(
+    "events",
+    [{0: 1}, {-3: 2, -1: 5}, {1: 1, 2: 9**5000}, {5: 3, 6: 0x10, 9: 1}],
+)
+def test_encode_decode_events(events):
+    table = DiceTable(events, DiceRecord.new())
+    assert decode_events(encode_events(table)) == events
+
+
+def test_path_and_defaults(tmp_path):
+    store = TableStore(str(tmp_path))
+    assert store.path == str(tmp_path / FILE_NAME)
+    assert store.min_events == 0
+
+
+def test_get_missing(store):
+    assert store.get(DiceRecord.new().add_die(Die(6), 2)) is None
+
+
+def test_put_and_get(store):
+    table = DiceTable.new().add_die(Die(6), 2).add_die(WeightedDie({1: 2, 3: 4}), 3)
+    store.put(table)
+    record = DiceRecord.new().add_die(WeightedDie({1: 2, 3: 4}), 3).add_die(Die(6), 2)
+    assert store.get(record) == table
+
+
+def test_put_persists_between_stores(tmp_path):
+    table = DiceTable.new().add_die(Die(6), 2)
+    first = TableStore(str(tmp_path))
+    first.put(table)
+    first.close()
+    second = TableStore(str(tmp_path))
+    assert second.get(table.dice_data()) == table
+    second.close()
+
+
+def test_put_ignores_small_tables(tmp_path):
+    store = TableStore(str(tmp_path), min_events=11)
+    small = DiceTable.new().add_die(Die(6))
+    big = DiceTable.new().add_die(Die(6), 2)
+    store.put(small)
+    store.put(big)
+    assert store.get(small.dice_data()) is None
+    assert store.get(big.dice_data()) == big
+
+
+def test_get_ignores_other_versions(store):
+    table = DiceTable.new().add_die(Die(6), 2)
+    store.put(table)
+    connection = sqlite3.connect(store.path)
+    with connection:
+        connection.execute("UPDATE tables SET version = 'old'")
+    connection.close()
+    assert store.get(table.dice_data()) is None
+
+
+def test_broken_store_is_a_miss(tmp_path):
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    store = TableStore(str(not_a_dir))
+    table = DiceTable.new().add_die(Die(6), 2)
+    store.put(table)
+    assert store.get(table.dice_data()) is None
+
+
+def test_handler_reads_and_writes_store(store, monkeypatch):
+    handler = DiceTablesRequestHandler(table_store=store)
+    assert handler.table_store is store
+    first = handler.get_response("3*Die(4)")
+    record = DiceRecord.new().add_die(Die(4), 3)
+    assert store.get(record) == DiceTable.new().add_die(Die(4), 3)
+
+    def fail(*_):
+        raise AssertionError("should read from the store")
+
+    monkeypatch.setattr(
+        "request_handler.dice_tables_tequest_handler.construct_dice_table", fail
+    )
+    other_handler = DiceTablesRequestHandler(table_store=store)
+    assert other_handler.get_response("3*Die(4)") == first
+
+
+def test_handler_store_hit_fills_table_cache(store):
+    DiceTablesRequestHandler(table_store=store).get_response("3*Die(4)")
+    cache = ResultCache()
+    handler = DiceTablesRequestHandler(table_store=store, table_cache=cache)
+    handler.get_response("3*Die(4)")
+    assert cache.keys() == [record_key(DiceRecord.new().add_die(Die(4), 3))]
+
+
+def test_handler_default_no_store():
+    assert DiceTablesRequestHandler().table_store is None
+
+
+def test_handler_reads_table_cache_before_store(store):
+    cache = ResultCache()
+    handler = DiceTablesRequestHandler(table_store=store, table_cache=cache)
+    handler.get_response("3*Die(4)", ["mean"])
+    with patch.object(store, "get", side_effect=AssertionError("read the cache")):
+        assert handler.get_response("3*Die(4)", ["range"]) == {"range": (3, 12)}
+    assert cache.hits == 1
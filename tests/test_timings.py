@@ -0,0 +1,75 @@
+import tracemalloc
+
+import pytest
+
+from request_handler.timings import StageTimings
+
+
+def test_defaults():
+    timings = StageTimings()
+    assert not timings.trace_allocations
+    assert timings.to_dict() == {}
+
+
+def test_stage_records_time_and_count():
+    timings = StageTimings()
+    with timings.stage("first"):
+        sum(range(10000))
+    with timings.stage("second"):
+        pass
+    stages = timings.to_dict()
+    assert list(stages) == ["first", "second"]
+    assert stages["first"]["count"] == 1
+    assert stages["first"]["ms"] > 0
+    assert "allocatedBytes" not in stages["first"]
+
+
+def test_stage_adds_up_repeated_stages(monkeypatch):
+    clock = iter([1.0, 1.5, 2.0, 2.25])
+    monkeypatch.setattr("request_handler.timings.perf_counter", lambda: next(clock))
+    timings = StageTimings()
+    for _ in range(2):
+        with timings.stage("parse"):
+            pass
+    assert timings.to_dict() == {"parse": {"ms": 750.0, "count": 2}}
+
+
+def test_stage_records_when_block_raises():
+    timings = StageTimings()
+    with pytest.raises(ValueError):
+        with timings.stage("parse"):
+            raise ValueError("bad")
+    assert timings.to_dict()["parse"]["count"] == 1
+
+
+def test_stage_trace_allocations():
+    timings = StageTimings(trace_allocations=True)
+    assert not tracemalloc.is_tracing()
+    with timings.stage("small"):
+        small = [0] * 10
+    with timings.stage("big"):
+        big = [0] * 100000
+    assert not tracemalloc.is_tracing()
+    stages = timings.to_dict()
+    assert stages["big"]["allocatedBytes"] >= 800000
+    assert stages["small"]["allocatedBytes"] < stages["big"]["allocatedBytes"]
+    assert len(small) + len(big)
+
+
+def test_stage_trace_allocations_leaves_tracing_running():
+    tracemalloc.start()
+    try:
+        with StageTimings(trace_allocations=True).stage("stage"):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_to_dict_rounds_ms(monkeypatch):
+    clock = iter([0.0, 0.0012345678])
+    monkeypatch.setattr("request_handler.timings.perf_counter", lambda: next(clock))
+    timings = StageTimings()
+    with timings.stage("parse"):
+        pass
+    assert timings.to_dict() == {"parse": {"ms": 1.235, "count": 1}}